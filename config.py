@@ -19,10 +19,15 @@ HA_TOKEN = os.getenv("HA_TOKEN")
 HA_URL = os.getenv("HA_URL")
 MODEL_NAME = os.getenv("GEMINI_MODEL")
 
-def get_gemini_url():
-    current_key = next(_key_cycle)
+def get_gemini_url(key=None):
+    current_key = key or next(_key_cycle)
     return f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={current_key}"
 
+def get_gemini_stream_url(key=None):
+    """Wie get_gemini_url, aber streamGenerateContent als Server-Sent Events."""
+    current_key = key or next(_key_cycle)
+    return f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:streamGenerateContent?alt=sse&key={current_key}"
+
 def get_next_key():
     return next(_key_cycle)
 
@@ -34,6 +39,84 @@ RATE = 16000
 CHANNELS = 1
 CHUNK_SIZE = 512
 VOLUME_STEP = 7 # Volume adjustment step in percentage points
+AUDIO_RING_FRAMES = 128 # Shared-Memory Ring zwischen audio_worker und Main (128 x 32 ms = ~4 s)
+PREROLL_SECONDS = 3.0 # So viel Audio nach dem Wake Word wird beim Verbinden der Live Session nachgereicht
+LIVE_PACKET_MS = 40 # Uplink-Paketdauer für send_realtime_input (feste Größe, auch der Pre-Roll)
+PLAYBACK_CHUNK_MS = 40 # Live-Wiedergabe: Stückgröße pro Gerät-Write
+PLAYBACK_PREFILL_MS = 120 # Jitter-Puffer: so viel Audio muss da sein, bevor eine Antwort startet
+PLAYBACK_MAX_SECONDS = 60 # Obergrenze des Wiedergabe-Puffers
+MIXER_BLOCK_MS = 20 # OutputMixer: Blockgröße pro Gerät-Write (ein Ausgabe-Stream für SFX, TTS und Live)
+MIXER_DUCK_GAIN = 0.3 # Pegel leiserer Prioritäten, solange eine höhere spielt (z.B. Thinking-Loop unter Sprache)
+MIXER_DUCK_MS = 80 # Rampe für Ducking
+
+# Native Capture: Mikrofon mit eigener Rate/Kanalzahl öffnen, Mischen + Dezimieren (FIR, 3:1) im audio_worker
+# statt im ALSA plug/route Pfad (jarvis_mic). Braucht ein PCM ohne Resampling, z.B. ps3eye_native aus .asoundrc.
+CAPTURE_NATIVE = os.getenv("CAPTURE_NATIVE", "0") == "1"
+CAPTURE_DEVICE = os.getenv("CAPTURE_DEVICE", "ps3eye_native")
+CAPTURE_DEVICE_RATE = 48000 # Muss ein ganzzahliges Vielfaches von RATE sein
+CAPTURE_DEVICE_CHANNELS = 4 # PS3 Eye: 4 Mikrofone, werden gleich gewichtet gemischt
+
+# Record & Replay: Capture-Frames + Zeitstempel in <pfad>.pcm/.ts mitschreiben bzw. statt
+# des Mikrofons eine Aufnahme abspielen (speed 1.0 = Echtzeit, 0 = so schnell wie möglich)
+AUDIO_RECORD_PATH = os.getenv("AUDIO_RECORD_PATH")
+AUDIO_RECORD_MAX_SECONDS = 600
+AUDIO_REPLAY_PATH = os.getenv("AUDIO_REPLAY_PATH")
+AUDIO_REPLAY_SPEED = float(os.getenv("AUDIO_REPLAY_SPEED", "1.0"))
+AUDIO_REPLAY_LOOP = os.getenv("AUDIO_REPLAY_LOOP", "0") == "1"
+
+# --- VAD (Gate vor dem Live API Uplink) ---
+VAD_ENGINE = os.getenv("VAD_ENGINE", "energy") # "energy", "cobra" (pvcobra, braucht PICOVOICE_KEY) oder "off"
+VAD_HANGOVER_MS = 800 # Gate bleibt nach der letzten Sprache noch so lange offen
+VAD_PREPAD_MS = 300 # So viel Audio vor Sprachbeginn wird mitgeschickt
+VAD_ENERGY_RATIO = 3.0 # Sprache = RMS liegt um diesen Faktor über dem Rauschteppich
+VAD_MIN_RMS = 300 # Absolute Untergrenze für Sprache (16 bit RMS)
+VAD_COBRA_THRESHOLD = 0.5 # Voice Probability ab der Cobra Sprache meldet
+
+# Manual Activity: Sprachende wird lokal erkannt und per activity_start/activity_end an Live gemeldet,
+# statt auf die Turn-Erkennung des Servers zu warten. EOS_SILENCE_MS = Stille bis "Sprachende".
+LIVE_MANUAL_ACTIVITY = os.getenv("LIVE_MANUAL_ACTIVITY", "0") == "1"
+EOS_SILENCE_MS = 700
+LIVE_WARM_CONNECTION = os.getenv("LIVE_WARM_CONNECTION", "1") == "1" # Nächste Live Session vorab verbinden (kein Handshake nach dem Wake Word)
+LIVE_WARM_MAX_AGE = 480 # Sekunden, danach wird die ungenutzte Verbindung neu aufgebaut (Server-Limit ~10 min)
+CORE_MEMORY_REFRESH = 300 # Sekunden zwischen Hintergrund-Refreshes der Core Memory im Fast Brain Prompt (Schreibzugriffe sofort)
+LIVE_SESSION_RESUMPTION = os.getenv("LIVE_SESSION_RESUMPTION", "1") == "1" # Folge-Wakes setzen die letzte Live Session fort (Kontext inkl. Tool Calls bleibt)
+LIVE_RESUME_WINDOW = 900 # Sekunden nach der letzten Aktivität, in denen fortgesetzt wird (wie das History-Fenster)
+FAST_TOOL_TIMEOUT = 8.0 # Sekunden pro Fast Brain Tool Call, danach bekommt das Modell eine Fehlermeldung
+FAST_TOOL_WORKERS = 4 # Threads für parallele Fast Brain Tool Calls
+SLOW_TOOL_TIMEOUT = 45.0 # Sekunden pro Slow Brain Tool Call (einzelne Tools: TOOL_TIMEOUTS in core/tools.py)
+SLOW_TOOL_WORKERS = 4 # Threads für parallele Tool Calls eines Agentic Steps
+SLOW_BRAIN_STREAMING = os.getenv("SLOW_BRAIN_STREAMING", "1") == "1" # Text Mode: Antwort streamen und fertige Sätze sofort sprechen
+STREAM_TTS_MIN_CHARS = 25 # Kürzere Sätze werden mit dem nächsten zusammen synthetisiert
+ENTITY_TOP_K = 25 # Slow Brain: so viele zur Anfrage passende Geräte kommen mit Status/Attributen in den Prompt
+ENTITY_PINNED = [e.strip() for e in os.getenv("ENTITY_PINNED", "").split(",") if e.strip()] # Entity IDs, die immer im Prompt stehen
+ENTITY_EMBEDDINGS = os.getenv("ENTITY_EMBEDDINGS", "0") == "1" # Zusätzlich semantische Suche (gemini-embedding-001, Vektoren gecacht)
+ENTITY_AREA_REFRESH = 3600 # Sekunden zwischen Abfragen der HA Bereiche (Räume) für den Geräte-Index
+HISTORY_TOKEN_BUDGET = 6000 # Geschätzte Tokens der Slow-Brain History, darüber fallen die ältesten Interaktionen heraus
+PREFETCH_TTL = 30 # Sekunden, die vorab geladener Slow-Brain Kontext (Core Memory, Orte, Gewohnheiten) gültig bleibt
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "1") == "1" # Slow Brain: System Prompt + Tools als cachedContent, pro Request nur der dynamische Kontext
+CONTEXT_CACHE_TTL = 3600 # Sekunden Lebensdauer eines Caches (Speicher kostet pro Stunde)
+CONTEXT_CACHE_REFRESH = 600 # Läuft der Cache in weniger Sekunden ab, wird die TTL im Hintergrund verlängert
+CONTEXT_CACHE_RETRY = 600 # Sekunden inline senden, nachdem das Anlegen fehlgeschlagen ist
+LED_LEVEL_METER = False # Blaue LED folgt beim Zuhören dem Mikrofon-Pegel
+AUDIO_LEVEL_INTERVAL = 0.5 # Sekunden zwischen Pegel-Events des audio_worker (dient auch als Lebenszeichen)
+# Mic-Überwachung: Heartbeat im Ring statt Queue-Timeout, Hot Standby Worker für schnelles Umschalten
+MIC_HOT_STANDBY = os.getenv("MIC_HOT_STANDBY", "1") == "1"
+MIC_STALL_TIMEOUT = 1.5 # Sekunden ohne erfolgreichen Read -> Heartbeat verpasst (GC/SD-Karte blockieren auf dem Pi Zero auch mal 300 ms)
+MIC_STALL_CHECKS = 3 # So viele Prüfungen (alle 100 ms) in Folge ohne Heartbeat, bevor der Worker gekillt wird
+MIC_START_TIMEOUT = 10.0 # Kaltstart (Porcupine Init + Gerät öffnen) bis zum ersten Frame, beim ersten Mal inkl. Forkserver
+MIC_STANDBY_START_TIMEOUT = 2.0 # Hot Standby: start_stream() bis zum ersten Frame
+MIC_START_METHOD = os.getenv("MIC_START_METHOD", "forkserver") # forkserver/spawn: kein fork() aus dem Thread eines Multi-Thread-Prozesses
+MIC_STALL_FRAMES = 4 # Ein Read, der länger als so viele Frames blockiert, zählt als Stall
+MIC_MAX_FAILOVERS = 5 # Mehr Ausfälle innerhalb MIC_FAILOVER_WINDOW -> Service Neustart
+MIC_FAILOVER_WINDOW = 60
+LATENCY_REPORT_INTERVAL = 60 # Sekunden zwischen [Latency] Zusammenfassungen (Frame-Alter p50/p95/p99, Lücken)
+
+# --- ECHO CANCELLER (ersetzt das Mic-Ducking während der Wiedergabe) ---
+AEC_ENABLED = os.getenv("AEC_ENABLED", "1") == "1" # "0" = altes Ducking auf 10%
+AEC_DELAY_MS = 0 # Zusätzliche feste Verzögerung Lautsprecher -> Mikro (zur PortAudio Ausgabe-Latenz)
+AEC_BLOCK = 256 # Blocklänge in Samples (16 ms)
+AEC_PARTITIONS = 8 # Filterlänge = AEC_BLOCK * AEC_PARTITIONS (128 ms)
+AEC_STEP = 0.5 # NLMS Schrittweite (0..1)
 
 # --- VISUALS ---
 DIM_BLUE = Color.blend(Color.BLUE, Color.BLACK, 0.2)
@@ -74,6 +157,14 @@ EPISODIC_FILE = os.path.join(MEMORY_DIR, "episodic.md") # The "Daily Log"
 VECTOR_DB_FILE = os.path.join(MEMORY_DIR, "vectors.json") # Raw Text for search
 VECTOR_NPY_FILE = os.path.join(MEMORY_DIR, "vectors.npy") # Embeddings for search
 MEM0_DB_DIR = os.path.join(MEMORY_DIR, "mem0_db")       # Mem0 Vector Storage
+ENTITY_EMBED_FILE = os.path.join(MEMORY_DIR, "entity_embeddings.npz") # Embedding-Cache des Geräte-Index (nach Text-Hash)
+CONTEXT_CACHE_FILE = os.path.join(MEMORY_DIR, "context_cache.json") # Registry: Hash des statischen Prompts -> cachedContents/...
+
+#  --- TRACING ---
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1" # Spans pro Interaktion (Wake, Live, Tools, Slow Brain, HTTP) als JSONL
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(MEMORY_DIR, "traces.jsonl")) # Auswertung: python -m jarvis.core.trace
+TRACE_MAX_BYTES = 2 * 1024 * 1024 # Danach wird rotiert
+TRACE_BACKUPS = 3 # Anzahl alter Trace-Dateien (.1, .2, ...)
 
 if not os.path.exists(MEMORY_DIR):
     os.makedirs(MEMORY_DIR)
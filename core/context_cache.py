@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from jarvis import config
+from jarvis.utils import session
+
+API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+def _fingerprint(key):
+    # Die Registry liegt auf der SD-Karte: nur ein Hash des API Keys, nie der Key selbst
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+class ContextCache:
+    """
+    Explizites Context Caching (cachedContents) für den statischen Teil des Slow-Brain
+    Requests: System Prompt + Tool-Deklarationen. Pro Request gehen dann nur noch der
+    dynamische Kontext und die History über die Leitung, bei bis zu 10 Agentic Steps.
+
+    Ein Cache gehört zum Projekt des API Keys. Die lokale Registry (CONTEXT_CACHE_FILE)
+    merkt sich pro Key den Hash des statischen Teils, den Cache-Namen und das Ablaufdatum:
+    - gleicher Hash, noch gültig -> wiederverwenden (auch nach einem Neustart)
+    - läuft in weniger als CONTEXT_CACHE_REFRESH ab -> TTL im Hintergrund verlängern
+    - anderer Hash (z.B. MCP Tools geladen) oder abgelaufen -> neu anlegen, alten löschen
+    Schlägt das Anlegen fehl (z.B. Prompt unter dem Minimum des Modells), wird für
+    CONTEXT_CACHE_RETRY Sekunden inline gesendet. Während ein Key gerade angelegt wird
+    (HTTP außerhalb des Locks), senden andere Requests mit diesem Key inline.
+    """
+    def __init__(self, path=None, ttl=None, refresh=None, enabled=None):
+        self.path = config.CONTEXT_CACHE_FILE if path is None else path
+        self.ttl = config.CONTEXT_CACHE_TTL if ttl is None else ttl
+        self.refresh = config.CONTEXT_CACHE_REFRESH if refresh is None else refresh
+        self.enabled = config.CONTEXT_CACHE_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._entries = self._load()   # fingerprint -> {"hash", "name", "expire", "tokens"}
+        self._failed = {}              # fingerprint -> time.time() des letzten Fehlschlags
+        self._refreshing = set()
+        self._creating = set()
+
+    # --- REGISTRY ---
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {fp: e for fp, e in entries.items() if e.get("expire", 0) > now}
+
+    def _save(self):
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f" [Cache] Registry write failed: {e}", flush=True)
+
+    # --- API ---
+    def lookup(self, key, static):
+        """
+        Name des cachedContents für `static` ({"systemInstruction", "tools"}) unter `key`,
+        legt ihn bei Bedarf an. None -> statischen Teil inline senden.
+        """
+        if not self.enabled:
+            return None
+        fp = _fingerprint(key)
+        digest = hashlib.sha256(json.dumps([config.MODEL_NAME, static], sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(fp)
+            if entry and entry["hash"] == digest and entry["expire"] - now > 30:
+                if entry["expire"] - now < self.refresh and fp not in self._refreshing:
+                    self._refreshing.add(fp)
+                    threading.Thread(target=self._extend, args=(key, fp, entry), daemon=True).start()
+                return entry["name"]
+            if now - self._failed.get(fp, 0) < config.CONTEXT_CACHE_RETRY or fp in self._creating:
+                return None
+            self._creating.add(fp)
+        try:
+            new = self._create(key, static, digest)
+        finally:
+            with self._lock:
+                self._creating.discard(fp)
+        with self._lock:
+            if new is None:
+                self._failed[fp] = time.time()
+                return None
+            self._entries[fp] = new
+            self._save()
+        if entry and entry["name"] != new["name"]:
+            threading.Thread(target=self._delete, args=(key, entry["name"]), daemon=True).start()
+        return new["name"]
+
+    def invalidate(self, key, name):
+        """Server kennt den Cache nicht (mehr) -> Eintrag verwerfen, der nächste Request legt neu an."""
+        fp = _fingerprint(key)
+        with self._lock:
+            if self._entries.get(fp, {}).get("name") == name:
+                del self._entries[fp]
+                self._save()
+
+    # --- REST ---
+    def _create(self, key, static, digest):
+        t0 = time.monotonic()
+        body = {
+            "model": f"models/{config.MODEL_NAME}",
+            "displayName": f"jarvis-slow-brain-{digest[:8]}",
+            "ttl": f"{self.ttl}s",
+            **static,
+        }
+        try:
+            resp = session.post(f"{API_BASE}/cachedContents?key={key}", json=body, timeout=20)
+            if resp.status_code != 200:
+                print(f" [Cache] Create failed ({resp.status_code}), sende inline: {resp.text[:200]}", flush=True)
+                return None
+            result = resp.json()
+        except Exception as e:
+            print(f" [Cache] Create failed, sende inline: {e}", flush=True)
+            return None
+        tokens = result.get("usageMetadata", {}).get("totalTokenCount", 0)
+        print(f" [Cache] {result['name']} angelegt ({tokens} Tokens, TTL {self.ttl}s, "
+              f"{(time.monotonic() - t0) * 1000:.0f} ms)", flush=True)
+        return {"hash": digest, "name": result["name"], "expire": time.time() + self.ttl, "tokens": tokens}
+
+    def _extend(self, key, fp, entry):
+        try:
+            resp = session.patch(f"{API_BASE}/{entry['name']}?updateMask=ttl&key={key}",
+                                 json={"ttl": f"{self.ttl}s"}, timeout=10)
+            if resp.status_code == 200:
+                with self._lock:
+                    if self._entries.get(fp) is entry:
+                        entry["expire"] = time.time() + self.ttl
+                        self._save()
+                print(f" [Cache] {entry['name']} verlängert (TTL {self.ttl}s)", flush=True)
+            else:
+                print(f" [Cache] Refresh failed ({resp.status_code}): {resp.text[:200]}", flush=True)
+        except Exception as e:
+            print(f" [Cache] Refresh failed: {e}", flush=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(fp)
+
+    def _delete(self, key, name):
+        # Best effort: ein vergessener Cache läuft spätestens nach seiner TTL ab
+        try:
+            session.delete(f"{API_BASE}/{name}?key={key}", timeout=10)
+            print(f" [Cache] {name} gelöscht (Prompt/Tools geändert)", flush=True)
+        except Exception as e:
+            print(f" [Cache] Delete failed: {e}", flush=True)
+
+context_cache = ContextCache()
@@ -0,0 +1,132 @@
+import json
+import threading
+from collections import deque
+
+from jarvis import config
+
+# Grobe Schätzung ohne Tokenizer: ~4 Zeichen pro Token, Audio ~32 Tokens pro Sekunde (16 kHz WAV)
+CHARS_PER_TOKEN = 4
+AUDIO_BYTES_PER_TOKEN = 1000
+
+def estimate_tokens(turn):
+    tokens = 0
+    for p in turn.get("parts", []):
+        if "text" in p:
+            tokens += len(p["text"]) // CHARS_PER_TOKEN
+        elif "inline_data" in p:
+            # base64: 4 Zeichen = 3 Bytes
+            tokens += len(p["inline_data"].get("data", "")) * 3 // 4 // AUDIO_BYTES_PER_TOKEN
+        else:
+            # functionCall / functionResponse
+            tokens += len(json.dumps(p, ensure_ascii=False, default=str)) // CHARS_PER_TOKEN
+    return tokens + 1
+
+def flatten(turn):
+    """
+    Abgeflachte Form eines alten Turns (User -> Call -> Result -> Text wird zu User -> Text).
+    None: Turn fällt ganz weg.
+    """
+    role = turn.get("role")
+    parts = turn.get("parts", [])
+    # A. FUNCTION Responses (Ergebnisse) komplett löschen
+    if role == "function":
+        return None
+    text_parts = [p for p in parts if "text" in p]
+    # B. MODEL: nur Text behalten, reine FunctionCall-Turns fallen weg
+    if role == "model":
+        if not text_parts:
+            return None
+        return turn if len(text_parts) == len(parts) else {"role": "model", "parts": text_parts}
+    # C. USER: Audio entfernen (API mag keine leeren User Turns -> Platzhalter)
+    if not text_parts:
+        text_parts = [{"text": "[Audio Input]"}]
+    return turn if len(text_parts) == len(parts) else {"role": "user", "parts": text_parts}
+
+class HistoryStore:
+    """
+    Die eine Gesprächs-History (state.CONVERSATION_HISTORY) für Slow Brain und Fast Brain.
+
+    Verhält sich beim Lesen wie die bisherige deque (Iteration, len, [-1]), append() ist
+    O(1) und merkt sich eine grobe Token-Schätzung pro Turn.
+
+    compact() arbeitet in place statt die History neu zu bauen:
+    - Turns vor den letzten `keep_raw` werden einmalig abgeflacht (Tool Calls/Ergebnisse
+      und Audio raus), bereits abgeflachte werden nicht noch einmal angefasst.
+    - Solange die Schätzung über HISTORY_TOKEN_BUDGET liegt, fällt die älteste
+      Interaktion (bis zum nächsten User-Turn) heraus.
+    Die History beginnt immer mit einem User-Turn.
+
+    `lock` ist reentrant: mehrere append() unter `with state.HISTORY_LOCK` bleiben zusammen.
+    """
+    def __init__(self, budget=None, keep_raw=4):
+        self.budget = config.HISTORY_TOKEN_BUDGET if budget is None else budget
+        self.keep_raw = keep_raw
+        self.lock = threading.RLock()
+        self._turns = deque()    # (turn, tokens)
+        self._flat = 0           # so viele Turns am Anfang sind schon abgeflacht
+        self.tokens = 0
+        self.dropped = 0
+
+    # --- READ (wie deque) ---
+    def __len__(self):
+        return len(self._turns)
+
+    def __bool__(self):
+        return bool(self._turns)
+
+    def __iter__(self):
+        with self.lock:
+            turns = [turn for turn, _ in self._turns]
+        return iter(turns)
+
+    def __getitem__(self, index):
+        return self._turns[index][0]
+
+    # --- WRITE ---
+    def append(self, turn):
+        tokens = estimate_tokens(turn)
+        with self.lock:
+            self._turns.append((turn, tokens))
+            self.tokens += tokens
+
+    def clear(self):
+        with self.lock:
+            self._turns.clear()
+            self._flat = 0
+            self.tokens = 0
+
+    def _popleft(self):
+        _, tokens = self._turns.popleft()
+        self.tokens -= tokens
+        self._flat = max(0, self._flat - 1)
+        self.dropped += 1
+
+    def compact(self):
+        with self.lock:
+            # 1. Alte Turns abflachen (nur die seit dem letzten compact() dazugekommenen)
+            i = self._flat
+            end = len(self._turns) - self.keep_raw
+            while i < end:
+                turn, tokens = self._turns[i]
+                flat = flatten(turn)
+                if flat is None:
+                    del self._turns[i]
+                    self.tokens -= tokens
+                    end -= 1
+                    continue
+                if flat is not turn:
+                    flat_tokens = estimate_tokens(flat)
+                    self._turns[i] = (flat, flat_tokens)
+                    self.tokens += flat_tokens - tokens
+                i += 1
+            self._flat = i
+
+            # 2. Token-Budget: älteste Interaktionen entfernen (die letzten keep_raw Turns bleiben)
+            while self.tokens > self.budget and len(self._turns) > self.keep_raw:
+                self._popleft()
+                while len(self._turns) > self.keep_raw and self._turns[0][0].get("role") != "user":
+                    self._popleft()
+
+            # Sicherstellen, dass der erste Eintrag ein User ist (Gemini mag Start mit Model nicht)
+            while self._turns and self._turns[0][0].get("role") != "user":
+                self._popleft()
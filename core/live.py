@@ -1,9 +1,9 @@
 import asyncio
-import queue
-import pyaudio
 import traceback
 import base64
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from google import genai
 from google.genai import types
 
@@ -11,14 +11,44 @@ from jarvis import config, state
 from jarvis.core import llm
 from jarvis.services import memory
 from aiy.leds import Color, Pattern
-from jarvis.core.tools import execute_tool, FUNCTION_DECLARATIONS
+from jarvis.core.tools import execute_tool, FUNCTION_DECLARATIONS, PARALLEL_TOOLS, timeout_result, skipped_result
 from jarvis.services import sfx
+from jarvis.services import vad, aec
+from jarvis.services.audio_features import AudioFeatures, scale_pcm, level_to_brightness
+from jarvis.services.latency import LatencyStats
+from jarvis.services.audio_ring import AsyncFrameSource
+from jarvis.services.packetizer import Packetizer
+from jarvis.services.playback import PlaybackEngine
+from jarvis.services.mixer import mixer, PRIORITY_SPEECH
+from jarvis.core.live_pool import LiveConnectionManager
+from jarvis.core.prompt import assembler as prompt_assembler, HISTORY_WINDOW_SECONDS
+from jarvis.core.prefetch import prefetcher
+from jarvis.core import trace
 
 # Rough pricing for Gemini 2.5 Flash Live (Fast Brain), as of Feb 2026 (USD)
 # Uses the same token pricing as standard Gemini 2.5 Flash.
 LIVE_PRICE_PER_M_INPUT = 0.30
 LIVE_PRICE_PER_M_OUTPUT = 2.50
 
+LIVE_MODEL = "gemini-2.5-flash-native-audio-preview-12-2025"
+
+# WebSocket close codes the server uses to reject a session (invalid payload / policy, e.g. unknown or expired handle)
+RESUME_REJECT_CLOSE_CODES = (1007, 1008)
+
+def resume_rejected(error):
+    """
+    True if the server rejected the session or its resumption handle (close code or handle error).
+    Transport failures (DNS, timeout, socket) say nothing about the handle and return False.
+    """
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return False
+    # websockets: ConnectionClosed(.rcvd.code); google-genai: APIError(.code)
+    code = getattr(getattr(error, "rcvd", None), "code", None) or getattr(error, "code", None)
+    if code in RESUME_REJECT_CLOSE_CODES:
+        return True
+    text = str(error).lower()
+    return any(word in text for word in ("handle", "resum", "session not found", "invalid session"))
+
 # --- 1. The Tool Declaration (Fast Brain) ---
 # We reuse the declarations from llm.py for simple local tools
 FAST_TOOLS = [
@@ -80,94 +110,11 @@ def build_live_api_tools():
 
 live_api_tools = build_live_api_tools()
 
-def get_dynamic_system_instruction(time_since_last_activity):
-    # Load Core Memory & Routines from Mem0 via memory service
-    core_content = ""
-    try:
-        from jarvis.services import memory
-        # get_hybrid_context now returns precisely the formatted paul_core strings
-        core_content = memory.get_hybrid_context(None)
-    except Exception as e:
-        print(f" [Fast Brain] Could not load Core Memory from Mem0: {e}")
-
-    if getattr(state, 'HA_CONTEXT', None):
-        device_lines = []
-        for dev in state.HA_CONTEXT:
-            info = f"- {dev['name']} [ID: {dev['entity_id']}] ({dev['state']})"
-            device_lines.append(info)
-        device_list_str = "\n".join(device_lines)
-    elif state.AVAILABLE_LIGHTS:
-        lines = []
-        for name, eid in state.AVAILABLE_LIGHTS.items():
-            lines.append(f"- {name} [ID: {eid}]")
-        device_list_str = "\n".join(lines)
-    else:
-        device_list_str = "Keine Geräte gefunden."
-
-    text = f'''Du bist Jarvis, das superschnelle Fast Brain des Smart Homes.
-Antworte immer in der Sprache des Nutzers (meistens Deutsch). Antworte als Peer, kurz und prägnant.
-
-=== CORE MEMORY (DEIN WISSEN ÜBER DEN USER) ===
-{core_content}
-
-=== VERFÜGBARE GERÄTE (STATE) ===
-{device_list_str}
-'''
-
-    # --- Fast Brain Short-Term Memory Injection ---
-    # We only inject history if the last interaction was within 15 minutes.
-    if time_since_last_activity <= 900 and getattr(state, 'CONVERSATION_HISTORY', None):
-        history_lines = []
-        # Take the last 6 turns (approx 3 user/assistant pairs) to avoid huge prompts
-        import itertools
-        # Safely slice the deque
-        recent_history = list(itertools.islice(state.CONVERSATION_HISTORY, max(0, len(state.CONVERSATION_HISTORY) - 6), len(state.CONVERSATION_HISTORY)))
-        for turn in recent_history:
-            role = "Jarvis" if turn.get("role") == "model" else "Paul"
-            # Attempt to extract text content, fallback to str representation
-            parts = turn.get("parts", [])
-            if isinstance(parts, list) and len(parts) > 0:
-                try:
-                    content = parts[0].get("text", str(parts[0]))
-                except AttributeError:
-                     content = str(parts[0])
-            else:
-                 content = str(parts)
-            history_lines.append(f"{role}: {content}")
-            
-        if history_lines:
-            text += "\n=== RECENT CONVERSATION (LETZTE 15 MIN) ===\n"
-            text += "(Beziehe dich darauf, falls der User etwas aus dem direkten Kontext fragt)\n"
-            text += "\n".join(history_lines) + "\n"
-
-    text += '''
-=== CRITICAL RULES (FAST BRAIN VS SLOW BRAIN) ===
-Du bist für EINFACHE, SOFORTIGE Aktionen zuständig.
-1. FAST BRAIN AUFGABEN:
-   - Geräte schalten (control_device, control_media) MUSS mit entity_id aufgerufen werden!
-   - Wettervorhersage abrufen (get_weather_forecast)
-   - Termine lesen (get_calendar_events)
-   - Timer/Wecker setzen (manage_timer_alarm)
-   - Erinnerungen speichern (save_memory)
-   - Erinnerungen suchen (retrieve_memory) - WICHTIG: Nutze dies, wenn der User nach Dingen fragt, die in der Vergangenheit liegen!
-2. SLOW BRAIN (DELEGATE):
-   - Wenn eine Aufgabe MEHRERE SCHRITTE erfordert (z.B. "Recherchiere X und fasse zusammen", oder "Starte meine Gute Nacht Routine").
-   - Wenn Python-Code ausgeführt werden muss (Berechnungen, Deep Web-Scraping).
-   - In diesen Fällen rufst du ZWINGEND "delegate_to_backend" auf. Versuche NIEMALS komplexe Routinen selbst auszuführen!
-3. KOMMUNIKATION:
-   - Nach erfolgreichem Toolaufruf antworte ultrakurz (z.B. "Ok", "Erledigt", "Licht ist an").
-   - Wenn "delegate_to_backend" antwortet, lies die exakte Antwort flüssig vor, füge KEINE Floskeln hinzu.
-   - Nutze das Tool "end_conversation", wenn die Konversation beendet werden soll, z.B. wenn der User "Danke.", "Stop!", "Das wars." sagt.
-
-    return types.Content(role="system", parts=[types.Part.from_text(text=text)])
-
 class JarvisHybridRouter:
-    def __init__(self, leds, audio_queue):
+    def __init__(self, leds, audio_ring):
         self.leds = leds
-        self.audio_queue = audio_queue
+        self.audio_ring = audio_ring
         self._active_backend_task = None
-        self.is_playing_audio = False
-        self.last_audio_end_time = 0.0
         # Tracks the last time there was any interaction on the Live websocket
         # (user audio sent OR model/tool response received). Used for idle timeout.
         self.last_activity_time = time.time()
@@ -181,31 +128,106 @@ class JarvisHybridRouter:
         # config.GEMINI_KEYS is a list of keys, we use the first one for the Live API
         api_key = config.GEMINI_KEYS[0] if hasattr(config, 'GEMINI_KEYS') and config.GEMINI_KEYS else None
         self.client = genai.Client(http_options={"api_version": "v1alpha"}, api_key=api_key) 
+        # Keeps the next Live connection open in the background (own event loop, see live_pool)
+        self.live_pool = LiveConnectionManager(self.client, LIVE_MODEL, self._warm_live_config,
+                                               enabled=config.LIVE_WARM_CONNECTION,
+                                               on_connect_error=self._on_warm_connect_error)
+        # Wake word (capture) -> session ready to listen
+        self.listen_latency = LatencyStats("wake -> listening")
+        # Live session resumption: newest handle of the previous session, and first-turn input tokens
+        # of recent cold sessions as the baseline for what a resumed session saves
+        self._resume_handle = None
+        self._resumed = False
+        self._first_turn_input_tokens = None
+        self._cold_first_turn_tokens = deque(maxlen=20)
+        # System instruction sections (core memory refreshes in the background).
+        # New core memory -> rebuild the warm connection instead of carrying the old instruction.
+        prompt_assembler.on_core_change(self.live_pool.invalidate)
+        prompt_assembler.start()
         
-        # Audio output stream (Gemini Live API TTS outputs 24kHz PCM by default)
-        self.pa = pyaudio.PyAudio()
-        self.out_stream = self.pa.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=24000,
-            output=True
+        # Audio output: a persistent voice in the shared OutputMixer (Gemini Live API outputs 24kHz PCM).
+        # Small voice buffer so the playback thread keeps pacing and flush() stays instant.
+        self.out_voice = mixer.open_voice("live", priority=PRIORITY_SPEECH,
+                                          max_buffer_ms=config.MIXER_BLOCK_MS, persistent=True)
+        out_latency = self.out_voice.get_output_latency()
+        # Echo canceller: the mixed output (Live audio plus SFX/TTS) is the reference, pushed by the mixer
+        # right before each device write. The filter (echo path) persists across sessions.
+        self.echo_ref = aec.EchoReference(rate=config.RATE, delay=mixer.output_latency() + config.AEC_DELAY_MS / 1000)
+        mixer.reference = self.echo_ref
+        self.aec = aec.create_canceller(self.echo_ref)
+        # Playback thread with jitter buffer in front of the mixer voice
+        self.playback = PlaybackEngine(
+            self.out_voice, rate=24000,
+            chunk_ms=config.PLAYBACK_CHUNK_MS, prefill_ms=config.PLAYBACK_PREFILL_MS,
+            max_seconds=config.PLAYBACK_MAX_SECONDS, latency=out_latency,
+            on_drained=self._on_playback_drained,
         )
+        self.playback.start()
         
         self.should_close = False
         self.close_after_turn = False
+        # Lebt über Sessions hinweg: der Rauschteppich kommt aus dem Ruhepegel (observe_idle_level),
+        # nicht aus dem ersten Frame der Session (das ist mit Pre-Roll oft schon Sprache)
+        self.audio_features = AudioFeatures(rise_gate=config.VAD_ENERGY_RATIO,
+                                            initial_floor=config.VAD_MIN_RMS / config.VAD_ENERGY_RATIO)
+        self._last_level_led = 0.0
+        self.vad_detector = None
+        self.vad_gate = None
+        self.endpointer = None
+        # Manual activity: we signal activity_start/activity_end ourselves (local endpointer)
+        self.manual_activity = config.LIVE_MANUAL_ACTIVITY
+        # Capture timestamp of the last detected end of user speech, consumed by the first model audio
+        self._eos_time = None
+        self.eos_latencies = []
+        # Capture -> handed to the websocket, per frame (pre-roll excluded, it is old on purpose)
+        self.uplink_latency = LatencyStats("uplink")
+        self.packetizer = None
+        # Tracing: "live_session" span and its start (time.monotonic) for connect/first packet/first audio spans
+        self._trace_span = trace.NULL_SPAN
+        self._session_t0 = None
+        self._first_uplink_pending = False
+        self._first_audio_pending = False
         self._current_user_transcript = []
         self._waiting_for_tts_completion = False
         # Maximum idle time (in seconds) for a Live API Fast Brain session.
         # If there is no interaction between user and model (no audio sent, no
         # server responses) for this duration, the session is auto-closed.
         self.session_timeout_seconds = 15   
+        # Own pool for Fast Brain tools (blocking HA requests): independent of playback and the slow brain
+        self._tool_executor = ThreadPoolExecutor(max_workers=config.FAST_TOOL_WORKERS, thread_name_prefix="fast-tool")
+        self._tool_durations = []
+
+    @property
+    def is_playing_audio(self):
+        """True while model audio is buffered or still audible (real playback position)."""
+        return self.playback.is_playing()
+
+    @property
+    def last_audio_end_time(self):
+        """time.time() at which the last model audio ends/ended playing."""
+        return self.playback.last_end_time()
+
+    def _on_playback_drained(self):
+        """Playback thread: the answer finished playing -> back to listening."""
+        if not self.is_thinking and not self.should_close:
+            self.leds.pattern = None
+            self.leds.update(Color.BLUE)
 
-    async def _handle_local_tool(self, session, tool_call):
-        """Executes a simple HA tool directly and returns the response to the Live API immediately."""
+    async def _wait_playback_drained(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while self.playback.is_playing() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def _execute_local_tool(self, tool_call):
+        """
+        Executes a simple HA tool in the tool executor (never raises).
+        Returns (FunctionResponse, finished): finished is False after a timeout.
+        """
+        call_id = tool_call.id
+        name = tool_call.name
+        start = time.monotonic()
+        finished = True
         try:
-            call_id = tool_call.id
-            name = tool_call.name
-            
             args = tool_call.args
             if hasattr(args, '__dict__'):
                 args_dict = vars(args)
@@ -222,19 +244,80 @@ class JarvisHybridRouter:
             loop = asyncio.get_running_loop()
             print(f" [Fast Brain] Executing Local Tool: {name} with args {args_dict}")
             
-            # Execute tool synchronously in executor
-            result = await loop.run_in_executor(None, execute_tool, name, args_dict, True)
-            
-            # Send result back
-            function_response = types.FunctionResponse(
-                id=call_id,
-                name=name,
-                response={
-                    "result": str(result),
-                    "scheduling": "INTERRUPT" 
-                }
+            # Blocking tool (HA HTTP etc.) in the tool executor, bounded so one slow tool can't hold up the others
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self._tool_executor, trace.bind(execute_tool), name, args_dict, True),
+                timeout=config.FAST_TOOL_TIMEOUT,
             )
-            await session.send_tool_response(function_responses=[function_response])
+        except asyncio.TimeoutError:
+            # wait_for stops waiting, not the HA call in the executor thread: the outcome is unknown
+            print(f" [Fast Brain] Tool {name} timed out after {config.FAST_TOOL_TIMEOUT:.0f}s", flush=True)
+            result = timeout_result(name, config.FAST_TOOL_TIMEOUT)
+            finished = False
+        except Exception as e:
+            print(f"[Router Error] Could not execute local tool: {e}")
+            result = f"Fehler: {e}"
+        self._tool_durations.append(time.monotonic() - start)
+        return self._local_tool_response(tool_call, result), finished
+
+    @staticmethod
+    def _local_tool_response(tool_call, result):
+        return types.FunctionResponse(
+            id=tool_call.id,
+            name=tool_call.name,
+            response={
+                "result": str(result),
+                "scheduling": "INTERRUPT" 
+            }
+        )
+
+    async def _run_local_tools(self, tool_calls):
+        """
+        Same order rules as tools.execute_tools: consecutive PARALLEL_TOOLS run concurrently,
+        every other call (control_device, ...) runs alone in call order. If one of those
+        times out, the remaining calls are skipped.
+        """
+        responses = [None] * len(tool_calls)
+        batch = []
+
+        async def run_batch():
+            results = await asyncio.gather(*(self._execute_local_tool(tool_calls[i]) for i in batch))
+            for i, (response, _) in zip(batch, results):
+                responses[i] = response
+            batch.clear()
+
+        for i, call in enumerate(tool_calls):
+            if call.name in PARALLEL_TOOLS:
+                batch.append(i)
+                continue
+            await run_batch()
+            responses[i], finished = await self._execute_local_tool(call)
+            if not finished:
+                for j in range(i + 1, len(tool_calls)):
+                    responses[j] = self._local_tool_response(tool_calls[j], skipped_result(call.name))
+                return responses
+        await run_batch()
+        return responses
+
+    async def _handle_local_tools(self, session, tool_calls, extra_responses=()):
+        """
+        Runs the local tool calls of one tool_call message (reads concurrently, writes in order)
+        and hands the results back to the Live API in a single send_tool_response.
+        """
+        try:
+            start = time.monotonic()
+            self._tool_durations = []
+            responses = await self._run_local_tools(tool_calls)
+            responses.extend(extra_responses)
+            if not responses:
+                return
+            await session.send_tool_response(function_responses=responses)
+            if len(tool_calls) > 1:
+                wall_ms = (time.monotonic() - start) * 1000
+                print(f" [Fast Brain] {len(tool_calls)} tools in {wall_ms:.0f} ms "
+                      f"(sequential ~{sum(self._tool_durations) * 1000:.0f} ms)", flush=True)
+            if not tool_calls:
+                return
             
             # Close only if the backend reasoning hasn't also been triggered
             active_task = self._active_backend_task
@@ -245,7 +328,7 @@ class JarvisHybridRouter:
                 self._waiting_for_tts_completion = True
                 self._active_backend_task = None
         except Exception as e:
-            print(f"[Router Error] Could not execute local tool: {e}")
+            print(f"[Router Error] Could not send local tool results: {e}")
 
     async def _handle_slow_brain_tool(self, session, tool_call):
         """Catches the tool call and routes it to the heavy agentic backend in a thread."""
@@ -276,19 +359,22 @@ class JarvisHybridRouter:
             sfx.play_loop(config.SOUND_THINKING, volume=1)
             
             # Wrap standard sync logic
-            hybrid_context = memory.get_hybrid_context(user_intent)
+            # Core Memory wurde beim Beginn der Transkription vorab geladen
+            hybrid_context = await asyncio.get_running_loop().run_in_executor(None, prefetcher.get, "hybrid_context")
             final_prompt = f"{hybrid_context}\n\nUSER AUDIO TRANSCRIPT:\n{user_intent}\n\n(Antworte dem User.)"
             
             # Run blocking task in executor so the websocket loop stays alive
             loop = asyncio.get_running_loop()
-            response_text = await loop.run_in_executor(
-                None, 
-                llm.ask_gemini, 
-                self.leds, 
-                final_prompt, 
-                None,  # WAV data not needed, Live API already transcribed it
-                True   # silent_mode=True to prevent duplicate TTS in llm.py
-            )
+            with trace.span("slow_brain"):
+                response_text = await loop.run_in_executor(
+                    None, 
+                    trace.bind(llm.ask_gemini), 
+                    self.leds, 
+                    final_prompt, 
+                    None,  # WAV data not needed, Live API already transcribed it
+                    True,  # silent_mode=True to prevent duplicate TTS in llm.py
+                    user_intent  # query: device selection without the memory context
+                )
             
             if "<SESSION:CLOSE>" in response_text:
                  self.close_after_turn = True
@@ -326,12 +412,102 @@ class JarvisHybridRouter:
         except Exception as e:
              traceback.print_exc()
 
+    async def _send_audio(self, session, pcm_data):
+        """Sends one PCM chunk to the Live API (ducked while the model speaks if the echo canceller is off)."""
+        # Without AEC: if we're currently playing audio from the model, or if we just finished within the last 0.6 seconds, duck the mic input to prevent feedback loops and overwhelming the user with loud audio.
+        if self.aec is None and (self.is_playing_audio or (time.time() - self.last_audio_end_time < 0.6)):
+            try:
+                # Dämpfe das Signal auf 10% 
+                pcm_data = scale_pcm(pcm_data, 0.1)
+                # print(f" [Fast Brain] Mic Ducked ({len(pcm_data)} bytes)", flush=True)
+            except Exception as e:
+                print(f"[Fast Brain] Ducking failed: {e}")
+                
+        # print(f" [Fast Brain] Sent {len(pcm_data)} bytes of audio", flush=True)
+        # For Python SDK we must send exactly types.Blob directly rather than JSON dicts
+        try:
+            await session.send_realtime_input(audio=types.Blob(data=pcm_data, mime_type=f"audio/pcm;rate={config.RATE}"))
+        except Exception as e:
+            if e.__class__.__name__ == 'APIError' and '1000' in str(e):
+                pass
+            elif e.__class__.__name__ == 'ConnectionClosedOK':
+                pass
+            else:
+                print(f" [Fast Brain] Error sending audio chunk: {e}", flush=True)
+
+    async def _send_pcm_chunks(self, session, pcm_frames, flush=False):
+        """Sends the uplink in fixed LIVE_PACKET_MS packets; `flush` also sends the remainder (turn boundary)."""
+        for packet in self.packetizer.push(pcm_frames):
+            await self._send_audio(session, packet)
+        if flush:
+            packet = self.packetizer.flush()
+            if packet:
+                await self._send_audio(session, packet)
+        if self._first_uplink_pending and self.packetizer.packets:
+            self._first_uplink_pending = False
+            trace.record("first_uplink", self._session_t0, parent=self._trace_span)
+
+    async def _send_stream_end(self, session):
+        try:
+            await session.send_realtime_input(audio_stream_end=True)
+        except Exception as e:
+            if e.__class__.__name__ not in ('APIError', 'ConnectionClosedOK'):
+                print(f" [Fast Brain] Error sending audio_stream_end: {e}", flush=True)
+
+    async def _send_activity(self, session, start):
+        """Manual activity mode: marks begin/end of user speech for the Live API."""
+        try:
+            if start:
+                await session.send_realtime_input(activity_start=types.ActivityStart())
+            else:
+                await session.send_realtime_input(activity_end=types.ActivityEnd())
+        except Exception as e:
+            if e.__class__.__name__ not in ('APIError', 'ConnectionClosedOK'):
+                print(f" [Fast Brain] Error sending activity marker: {e}", flush=True)
+
+    def observe_idle_level(self, rms):
+        """Pegel-Event des audio_worker außerhalb einer Session: hält den Rauschteppich für die nächste Session aktuell."""
+        self.audio_features.update_floor(rms)
+
+    def _update_level_led(self):
+        """While listening, the blue LED brightness follows the mic level (max ~8 updates/s)."""
+        if self.is_playing_audio or self.is_thinking or state.LED_LOCKED:
+            return
+        now = time.monotonic()
+        if now - self._last_level_led < 0.125:
+            return
+        self._last_level_led = now
+        f = self.audio_features.last
+        level = 0.3 + 0.7 * level_to_brightness(f.rms, f.noise_floor)
+        r, g, b = Color.BLUE
+        self.leds.update((int(r * level), int(g * level), int(b * level)))
+
+    def _record_first_audio(self):
+        """Called on the first model audio chunk of a response: end-of-speech -> first audio latency."""
+        if self._eos_time is None:
+            return
+        latency_ms = (time.monotonic() - self._eos_time) * 1000
+        self._eos_time = None
+        self.eos_latencies.append(latency_ms)
+        mode = "manual" if self.manual_activity else "auto"
+        print(f" [Latency] End of speech -> first audio: {latency_ms:.0f} ms ({mode})", flush=True)
+
     async def _mic_send_loop(self, session):
-        """Pulls audio from the existing multiprocessing.Queue and pushed to websocket."""
+        """Pulls audio frames from the shared-memory AudioRing and pushes them to the websocket.
+
+        The ring cursor is positioned right after the wake word before the session
+        connects, so the first iteration replays the pre-roll (speech captured while
+        we were still connecting) before continuing with live audio.
+        The loop sleeps until the audio_worker signals a new frame (ring notify pipe).
+        """
+        source = None
         try:
             print(" [Fast Brain] Mic Send Loop Started", flush=True)
+            source = AsyncFrameSource(self.audio_ring)
+            preroll_pending = True
             while True:  # KEEP RUNNING to prevent FIRST_COMPLETED from killing the receive loop early
-                await asyncio.sleep(0.01) # Yield to event loop
+                # Wakes per captured frame; the timeout keeps cancel/close checks alive if the mic stalls
+                frames = await source.read(timeout=0.1)
                 
                 if state.CANCEL_REQUESTED:
                     print(" [Fast Brain] Button interrupt detected! Closing session immediately.", flush=True)
@@ -339,42 +515,66 @@ class JarvisHybridRouter:
                     self.should_close = True
                     break
                 
-                # Drain queue non-blocking
-                chunks = []
-                while not self.audio_queue.empty():
-                    try:
-                        chunks.append(self.audio_queue.get_nowait())
-                    except queue.Empty:
-                        break
-                
                 if self.should_close:
-                    # Session closing, clear queue
+                    # Session closing, frames are discarded
                     continue
                 
-                if chunks:
-                    pcm_data = b''.join(chunks)
-                    
-                    # If we're currently playing audio from the model, or if we just finished within the last 0.6 seconds, duck the mic input to prevent feedback loops and overwhelming the user with loud audio.
-                    if self.is_playing_audio or (time.time() - self.last_audio_end_time < 0.6):
-                        try:
-                            import audioop
-                            # Dämpfe das Signal auf 10% 
-                            pcm_data = audioop.mul(pcm_data, 2, 0.1)
-                            # print(f" [Fast Brain] Mic Ducked ({len(pcm_data)} bytes)", flush=True)
-                        except Exception as e:
-                            print(f"[Fast Brain] Ducking failed: {e}")
-                            
-                    # print(f" [Fast Brain] Sent {len(pcm_data)} bytes of audio", flush=True)
-                    # For Python SDK we must send exactly types.Blob directly rather than JSON dicts
-                    try:
-                        await session.send_realtime_input(audio=types.Blob(data=pcm_data, mime_type=f"audio/pcm;rate={config.RATE}"))
-                    except Exception as e:
-                        if e.__class__.__name__ == 'APIError' and '1000' in str(e):
-                            pass
-                        elif e.__class__.__name__ == 'ConnectionClosedOK':
-                            pass
-                        else:
-                            print(f" [Fast Brain] Error sending audio chunk: {e}", flush=True)
+                is_preroll = False
+                if frames and preroll_pending:
+                    preroll_pending = False
+                    is_preroll = True
+                    age = time.monotonic() - frames[0].timestamp
+                    if len(frames) > 1:
+                        print(f" [Fast Brain] Pre-Roll: replaying {len(frames)} frames ({age:.2f}s since wake word)", flush=True)
+
+                outgoing = []
+                for frame in frames:
+                    # Remove the model's own voice first, so VAD and the server only hear the user (barge-in)
+                    pcm = self.aec.process(frame.pcm, frame.timestamp) if self.aec else frame.pcm
+
+                    # One feature pass per frame, shared by VAD and the LED level meter
+                    features = self.audio_features.process(pcm)
+                    is_speech = self.vad_detector.is_speech(pcm, features) if self.vad_detector else None
+
+                    # Local endpointer: drives activity markers in manual mode, only measures in automatic mode
+                    event = self.endpointer.update(is_speech, frame.timestamp) if self.endpointer else None
+                    if event == "start":
+                        self._eos_time = None
+                        if self.manual_activity:
+                            await self._send_pcm_chunks(session, outgoing, flush=True)
+                            outgoing = []
+                            await self._send_activity(session, start=True)
+
+                    # Local VAD gate: silence and room noise never leave the device
+                    if self.vad_gate:
+                        passed, closed = self.vad_gate.process(pcm, is_speech)
+                        outgoing.extend(passed)
+                        if closed and not self.manual_activity:
+                            # Flush what we have, then tell the server the stream paused so it can finish the turn
+                            await self._send_pcm_chunks(session, outgoing, flush=True)
+                            outgoing = []
+                            await self._send_stream_end(session)
+                    else:
+                        outgoing.append(pcm)
+
+                    if event == "end":
+                        self._eos_time = self.endpointer.speech_end_time
+                        if self.manual_activity:
+                            await self._send_pcm_chunks(session, outgoing, flush=True)
+                            outgoing = []
+                            await self._send_activity(session, start=False)
+                            print(" [Fast Brain] End of speech -> activity_end sent", flush=True)
+
+                await self._send_pcm_chunks(session, outgoing)
+
+                if frames:
+                    now = time.monotonic()
+                    for frame in frames:
+                        self.uplink_latency.record(frame.seq, None if is_preroll else frame.timestamp, now)
+                    self.uplink_latency.maybe_report(config.LATENCY_REPORT_INTERVAL)
+
+                if frames and config.LED_LEVEL_METER:
+                    self._update_level_led()
         except asyncio.CancelledError:
             print(" [Fast Brain] Mic Send Loop Cancelled", flush=True)
         except Exception as e:
@@ -385,10 +585,14 @@ class JarvisHybridRouter:
             else:
                 print(f" [Fast Brain] Mic Send Loop Error: {e}", flush=True)
                 traceback.print_exc()
+        finally:
+            if source:
+                source.close()
+                print(f" [Fast Brain] Uplink: {self.packetizer.packets} packets of {config.LIVE_PACKET_MS} ms "
+                      f"({self.packetizer.partial} partial), {source.wakeups} wakeups", flush=True)
 
     async def _receive_loop(self, session):
         """Listens for AI server events (audio, tool calls, interruptions)."""
-        loop = asyncio.get_running_loop()
         try:
             print(" [Fast Brain] Receive Loop Started", flush=True)
             while True:
@@ -411,14 +615,23 @@ class JarvisHybridRouter:
                         try:
                             self.live_input_tokens += int(in_tokens or 0)
                             self.live_output_tokens += int(out_tokens or 0)
+                            if self._first_turn_input_tokens is None and self.live_input_tokens:
+                                self._first_turn_input_tokens = self.live_input_tokens
                         except Exception:
                             # Don't let logging issues break the session.
                             pass
 
+                    # Session resumption: keep the newest handle for the next wake within LIVE_RESUME_WINDOW
+                    resumption = getattr(response, "session_resumption_update", None)
+                    if resumption is not None and resumption.resumable and resumption.new_handle:
+                        self._resume_handle = resumption.new_handle
+
                     server_content = response.server_content
                     if not server_content:
                         # Could be tool calls
                         if response.tool_call:
+                            local_calls = []
+                            ignored = []
                             for call in response.tool_call.function_calls:
                                 print(f" [Fast Brain] Tool Call: {call.name}", flush=True)
                                 if call.name == "delegate_to_backend":
@@ -426,40 +639,34 @@ class JarvisHybridRouter:
                                 elif call.name == "end_conversation":
                                     if (self._active_backend_task and not self._active_backend_task.done()) or self._waiting_for_tts_completion or self.is_playing_audio:
                                         print(" [Fast Brain] Ignoriere end_conversation (Backend läuft oder TTS aktiv).")
-                                        from google.genai import types
-                                        dummy_response = types.FunctionResponse(
+                                        ignored.append(types.FunctionResponse(
                                             id=call.id, 
                                             name=call.name, 
                                             response={"result": "SYSTEM_INSTRUCTION: SILENT_IGNORE"}
-                                        )
-                                        await session.send_tool_response(function_responses=[dummy_response])
+                                        ))
                                     else:
                                         print(" [Fast Brain] Gemini hat Stille/Ende erkannt. Beende Session.")
                                         self.close_after_turn = True
-                                        await self._handle_local_tool(session, call)
+                                        local_calls.append(call)
                                 else:
-                                    await self._handle_local_tool(session, call)
+                                    local_calls.append(call)
+                            # Independent calls ("Licht aus und Musik leiser") run concurrently, one batched response
+                            if local_calls or ignored:
+                                await self._handle_local_tools(session, local_calls, ignored)
                         continue
                     
-                    # The Interruption Kill Switch
-                    '''if server_content.interrupted:
-                        print(" [Fast Brain] 🛑 User Interrupted!")
-
-                        if self.is_thinking:
-                            self.is_thinking = False
-                            sfx.stop_loop()
-
-                        self.is_playing_audio = False
-
-                        sfx.play(config.SOUND_ERROR, volume=1)
-                        self.leds.pattern = None
-                        self.leds.update(Color.BLUE)
-                        
-                        if self._active_backend_task and not self._active_backend_task.done():
-                            print(" [Fast Brain] Killing Slow Brain task...")
-                            self._active_backend_task.cancel()
-                            self._active_backend_task = None
-                        continue'''
+                    # Barge-in: only drop the queued model audio. No error chime, and a running
+                    # Slow Brain task keeps going (cancel() would not stop the ask_gemini thread anyway).
+                    if server_content.interrupted:
+                        dropped_ms = self.playback.flush()
+                        print(f" [Fast Brain] 🛑 User Interrupted! ({dropped_ms:.0f} ms audio dropped)", flush=True)
+                        if not (self._active_backend_task and not self._active_backend_task.done()):
+                            if self.is_thinking:
+                                self.is_thinking = False
+                                sfx.stop_loop()
+                            self.leds.pattern = None
+                            self.leds.update(Color.BLUE)
+                        continue
                     
                     # 1. Capture user's input transcription if available
                     if hasattr(server_content, "input_transcription") and server_content.input_transcription:
@@ -467,6 +674,9 @@ class JarvisHybridRouter:
                             # We might get partial transcripts, we append them locally and dump them on model_turn
                             if not hasattr(self, "_current_user_transcript"):
                                 self._current_user_transcript = []
+                            if not self._current_user_transcript:
+                                # User beginnt zu sprechen: Slow-Brain Kontext spekulativ vorladen
+                                prefetcher.prefetch()
                             self._current_user_transcript.append(server_content.input_transcription.text)
 
                     # 2. Extract text content from the model to build conversation history
@@ -492,15 +702,16 @@ class JarvisHybridRouter:
                                     self.is_thinking = False
                                     sfx.stop_loop()
 
+                                if self._first_audio_pending:
+                                    self._first_audio_pending = False
+                                    trace.record("first_model_audio", self._session_t0, parent=self._trace_span)
                                 if not self.is_playing_audio:
+                                    self._record_first_audio()
                                     self.leds.pattern = None
                                     self.leds.update(config.DIM_PURPLE)
-                                    self.is_playing_audio = True
-                                    
-                                try:
-                                    await loop.run_in_executor(None, self.out_stream.write, part.inline_data.data)
-                                finally:
-                                    self.last_audio_end_time = time.time()
+
+                                # Non-blocking: the playback thread plays it (and feeds the echo reference)
+                                self.playback.write(part.inline_data.data)
                                     
                         # Append the Fast Brain's response to the global history
                         if model_text_parts:
@@ -523,13 +734,15 @@ class JarvisHybridRouter:
                             self.is_thinking = False
                             sfx.stop_loop()
 
-                        self.is_playing_audio = False
-
-                        self.leds.pattern = None
-                        self.leds.update(Color.BLUE)
+                        # The rest of the answer plays from the buffer, no prefill wait
+                        self.playback.end_turn()
+                        if not self.is_playing_audio:
+                            self.leds.pattern = None
+                            self.leds.update(Color.BLUE)
                             
                         if self.should_close or self.close_after_turn:
                             print(" [Fast Brain] Turn complete and Backend closed session. Disconnecting.")
+                            await self._wait_playback_drained()
                             self.should_close = True
                             return # Exit loop
                 
@@ -597,27 +810,24 @@ class JarvisHybridRouter:
             # Normal path when the session finishes earlier
             print(" [Fast Brain] Session timeout watchdog cancelled", flush=True)
 
-    async def start_session(self):
-        """Establishes the Live API session upon wake word detection."""
-        self.should_close = False
-        self.close_after_turn = False
+    def _context_plan(self, time_since_last_activity):
+        """
+        (resume_handle, include_history) for a session starting now.
+        Within LIVE_RESUME_WINDOW the previous session is resumed (server keeps the full context
+        incl. tool calls), then the history block is not injected a second time.
+        """
+        handle = None
+        if self._resume_handle and time_since_last_activity <= config.LIVE_RESUME_WINDOW:
+            handle = self._resume_handle
+        include_history = (handle is None and time_since_last_activity <= HISTORY_WINDOW_SECONDS
+                           and bool(getattr(state, 'CONVERSATION_HISTORY', None)))
+        return handle, include_history
 
-        self._waiting_for_tts_completion = False
-        self.is_playing_audio = False
-        self.is_thinking = False
-        
-        # Calculate time since last interaction
-        time_since_last_activity = time.time() - self.last_activity_time
-        
-        # Reset Live API token accounting for this session.
-        self.live_input_tokens = 0
-        self.live_output_tokens = 0
-        # Initialize last activity timestamp at session start so the idle timer
-        # only kicks in after a period with no user/model interaction.
-        self.last_activity_time = time.time()
-        print("💡 LED: SOLID BLUE (Connecting to Live API...)", flush=True)
-        self.leds.update(Color.BLUE)
-        
+    def _build_live_config(self, time_since_last_activity):
+        """(LiveConnectConfig as dict, meta) with the dynamic system instruction and resumption handle."""
+        handle, include_history = self._context_plan(time_since_last_activity)
+        system_instruction, fingerprint = prompt_assembler.build(include_history)
+        meta = {"fingerprint": fingerprint, "resume_handle": handle, "include_history": include_history}
         # Requesting transcripts in the Live API config using **kwargs since Pydantic types can be strict
         # The prompt instructed to pass dicts directly to config.
         # However, the SDK uses types.LiveConnectConfig, which might not explicitly accept these as kwargs.
@@ -626,8 +836,10 @@ class JarvisHybridRouter:
             "response_modalities": ["AUDIO"],
             "enable_affective_dialog": True,
             "thinking_config": types.ThinkingConfig(thinking_budget=-1, include_thoughts=True),
-            "system_instruction": get_dynamic_system_instruction(time_since_last_activity),
+            "system_instruction": system_instruction,
             "tools": [live_api_tools],
+            # With LIVE_SESSION_RESUMPTION the server sends resumption handles; handle=None starts a new session
+            "session_resumption": types.SessionResumptionConfig(handle=handle) if config.LIVE_SESSION_RESUMPTION else None,
             "speech_config": types.SpeechConfig(
                 voice_config=types.VoiceConfig(
                     prebuilt_voice_config=types.PrebuiltVoiceConfig(
@@ -645,40 +857,146 @@ class JarvisHybridRouter:
             "input_audio_transcription": {},
             "output_audio_transcription": {},
         }
+        if self.manual_activity:
+            # Server-side turn detection off, the local endpointer sends activity_start/activity_end
+            raw_config["realtime_input_config"] = {"automatic_activity_detection": {"disabled": True}}
         # merge the schema generated by the SDK with the raw dictionary fields we need just in case
         try:
-             import json
              dumped = c.model_dump(exclude_none=True)
              dumped.update(raw_config)
-             final_config = dumped
+             return dumped, meta
         except Exception:
-             final_config = c # fallback if model_dump fails
-             
+             return c, meta # fallback if model_dump fails
+
+    def _warm_live_config(self):
+        """Config for the pre-opened connection: (config, stale_after, meta)."""
+        time_since_last_activity = time.time() - self.last_activity_time
+        live_config, meta = self._build_live_config(time_since_last_activity)
+        # Resumption handle and history block both expire with their window -> rebuild the warm connection
+        deadlines = []
+        if meta["resume_handle"]:
+            deadlines.append(self.last_activity_time + config.LIVE_RESUME_WINDOW)
+        if meta["include_history"]:
+            deadlines.append(self.last_activity_time + HISTORY_WINDOW_SECONDS)
+        return live_config, (min(deadlines) if deadlines else None), meta
+
+    def _on_warm_connect_error(self, error):
+        """A pre-opened connection failed: drop the handle only if the server rejected it, not on transport errors."""
+        if self._resume_handle and resume_rejected(error):
+            print(f" [Fast Brain] Dropping session resumption handle, rejected by server: {error}", flush=True)
+            self._resume_handle = None
+
+    async def _send_context_update(self, session, meta):
+        """
+        Warm session built with an older prompt: send the sections that changed since then
+        (device states, new turns, core memory) as context. turn_complete=False -> no reply.
+        """
+        changed = prompt_assembler.changed_sections(meta["fingerprint"], meta["include_history"])
+        text = "".join(t for t in changed.values() if t)
+        if not text:
+            return
+        await session.send_client_content(
+            turns=types.Content(role="user", parts=[types.Part.from_text(
+                text=f"[KONTEXT-UPDATE, nicht beantworten - ersetzt die entsprechenden Abschnitte der Instruktion]\n{text}")]),
+            turn_complete=False,
+        )
+        print(f" [Prompt] Warm session context update: {', '.join(k for k, t in changed.items() if t)} ({len(text)} chars)", flush=True)
+
+    async def _run_connected(self, session, warm, wake_time, cold_resumed):
+        """Runs the send/receive/watchdog tasks on a connected Live session until one of them ends."""
+        self._resumed = bool(warm.meta["resume_handle"]) if warm else cold_resumed
+        source = "warm" if warm else "cold"
+        if self._resumed:
+            source += ", resumed"
+        if warm and warm.meta:
+            try:
+                await self._send_context_update(session, warm.meta)
+            except Exception as e:
+                print(f" [Prompt] Context update failed: {e}", flush=True)
+        trace.record("live_connect", self._session_t0, warm=warm is not None, resumed=self._resumed)
+        if wake_time is not None:
+            self.listen_latency.record(None, wake_time)
+            source += f", {(time.monotonic() - wake_time) * 1000:.0f} ms after wake word"
+        print(f"✅ Live API Connected ({source}). Fast Brain Listening...", flush=True)
+        
+        send_task = asyncio.create_task(self._mic_send_loop(session))
+        receive_task = asyncio.create_task(self._receive_loop(session))
+        timeout_task = asyncio.create_task(self._session_timeout_watchdog(session))
+        
+        # Wait until either the send loop detects a close, the receive loop breaks,
+        # or the timeout watchdog triggers.
+        await asyncio.wait(
+            [send_task, receive_task, timeout_task], 
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        
+        # Cleanup tasks if they are still pending
+        send_task.cancel()
+        receive_task.cancel()
+        timeout_task.cancel()
+
+    async def start_session(self, wake_time=None):
+        """
+        Establishes the Live API session upon wake word detection.
+        Runs on the LiveConnectionManager loop (live_pool.run_sync), `wake_time` is the
+        capture timestamp (time.monotonic) of the wake word frame.
+        """
+        self.should_close = False
+        self.close_after_turn = False
+
+        self._waiting_for_tts_completion = False
+        self.is_thinking = False
+        
+        # Calculate time since last interaction
+        time_since_last_activity = time.time() - self.last_activity_time
+        
+        # Reset Live API token accounting for this session.
+        self.live_input_tokens = 0
+        self.live_output_tokens = 0
+        self._first_turn_input_tokens = None
+        self._resumed = False
+        # Initialize last activity timestamp at session start so the idle timer
+        # only kicks in after a period with no user/model interaction.
+        self.last_activity_time = time.time()
+        print("💡 LED: SOLID BLUE (Connecting to Live API...)", flush=True)
+        self.leds.update(Color.BLUE)
+        
         # Initialize an empty array to accumulate user transcript strings for this session
         self._current_user_transcript = []
+
+        # Fresh VAD per session (counters start at zero); the noise floor carries over from idle
+        frame_ms = (self.audio_ring.frame_bytes // 2) / config.RATE * 1000
+        self.vad_detector = vad.create_detector()
+        gate_enabled = self.vad_detector is not None
+        if self.vad_detector is None and self.manual_activity:
+            # Manual activity needs a detector even when the uplink gate is off
+            self.vad_detector = vad.create_detector("energy")
+        self.vad_gate = vad.create_gate(frame_ms, self.vad_detector) if gate_enabled else None
+        self.endpointer = vad.Endpointer(frame_ms, silence_ms=config.EOS_SILENCE_MS) if self.vad_detector else None
+        self._eos_time = None
+        self.eos_latencies = []
+        self.uplink_latency.reset_sequence()
+        self.packetizer = Packetizer(config.LIVE_PACKET_MS, rate=config.RATE)
+        self._session_t0 = time.monotonic()
+        self._trace_span = trace.start_span("live_session")
+        self._first_uplink_pending = self._first_audio_pending = True
         
         try:
-            async with self.client.aio.live.connect(
-                model="gemini-2.5-flash-native-audio-preview-12-2025", 
-                config=final_config
-            ) as session:
-                print("✅ Live API Connected. Fast Brain Listening...", flush=True)
-                
-                send_task = asyncio.create_task(self._mic_send_loop(session))
-                receive_task = asyncio.create_task(self._receive_loop(session))
-                timeout_task = asyncio.create_task(self._session_timeout_watchdog(session))
-                
-                # Wait until either the send loop detects a close, the receive loop breaks,
-                # or the timeout watchdog triggers.
-                await asyncio.wait(
-                    [send_task, receive_task, timeout_task], 
-                    return_when=asyncio.FIRST_COMPLETED
-                )
-                
-                # Cleanup tasks if they are still pending
-                send_task.cancel()
-                receive_task.cancel()
-                timeout_task.cancel()
+            handle, _ = self._context_plan(time_since_last_activity)
+            connected = False
+            with trace.use(self._trace_span):
+                try:
+                    async with self.live_pool.lease(lambda: self._build_live_config(time_since_last_activity)[0]) as (session, warm):
+                        connected = True
+                        await self._run_connected(session, warm, wake_time, handle is not None)
+                except Exception as e:
+                    if connected or handle is None or not resume_rejected(e):
+                        raise
+                    # Handle expired/rejected server-side: fall back to a cold start with the history block
+                    print(f" [Fast Brain] Session resumption failed ({e}), starting a new session", flush=True)
+                    self._resume_handle = None
+                    async with self.live_pool.lease(lambda: self._build_live_config(time_since_last_activity)[0]) as (session, warm):
+                        await self._run_connected(session, warm, wake_time, False)
                 
         except Exception as e:
             print(f"Connection Lost: {e}", flush=True)
@@ -698,6 +1016,55 @@ class JarvisHybridRouter:
             except Exception as e:
                 print(f" [Fast Brain] Could not log Live API cost: {e}", flush=True)
 
+            if self._first_turn_input_tokens:
+                if not self._resumed:
+                    self._cold_first_turn_tokens.append(self._first_turn_input_tokens)
+                elif self._cold_first_turn_tokens:
+                    baseline = sum(self._cold_first_turn_tokens) / len(self._cold_first_turn_tokens)
+                    saved = baseline - self._first_turn_input_tokens
+                    print(f" [Fast Brain] Resumed session: first turn {self._first_turn_input_tokens} input tok "
+                          f"vs. {baseline:.0f} avg for a new session -> {saved:+.0f} tok saved", flush=True)
+                else:
+                    print(f" [Fast Brain] Resumed session: first turn {self._first_turn_input_tokens} input tok (no new-session baseline yet)", flush=True)
+
+            if self.vad_gate:
+                vs = self.vad_gate.stats()
+                print(f" [VAD] Uplink: {vs['sent']} frames sent, {vs['suppressed']} suppressed ({vs['suppressed_pct']:.0f}%)", flush=True)
+                self.vad_gate = None
+            if self.vad_detector:
+                self.vad_detector.delete()
+                self.vad_detector = None
+            self.endpointer = None
+
+            if self.uplink_latency.count:
+                print(self.uplink_latency.format(), flush=True)
+
+            ps = self.playback.stats(reset=True)
+            if ps["played_s"] or ps["flushes"]:
+                print(f" [Playback] {ps['played_s']:.1f} s played | underruns {ps['underruns']} | overflows {ps['overflows']} | "
+                      f"flushes {ps['flushes']} ({ps['flushed_ms']:.0f} ms) | max buffer {ps['max_buffered_ms']:.0f} ms", flush=True)
+            # Nothing may keep playing into the next session
+            self.playback.flush()
+
+            if self.aec:
+                st = self.aec.stats()
+                print(f" [AEC] {st['processed']} blocks processed, {st['adapted']} adapted, {st['bypassed']} bypassed, ERLE {st['erle_db']:.1f} dB (total)", flush=True)
+
+            if self.listen_latency.count:
+                print(prompt_assembler.format_stats(), flush=True)
+                ps = self.live_pool.stats()
+                print(f" [Live Pool] Warm {ps['hits']} / cold {ps['misses']} ({ps['hit_rate']:.0f}% hits), {ps['refreshes']} refreshes", flush=True)
+                print(self.listen_latency.format(reset=False), flush=True)
+
+            if prefetcher.requests():
+                print(prefetcher.format_stats(reset=True), flush=True)
+
+            if self.eos_latencies:
+                avg = sum(self.eos_latencies) / len(self.eos_latencies)
+                mode = "manual" if self.manual_activity else "auto"
+                print(f" [Latency] End of speech -> first audio ({mode}): avg {avg:.0f} ms over {len(self.eos_latencies)} turns", flush=True)
+
+            self._trace_span.end(resumed=self._resumed, input_tokens=self.live_input_tokens, output_tokens=self.live_output_tokens)
             print("💡 LED: OFF (Disconnected)", flush=True)
             self.leds.update(self.leds.rgb_off())
             
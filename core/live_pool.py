@@ -0,0 +1,187 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+from jarvis import config
+
+class _WarmSession:
+    def __init__(self, session, generation, config_built, stale_after, meta, connect_ms):
+        self.session = session
+        self.generation = generation      # Stand von invalidate() beim Bauen der Config
+        self.opened = time.monotonic()
+        self.config_built = config_built  # time.time() beim Bauen der System Instruction
+        self.stale_after = stale_after    # time.time() ab dem die Instruction nicht mehr passt (oder None)
+        self.meta = meta                  # vom Router mitgegeben (Prompt-Fingerprint)
+        self.connect_ms = connect_ms
+        self.released = asyncio.Event()
+
+def _is_open(session):
+    # AsyncSession hält die websockets-Verbindung in _ws; close_code ist None solange offen
+    ws = getattr(session, "_ws", None)
+    return ws is None or getattr(ws, "close_code", None) is None
+
+class LiveConnectionManager:
+    """
+    Hält die nächste Gemini Live Session vorab offen, damit nach dem Wake Word kein
+    Websocket-/Setup-Handshake mehr anfällt.
+
+    Eine Live-Verbindung gehört zu der Event Loop, in der sie geöffnet wurde. Deshalb
+    läuft (wie beim MCPManager) eine eigene Loop in einem Daemon-Thread, auf der auch
+    die Sessions des Routers laufen (run_sync() statt asyncio.run()).
+
+    Ein Keeper-Task öffnet die Verbindung (`async with connect`) und verleiht sie per
+    lease(). Der Keeper bleibt Eigentümer: nach dem Lease schließt er sie und baut
+    die nächste auf - mit der dann aktuellen System Instruction. Eine ungenutzte
+    Verbindung wird nach LIVE_WARM_MAX_AGE (oder wenn die Instruction veraltet)
+    neu aufgebaut, bevor der Server sie beendet.
+
+    `config_factory()` -> (config, stale_after, meta) wird im Executor aufgerufen (Mem0/HA-Zugriffe
+    blockieren sonst die Loop).
+    """
+    def __init__(self, client, model, config_factory, enabled=True, max_age=None, on_connect_error=None):
+        self.client = client
+        self.model = model
+        self.config_factory = config_factory
+        self.on_connect_error = on_connect_error
+        self.enabled = enabled
+        self.max_age = config.LIVE_WARM_MAX_AGE if max_age is None else max_age
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+        self._warm = None
+        self._wake = None     # asyncio.Event: Keeper soll (neu) aufbauen / Lease-Zustand prüfen
+        self._leased = False
+        self._generation = 0  # invalidate() zählt hoch, ältere Vorab-Verbindungen sind veraltet
+        self._keeper_task = None
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_exception_handler(self._handle_exception)
+        self.loop.run_forever()
+
+    def _handle_exception(self, loop, context):
+        msg = context.get("exception", context["message"])
+        print(f" [Live Pool] Background Info: {msg}", flush=True)
+
+    # --- SYNC API (Main Thread) ---
+    def start(self):
+        if self.enabled:
+            asyncio.run_coroutine_threadsafe(self._start_async(), self.loop).result()
+
+    def run_sync(self, coro):
+        """Führt eine Coroutine (z.B. router.start_session()) auf der Pool-Loop aus und wartet."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def invalidate(self):
+        """Verwirft die warme Verbindung (z.B. neue Geräte/Memory), der Keeper baut neu auf."""
+        self.loop.call_soon_threadsafe(self._invalidate)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": self.hits / total * 100 if total else 0.0,
+        }
+
+    # --- KEEPER ---
+    async def _start_async(self):
+        self._wake = asyncio.Event()
+        self._keeper_task = self.loop.create_task(self._keeper())
+
+    def _invalidate(self):
+        self._generation += 1
+        if self._wake:
+            self._wake.set()
+
+    def _expired(self, warm):
+        if time.monotonic() - warm.opened >= self.max_age:
+            return "max age"
+        if warm.generation != self._generation:
+            return "invalidated"
+        if warm.stale_after is not None and time.time() >= warm.stale_after:
+            return "instruction stale"
+        if not _is_open(warm.session):
+            return "closed by server"
+        return None
+
+    async def _keeper(self):
+        while True:
+            while self._leased:
+                self._wake.clear()
+                await self._wake.wait()
+            try:
+                generation = self._generation
+                cfg, stale_after, meta = await self.loop.run_in_executor(None, self.config_factory)
+                built = time.time()
+                t0 = time.monotonic()
+                async with self.client.aio.live.connect(model=self.model, config=cfg) as session:
+                    warm = _WarmSession(session, generation, built, stale_after, meta, (time.monotonic() - t0) * 1000)
+                    self._warm = warm
+                    print(f" [Live Pool] Warme Verbindung bereit ({warm.connect_ms:.0f} ms Handshake)", flush=True)
+                    reason = None
+                    while self._warm is warm and not reason:
+                        self._wake.clear()
+                        try:
+                            await asyncio.wait_for(self._wake.wait(), timeout=1.0)
+                        except asyncio.TimeoutError:
+                            pass
+                        if self._warm is warm:
+                            reason = self._expired(warm)
+                    if self._warm is warm:
+                        # Nicht verliehen, aber veraltet/abgelaufen -> schließen und neu aufbauen
+                        self._warm = None
+                        self.refreshes += 1
+                        print(f" [Live Pool] Warme Verbindung erneuert ({reason})", flush=True)
+                    else:
+                        # Verliehen: offen halten bis der Router fertig ist
+                        await warm.released.wait()
+            except asyncio.CancelledError:
+                self._warm = None
+                raise
+            except Exception as e:
+                self._warm = None
+                print(f" [Live Pool] Vorab-Verbindung fehlgeschlagen, neuer Versuch in 5s: {e!r}", flush=True)
+                if self.on_connect_error:
+                    self.on_connect_error(e)
+                await asyncio.sleep(5)
+
+    # --- LEASE (Pool-Loop) ---
+    @contextlib.asynccontextmanager
+    async def lease(self, cold_config):
+        """
+        Liefert (session, warm): `warm` ist die _WarmSession (mit .meta) oder None. Warm wenn eine gültige Vorab-Verbindung da ist, sonst
+        normaler Verbindungsaufbau mit `cold_config` (Callable, wird nur bei Miss gebaut).
+        """
+        warm = self._warm
+        if warm is not None and self._expired(warm):
+            warm = None
+        self._leased = True
+        try:
+            if warm is not None:
+                self._warm = None
+                self.hits += 1
+                try:
+                    yield warm.session, warm
+                finally:
+                    warm.released.set()
+            else:
+                self.misses += 1
+                async with self.client.aio.live.connect(model=self.model, config=cold_config()) as session:
+                    yield session, None
+        finally:
+            self._leased = False
+            if self._wake:
+                self._wake.set()
@@ -2,18 +2,23 @@
 import datetime
 import base64
 import json
-from jarvis.config import get_gemini_url, SAFETY_SETTINGS
+import re
+import threading
+import time
+from jarvis.config import get_gemini_url, get_gemini_stream_url, get_next_key, GEMINI_KEYS, SAFETY_SETTINGS, STREAM_TTS_MIN_CHARS
 from jarvis.state import CONVERSATION_HISTORY, HISTORY_LOCK
 from jarvis.utils import session
-from jarvis.core.tools import FUNCTION_DECLARATIONS, execute_tool
+from jarvis.core.tools import FUNCTION_DECLARATIONS, execute_tools
 from aiy.leds import Pattern, Leds, Color
 from jarvis import state
-import jarvis.services.ha as ha
-import jarvis.services.routine as routine
-
-# WICHTIG: Kein 'f' vor dem String! Und {time_str} statt {date_str} nutzen.
-# WICHTIG: Kein 'f' vor dem String! Und {time_str} statt {date_str} nutzen.
-SYSTEM_PROMPT_TEMPLATE = """
+from jarvis.core.prefetch import prefetcher
+from jarvis.core import trace
+from jarvis.core.context_cache import context_cache
+from jarvis.services.entity_index import entity_index
+
+# Statischer Teil: wird zusammen mit den Tools als cachedContent angelegt (siehe core/context_cache.py).
+# Alles, was sich pro Request ändert, gehört in CONTEXT_TEMPLATE - sonst wird der Cache bei jedem Request neu gebaut.
+SYSTEM_PROMPT = """
     Du bist JARVIS, das SLOW BRAIN (Deep Reasoning Agent) des Smart Homes. 
     Du wirst vom Fast Brain (Live API) aufgerufen, wenn komplexe Aufgaben, Recherchen, Routinen oder Python-Code nötig sind.
     Antworte kurz und prägnant. Stelle niemals Rückfragen, es sei denn, ein Befehl kann ohne die Info technisch nicht ausgeführt werden. Wenn die Benutzereingabe unklar, verstümmelt oder nur Rauschen ist, antworte nicht und bleibe stumm."
@@ -25,12 +30,7 @@ SYSTEM_PROMPT_TEMPLATE = """
     - Münchner Lokalkolorit: Kennst das Wetter, die S-Bahn-Probleme, Biergärten
 
     KONTEXT ÜBER PAUL:
-    - Zeit aktuell: {time_str}
-    - Verfügbare Smart-Home Geräte: {devices}
-    - Standort: {people_locations}
-    - RITUAL & GEWOHNHEITEN: {habits_summary}
-    - WAKEUP STATUS: {wakeup_status} (Count: {wakeup_count}/10)
-    - PLANNED WAKEUP: {planned_wakeup}
+    - Steht am Anfang von Pauls aktueller Nachricht unter "=== AKTUELLER KONTEXT ===" (Zeit, Geräte, Standort, Gewohnheiten, Wakeup-Status).
 
 
     KOMMUNIKATIONSSTIL:
@@ -91,7 +91,7 @@ SYSTEM_PROMPT_TEMPLATE = """
     WEITERE REGELN:
     - Wenn der User einen Timer, Wecker oder eine Lichtsteuerung wünscht, musst du ZUERST die entsprechende Funktion aufrufen. Antworte niemals nur mit Text, wenn eine Aktion erforderlich ist. Das Fast Brain hätte das eigentlich abfangen sollen, aber wenn es bei dir landet, MUSS es erledigt werden.
     - Ohne Lampen-Name -> alles an/aus.
-    - Du siehst den aktuellen Status der Geräte oben unter "Verfügbare Smart-Home Geräte".
+    - Du siehst den aktuellen Status der Geräte im aktuellen Kontext unter "Verfügbare Smart-Home Geräte".
     - Wenn der User fragt "Ist das Licht an?", schau in deine Liste. Nutze 'get_device_state' NUR, wenn du glaubst, dass die Liste veraltet ist.
     - Wenn User nur "Musik" sagt -> nutze category='station', name='Library Radio' und nutze außschließlich Plexamp.
     - Kalender: Nutze 'get_calendar_events' für Abfragen. Nutze 'add_calendar_event' NUR, wenn der User explizit einen neuen Termin erstellen will.
@@ -131,116 +131,112 @@ SYSTEM_PROMPT_TEMPLATE = """
     - Übergib ans 'search_memory_tool' passende Suchbegriffe (z.B. "Frühstück gestern" oder konkrete Daten). Das Archiv findet die passenden Timestamps. Rate niemals, was in der Vergangenheit passiert ist, suche es!
 """
 
-def trim_history():
-    """
-    Hält die History sauber und 'flacht' alte Interaktionen ab.
-    Wandelt (User -> Call -> Result -> Text) in (User -> Text) um.
-    """
-    global CONVERSATION_HISTORY
-    
-    # 1. Nichts tun, wenn History kurz ist
-    if len(CONVERSATION_HISTORY) < 6:
-        return
-
-    # Wir bauen eine neue, saubere Liste
-    new_history = []
-    
-    # 2. Die letzten paar Einträge (aktiver Kontext) lassen wir UNBERÜHRT!
-    # Das ist wichtig, falls wir gerade mitten in einem Loop sind.
-    keep_raw_count = 4 
-    raw_part = list(CONVERSATION_HISTORY)[-keep_raw_count:]
-    old_part = list(CONVERSATION_HISTORY)[:-keep_raw_count]
-
-    for entry in old_part:
-        role = entry.get('role')
-        parts = entry.get('parts', [])
-        
-        # A. FUNCTION Responses (Ergebnisse) komplett löschen
-        if role == 'function':
-            continue 
-            
-        # B. MODEL Einträge bereinigen
-        if role == 'model':
-            # Wir suchen nur nach TEXT-Teilen. FunctionCalls werfen wir raus.
-            text_parts = []
-            for p in parts:
-                if 'text' in p:
-                    text_parts.append(p)
-            
-            # Wenn nach dem Filtern noch Text übrig ist, behalten wir den Eintrag als reinen Text
-            if text_parts:
-                new_history.append({"role": "model", "parts": text_parts})
-            # Falls der Eintrag NUR aus einem FunctionCall bestand (ohne Text),
-            # wird er hier ignoriert (gelöscht). Das ist korrekt so.
-            
-        # C. USER Einträge behalten (aber Audio bereinigen, wie du es schon hattest)
-        if role == 'user':
-            # Audio-Daten entfernen, nur Text behalten
-            clean_parts = []
-            for p in parts:
-                if 'text' in p:
-                    clean_parts.append(p)
-                # Falls User NUR Audio geschickt hatte, fügen wir Platzhalter ein
-                # damit der User-Turn nicht leer ist (API mag keine leeren User Turns)
-            if not clean_parts:
-                clean_parts = [{"text": "[Audio Input]"}]
-            
-            new_history.append({"role": "user", "parts": clean_parts})
-
-    # 3. Zusammenfügen
-    combined = new_history + raw_part
-    
-    # 4. Validierung: Sicherstellen, dass die Reihenfolge User -> Model stimmt
-    # Durch das Löschen von reinen Function-Call-Model-Turns kann es passieren,
-    # dass User -> User aufeinanderfolgt. Das fixen wir simpel:
-    final_history = []
-    expect_user = True # Wir erwarten, dass es mit User losgeht (meistens)
-    
-    for entry in combined:
-        is_user = (entry['role'] == 'user')
-        
-        # Wenn wir User erwarten und User kommt -> Ok
-        if expect_user and is_user:
-            final_history.append(entry)
-            expect_user = False
-        # Wenn wir Model erwarten und Model kommt -> Ok
-        elif not expect_user and not is_user:
-            final_history.append(entry)
-            expect_user = True
-        # Wenn User kommt, aber wir Model erwarten (d.h. Model wurde gelöscht)
-        # -> Wir überschreiben den letzten User Eintrag oder ignorieren (Komplexer Fall)
-        # Einfachste Lösung für Chatbots: Wir erlauben User->User nicht, sondern
-        # "mergen" den Text oder verwerfen den alten User Input.
-        # Hier simple Strategie: Nimm es rein, Gemini 1.5 ist da tolerant, 
-        # solange die Struktur grob stimmt.
-        else:
-            final_history.append(entry)
-            # Toggle den Status basierend auf was wir gerade hinzugefügt haben
-            expect_user = not is_user
-
-    # Hard Limit anwenden
-    if len(final_history) > 30:
-        final_history = final_history[-30:]
-        
-    # Sicherstellen, dass der erste Eintrag ein User ist (Gemini mag Start mit Model nicht)
-    while final_history and final_history[0]['role'] != 'user':
-        final_history.pop(0)
+# Dynamischer Teil: pro Request neu, wird dem aktuellen User-Turn vorangestellt.
+# WICHTIG: Kein 'f' vor dem String! Und {time_str} statt {date_str} nutzen.
+CONTEXT_TEMPLATE = """=== AKTUELLER KONTEXT ===
+- Zeit aktuell: {time_str}
+- Verfügbare Smart-Home Geräte: {devices}
+- Standort: {people_locations}
+- RITUAL & GEWOHNHEITEN: {habits_summary}
+- WAKEUP STATUS: {wakeup_status} (Count: {wakeup_count}/10)
+- PLANNED WAKEUP: {planned_wakeup}
+=== ENDE KONTEXT ===
+"""
 
-    from collections import deque
-    CONVERSATION_HISTORY = deque(final_history)
+# Prices for Gemini 2.5 Flash (as of Feb 2026, USD)
+# Input: $0.30 / 1M tokens
+# Output: $2.50 / 1M tokens
+# Cached input: $0.03 / 1M tokens (plus storage per hour, see CONTEXT_CACHE_TTL)
+PRICE_PER_M_INPUT = 0.30
+PRICE_PER_M_CACHED = 0.03
+PRICE_PER_M_OUTPUT = 2.50
 
 def _strip_thought_signature(parts):
     # Google Gemini 3 models REQUIRE the thought_signature to be passed back in function calls.
     # We no longer strip it.
     return parts
 
-def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False):
-    from jarvis.config import DIM_PURPLE 
-    if not silent_mode:
-        leds.pattern = Pattern.breathe(2000)
-        leds.update(leds.rgb_pattern(DIM_PURPLE))
+def _static_prefix():
+    """Der Teil des Requests, der für alle Requests gleich ist (bis MCP Tools dazukommen)."""
+    return {
+        "system_instruction": {"parts": [{"text": SYSTEM_PROMPT}]},
+        "tools": [{"function_declarations": FUNCTION_DECLARATIONS}],
+    }
+
+class _SlowBrainRequest:
+    """
+    Ein Slow-Brain Aufruf über alle Agentic Steps. Der statische Teil steckt im cachedContent
+    des gewählten API Keys (ein Cache gehört zum Key, daher ein Key für alle Steps) oder
+    inline, der dynamische Kontext wird dem aktuellen User-Turn vorangestellt - nur im
+    Request, die History bleibt ohne Kontext.
+    """
+    def __init__(self, payload, user_turn, context_text):
+        self.payload = payload
+        self.user_turn = user_turn
+        self.context_text = context_text
+        self.key = get_next_key()
+        self.cached = context_cache.lookup(self.key, _static_prefix())
+        if self.cached:
+            payload["cachedContent"] = self.cached
+        else:
+            payload.update(_static_prefix())
+
+    def url(self, stream=False):
+        return get_gemini_stream_url(self.key) if stream else get_gemini_url(self.key)
+
+    def contents(self):
+        contents = []
+        for turn in CONVERSATION_HISTORY:
+            if turn is self.user_turn:
+                turn = {"role": "user", "parts": [{"text": self.context_text}] + turn["parts"]}
+            contents.append(turn)
+        return contents
+
+    def uncache(self):
+        """Cache vom Server abgelehnt (abgelaufen/gelöscht) -> Registry-Eintrag verwerfen, inline senden."""
+        context_cache.invalidate(self.key, self.cached)
+        self.cached = None
+        self.payload.pop("cachedContent", None)
+        self.payload.update(_static_prefix())
+
+def warm_context_cache():
+    """Legt die Caches aller Keys im Hintergrund an (nach dem Laden der MCP Tools), damit der erste Request nicht wartet."""
+    static = _static_prefix()
+    for key in GEMINI_KEYS:
+        threading.Thread(target=context_cache.lookup, args=(key, static), daemon=True).start()
+
+def _post(request, stream=False):
+    """Sendet den nächsten Step. Kennt der Server den Cache nicht mehr, einmal inline wiederholen."""
+    request.payload['contents'] = request.contents()
+    resp = session.post(request.url(stream), json=request.payload, timeout=40, stream=stream)
+    if resp.status_code != 200 and request.cached and "cache" in resp.text.lower():
+        print(f" [Cache] {request.cached} abgelehnt ({resp.status_code}), sende Prompt inline", flush=True)
+        resp.close()
+        request.uncache()
+        resp = session.post(request.url(stream), json=request.payload, timeout=40, stream=stream)
+    return resp
+
+def _device_line(dev):
+    # Basis: Name und Status (z.B. "- Wohnzimmer Lampe (on)")
+    info = f"- {dev['name']} [ID: {dev['entity_id']}] ({dev['state']})"
     
-    trim_history()
+    # Attribute hinzufügen (z.B. "[brightness: 150, temperature: 22]")
+    if 'attributes' in dev and dev['attributes']:
+        attrs = []
+        for k, v in dev['attributes'].items():
+            if k != 'friendly_name':
+                attrs.append(f"{k}: {v}")
+        if attrs:
+            info += f" {{{', '.join(attrs)}}}"
+    return info
+
+def _build_payload(text_prompt, audio_data, query=None):
+    """
+    Hängt den User-Turn an die History an und baut den Request (dynamischer Kontext, Thinking).
+    `query`: die eigentliche Anfrage des Users für die Geräte-Auswahl (Default: text_prompt).
+    """
+    # Alte Interaktionen abflachen / gegen HISTORY_TOKEN_BUDGET kürzen (in place, siehe core/history.py)
+    CONVERSATION_HISTORY.compact()
 
     # 1. build user input
     parts = []
@@ -260,29 +256,25 @@ def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False):
             }
         })
     
-    CONVERSATION_HISTORY.append({"role": "user", "parts": parts})
+    user_turn = {"role": "user", "parts": parts}
+    CONVERSATION_HISTORY.append(user_turn)
     
     now_str = datetime.datetime.now().strftime("%A, %d. %B %Y, %H:%M Uhr")
     
     # Prüfen, ob der neue detaillierte Kontext verfügbar ist
     if getattr(state, 'HA_CONTEXT', None):
-        device_lines = []
-        for dev in state.HA_CONTEXT:
-            # Basis: Name und Status (z.B. "- Wohnzimmer Lampe (on)")
-            info = f"- {dev['name']} [ID: {dev['entity_id']}] ({dev['state']})"
-            
-            # Attribute hinzufügen (z.B. "[brightness: 150, temperature: 22]")
-            if 'attributes' in dev and dev['attributes']:
-                attrs = []
-                for k, v in dev['attributes'].items():
-                    if k != 'friendly_name':
-                        attrs.append(f"{k}: {v}")
-                if attrs:
-                    info += f" {{{', '.join(attrs)}}}"
-            
-            device_lines.append(info)
-        
-        device_list_str = "\n".join(device_lines)
+        # Nur die zur Anfrage passenden Geräte (plus ENTITY_PINNED), siehe services/entity_index.py
+        all_devices = state.HA_CONTEXT
+        devices, reason = entity_index.select(text_prompt if query is None else query, all_devices)
+        device_list_str = "\n".join(_device_line(dev) for dev in devices)
+        if reason == "top-k":
+            full_chars = sum(len(_device_line(dev)) + 1 for dev in all_devices)
+            print(f" [Entities] {len(devices)}/{len(all_devices)} Geräte im Prompt: "
+                  f"~{full_chars // 4} -> ~{len(device_list_str) // 4} Tokens", flush=True)
+            device_list_str += (f"\n(Auswahl: {len(devices)} von {len(all_devices)} Geräten passend zur Anfrage. "
+                                f"Andere Geräte findest du mit 'find_devices'.)")
+        else:
+            print(f" [Entities] Alle {len(all_devices)} Geräte im Prompt ({reason}), ~{len(device_list_str) // 4} Tokens", flush=True)
         
     elif state.AVAILABLE_LIGHTS:
         # Fallback für Kompatibilität
@@ -293,25 +285,21 @@ def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False):
     else:
         device_list_str = "Keine Geräte gefunden."
 
-    people_locs = ha.get_all_person_locations()
+    # Vorab geladen, sobald der User zu sprechen beginnt (siehe core/prefetch.py)
+    people_locs = prefetcher.get("person_locations")
 
-    # Payload erstellen (jetzt mit device_list_str statt device_list)
+    context_text = CONTEXT_TEMPLATE.format(
+        time_str=now_str,
+        people_locations=people_locs,
+        devices=device_list_str,
+        habits_summary=prefetcher.get("habits"),
+        wakeup_status=state.WAKEUP_REASON + (" (AUTONOM)" if state.WAKEUP_REASON != "Initial Start" else ""),
+        wakeup_count=state.WAKEUP_COUNT,
+        planned_wakeup=f"{datetime.datetime.fromtimestamp(state.NEXT_WAKEUP).strftime('%H:%M')} Uhr ({state.WAKEUP_REASON})" if state.NEXT_WAKEUP else "Nicht geplant"
+    )
+
+    # System Prompt + Tools hängt _SlowBrainRequest an (cachedContent oder inline)
     payload = {
-        "system_instruction": {
-            "parts": [{
-                "text": SYSTEM_PROMPT_TEMPLATE.format(
-                    time_str=now_str,
-                    people_locations=people_locs,
-                    devices=device_list_str,
-                    habits_summary=routine.tracker.get_habits_summary(),
-                    wakeup_status=state.WAKEUP_REASON + (" (AUTONOM)" if state.WAKEUP_REASON != "Initial Start" else ""),
-                    wakeup_count=state.WAKEUP_COUNT,
-                    planned_wakeup=f"{datetime.datetime.fromtimestamp(state.NEXT_WAKEUP).strftime('%H:%M')} Uhr ({state.WAKEUP_REASON})" if state.NEXT_WAKEUP else "Nicht geplant"
-                )
-            }]
-        },
-        "contents": list(CONVERSATION_HISTORY),
-        "tools": [{"function_declarations": FUNCTION_DECLARATIONS}],
         "safetySettings": SAFETY_SETTINGS,
         "generationConfig": {
             "thinkingConfig": {
@@ -320,15 +308,59 @@ def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False):
             }
         }
     }
+    return _SlowBrainRequest(payload, user_turn, context_text)
+
+def _execute_function_calls(function_calls, silent_mode, step_span):
+    """Führt die functionCall-Parts eines Steps (parallel) aus und liefert die functionResponse-Parts in gleicher Reihenfolge."""
+    calls = [(call['functionCall']['name'], call['functionCall'].get('args', {})) for call in function_calls]
+    with trace.use(step_span):
+        results = execute_tools(calls, silent_mode=silent_mode)
+    tool_responses = []
+    for (name, _), res in zip(calls, results):
+        tool_responses.append({
+            "functionResponse": {
+                "name": name, "response": {"result": str(res)}
+            }
+        })
+    return tool_responses
+
+def _cost_eur(total_input_tokens, total_output_tokens, total_cached_tokens=0):
+    cost_usd = ((total_input_tokens - total_cached_tokens) / 1_000_000 * PRICE_PER_M_INPUT) + \
+               (total_cached_tokens / 1_000_000 * PRICE_PER_M_CACHED) + \
+               (total_output_tokens / 1_000_000 * PRICE_PER_M_OUTPUT)
+    return cost_usd * 0.95 # Rough USD to EUR conversion
+
+def _report_usage(steps, total_input_tokens, total_output_tokens, total_cached_tokens):
+    cost_eur = _cost_eur(total_input_tokens, total_output_tokens, total_cached_tokens)
+    print(f"💰 KOSTEN CHECK (Schritte: {steps}), Kosten: ~{cost_eur:.6f} €")
+    share = total_cached_tokens / total_input_tokens * 100 if total_input_tokens else 0.0
+    print(f" [Cache] Prompt: {total_cached_tokens} gecacht / {total_input_tokens - total_cached_tokens} ungecacht ({share:.0f}% aus dem Cache)", flush=True)
+
+def _clean_text(text):
+    # SICHERHEITSNETZ: Entfernt Markdown-Reste, falls das LLM nicht hört
+    return text.replace("*", "").replace("#", "").replace("`", "")
+
+class _StepFailed(Exception):
+    """Step ohne verwertbare Antwort, `args[0]` ist der Text für den User."""
+
+def _run_agent_loop(leds, text_prompt, audio_data, silent_mode, query, transport, on_final=None, stream=False):
+    """
+    Agentic Loop für ask_gemini und ask_gemini_stream: Payload bauen, Steps senden,
+    Function Calls ausführen, History pflegen, Kosten loggen.
+    `transport(request, step_span)` sendet einen Step und liefert (parts, usageMetadata, stopped),
+    `on_final()` läuft vor dem Kosten-Log des letzten Steps.
+    """
+    from jarvis.config import DIM_PURPLE 
+    if not silent_mode:
+        leds.pattern = Pattern.breathe(2000)
+        leds.update(leds.rgb_pattern(DIM_PURPLE))
+    
+    request = _build_payload(text_prompt, audio_data, query)
 
     total_input_tokens = 0
     total_output_tokens = 0
-    
-    # Prices for Gemini 2.5 Flash (as of Feb 2026, USD)
-    # Input: $0.30 / 1M tokens
-    # Output: $2.50 / 1M tokens
-    PRICE_PER_M_INPUT = 0.30
-    PRICE_PER_M_OUTPUT = 2.50
+    total_cached_tokens = 0
+    step_span = trace.NULL_SPAN
 
     try:
         # --- AGENTIC LOOP ---
@@ -336,45 +368,29 @@ def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False):
         step_count = 0
 
         while step_count < MAX_STEPS:
-            payload['contents'] = list(CONVERSATION_HISTORY)
-            
-            resp = session.post(get_gemini_url(), json=payload, timeout=40)
-            if resp.status_code != 200: 
-                print(f"API Error: {resp.text}")
-                return "Fehler bei der Verbindung."
-
-            result = resp.json()
+            # Ein Span pro Agentic Step: Gemini Request + Tool Calls
+            span_attrs = {"stream": True} if stream else {}
+            step_span = trace.start_span("llm_step", step=step_count + 1, **span_attrs) if trace.current() else trace.NULL_SPAN
+            parts_list, usage, stopped = transport(request, step_span)
             
             # count tokens
-            usage = result.get('usageMetadata', {})
             t_in = usage.get('promptTokenCount', 0)
             t_out = usage.get('candidatesTokenCount', 0)
+            t_cached = usage.get('cachedContentTokenCount', 0)
             total_input_tokens += t_in
             total_output_tokens += t_out
+            total_cached_tokens += t_cached
+            step_span.set(input_tokens=t_in, output_tokens=t_out, cached_tokens=t_cached)
 
-            if 'candidates' not in result or not result['candidates']:
+            if not parts_list:
+                step_span.end(empty=True)
                 return "Keine Antwort von Google."
 
-            candidate = result['candidates'][0]
-            content = candidate.get('content', {})
-            parts_list = content.get('parts', [])
-
-            #print("\n[DEBUG] Raw Parts from Gemini:")
-            #for i, p in enumerate(parts_list):
-            #    print(f" Part {i}: {p}")
-            
             # Parsing (Thoughts vs Text vs Tools)
-            thoughts_log = []
-            final_text_parts = []
-            function_calls = []
-
-            for p in parts_list:
-                if 'functionCall' in p:
-                    function_calls.append(p)
-                elif p.get('thought', False):
-                    thoughts_log.append(p.get('text', ''))
-                elif 'text' in p:
-                    final_text_parts.append(p.get('text', ''))
+            thoughts_log = [p.get('text', '') for p in parts_list if p.get('thought', False) and 'functionCall' not in p]
+            function_calls = [p for p in parts_list if 'functionCall' in p]
+            final_text_parts = [p.get('text', '') for p in parts_list
+                                if 'text' in p and not p.get('thought', False) and 'functionCall' not in p]
 
             if thoughts_log:
                 print(f"\n[{step_count+1}/{MAX_STEPS}] 🧠 JARVIS GEDANKEN ({t_out} Tokens):")
@@ -382,53 +398,172 @@ def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False):
                     print(f"- {t}")
                 print("-" * 30)
 
-            if function_calls:
+            if function_calls and not stopped:
                 print(f"  [Tools] Step {step_count+1}: Executing {len(function_calls)} calls...")
-                tool_responses = []
-                for call in function_calls:
-                    fn = call['functionCall']
-                    try:
-                        res = execute_tool(fn['name'], fn.get('args', {}), silent_mode=silent_mode)
-                    except Exception as tool_err:
-                        res = f"Error: {tool_err}"
-                    tool_responses.append({
-                        "functionResponse": {
-                            "name": fn['name'], "response": {"result": str(res)}
-                        }
-                    })
+                tool_responses = _execute_function_calls(function_calls, silent_mode, step_span)
                 
                 with HISTORY_LOCK:
                     CONVERSATION_HISTORY.append({"role": "model", "parts": _strip_thought_signature(parts_list)})
                     CONVERSATION_HISTORY.append({"role": "function", "parts": tool_responses})
                 
+                step_span.end(tool_calls=len(function_calls))
                 step_count += 1
                 continue 
-            
-            else:
-                cost_usd = (total_input_tokens / 1_000_000 * PRICE_PER_M_INPUT) + \
-                           (total_output_tokens / 1_000_000 * PRICE_PER_M_OUTPUT)
-                cost_eur = cost_usd * 0.95 # Rough USD to EUR conversion
-                
-                # Log only the FINAL request payload that produced the user-visible answer
-                #try:
-                #    print("\n[Slow Brain] Final Gemini request payload:")
-                #    print(json.dumps(payload, indent=2, ensure_ascii=False))
-                #except Exception as log_err:
-                #    print(f"[LLM] Could not log Gemini payload: {log_err}")
 
-                print(f"💰 KOSTEN CHECK (Schritte: {step_count+1}), Kosten: ~{cost_eur:.6f} €")
+            if on_final:
+                on_final()
+            _report_usage(step_count + 1, total_input_tokens, total_output_tokens, total_cached_tokens)
 
-                text = "".join(final_text_parts)
+            text = _clean_text("".join(final_text_parts))
 
-                # SICHERHEITSNETZ: Entfernt Markdown-Reste, falls das LLM nicht hört
-                text = text.replace("*", "").replace("#", "").replace("`", "")
-
-                with HISTORY_LOCK:
-                    CONVERSATION_HISTORY.append({"role": "model", "parts": _strip_thought_signature(parts_list)})
-                return text
+            with HISTORY_LOCK:
+                CONVERSATION_HISTORY.append({"role": "model", "parts": _strip_thought_signature(parts_list)})
+            step_span.end(final=True, **({"stopped": True} if stopped else {}))
+            return text
 
         return "Abbruch: Zu komplex."
 
+    except _StepFailed as e:
+        return e.args[0]
     except Exception as e:
-        print(f" [LLM Loop Error] {e}")
-        return "Systemfehler."
\ No newline at end of file
+        step_span.end(error=e.__class__.__name__)
+        print(f" [LLM {'Stream' if stream else 'Loop'} Error] {e}")
+        return "Systemfehler."
+
+def _check_status(resp, step_span):
+    if resp.status_code != 200: 
+        step_span.end(status=resp.status_code)
+        print(f"API Error: {resp.text}")
+        raise _StepFailed("Fehler bei der Verbindung.")
+
+def ask_gemini(leds, text_prompt=None, audio_data=None, silent_mode=False, query=None):
+    def transport(request, step_span):
+        with trace.use(step_span):
+            resp = _post(request)
+        _check_status(resp, step_span)
+        result = resp.json()
+        candidates = result.get('candidates') or []
+        parts_list = candidates[0].get('content', {}).get('parts', []) if candidates else []
+        return parts_list, result.get('usageMetadata', {}), False
+
+    return _run_agent_loop(leds, text_prompt, audio_data, silent_mode, query, transport)
+
+# --- STREAMING (Text Mode mit frühem TTS) ---
+# Abkürzungen, nach denen ein Punkt kein Satzende ist
+_ABBREVIATIONS = {"z.b", "d.h", "u.a", "o.ä", "bzw", "ca", "usw", "etc", "nr", "dr", "st", "min", "std", "evtl", "ggf", "inkl", "vgl", "mio", "mrd", "max"}
+_SENTENCE_END = re.compile(r'[.!?…]+["»“)]?\s+|\n+')
+_SESSION_TAGS = re.compile(r'<SESSION:(KEEP|CLOSE)>')
+
+class SentenceSplitter:
+    """
+    Zerlegt gestreamten Text in fertige Sätze für das TTS. Ein Satz endet an
+    Satzzeichen + Leerraum (oder Zeilenumbruch), nicht nach Abkürzungen oder Zahlen
+    ("z.B.", "18.10."). Sätze kürzer als `min_chars` werden mit dem nächsten
+    zusammengefasst (ein TTS-Request pro Fetzen lohnt nicht).
+    """
+    def __init__(self, min_chars=STREAM_TTS_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buf = ""
+
+    def feed(self, text):
+        self._buf += text
+        sentences = []
+        start = 0
+        for m in _SENTENCE_END.finditer(self._buf):
+            if m.group().startswith("."):
+                words = self._buf[start:m.start()].split()
+                word = words[-1].lower() if words else ""
+                if word in _ABBREVIATIONS or re.fullmatch(r'[\d.]+', word):
+                    continue
+            if len(self._buf[start:m.end()].strip()) < self.min_chars:
+                continue
+            sentences.append(self._buf[start:m.end()].strip())
+            start = m.end()
+        self._buf = self._buf[start:]
+        return sentences
+
+    def flush(self):
+        rest, self._buf = self._buf.strip(), ""
+        return rest
+
+def _iter_sse(resp):
+    """JSON-Objekte aus einer SSE-Antwort (Zeilen "data: {...}")."""
+    for line in resp.iter_lines():
+        if not line:
+            continue
+        decoded = line.decode('utf-8').strip()
+        if decoded.startswith("data:"):
+            data = decoded[5:].strip()
+            if data:
+                yield json.loads(data)
+
+def _merge_stream_parts(parts):
+    """Fügt die Text-Fragmente der Stream-Chunks wieder zu Parts zusammen (für die History)."""
+    merged = []
+    for p in parts:
+        prev = merged[-1] if merged else None
+        if ('text' in p and prev is not None and 'text' in prev and 'functionCall' not in prev
+                and bool(prev.get('thought')) == bool(p.get('thought'))):
+            prev['text'] += p['text']
+            if 'thoughtSignature' in p:
+                prev['thoughtSignature'] = p['thoughtSignature']
+        else:
+            merged.append(dict(p))
+    return merged
+
+def ask_gemini_stream(leds, text_prompt=None, audio_data=None, silent_mode=False, on_sentence=None, should_stop=None, query=None):
+    """
+    Wie ask_gemini, aber über streamGenerateContent (SSE): fertige Sätze der Antwort
+    gehen schon während der Generierung an `on_sentence` (TTS-Pipeline).
+    Function Calls werden wie gewohnt ausgeführt, danach streamt der nächste Step.
+    Nach "<SILENT>" wird nichts mehr weitergegeben, Session-Tags werden entfernt.
+    `should_stop()`: True bricht den Stream ab (z.B. User hat unterbrochen).
+    `query`: Anfrage des Users ohne Memory-Kontext (für die Geräte-Auswahl).
+    Rückgabe: kompletter Text (wie ask_gemini).
+    """
+    splitter = SentenceSplitter()
+    spoken_text = []   # alles bisherige (für die <SILENT> Prüfung)
+    t_start = time.monotonic()
+    first_sentence_at = None
+
+    def emit(sentences):
+        nonlocal first_sentence_at
+        for sentence in sentences:
+            if "<SILENT>" in "".join(spoken_text):
+                return
+            sentence = _clean_text(_SESSION_TAGS.sub("", sentence)).strip()
+            if sentence and on_sentence:
+                if first_sentence_at is None:
+                    first_sentence_at = time.monotonic()
+                on_sentence(sentence)
+
+    def transport(request, step_span):
+        raw_parts = []
+        usage = {}
+        with trace.use(step_span):
+            resp = _post(request, stream=True)
+        _check_status(resp, step_span)
+
+        stopped = False
+        with resp:
+            for chunk in _iter_sse(resp):
+                usage = chunk.get('usageMetadata', usage)
+                for cand in chunk.get('candidates', [])[:1]:
+                    for p in cand.get('content', {}).get('parts', []):
+                        raw_parts.append(p)
+                        if 'text' in p and not p.get('thought', False):
+                            spoken_text.append(p['text'])
+                            emit(splitter.feed(p['text']))
+                if should_stop and should_stop():
+                    stopped = True
+                    break
+        return _merge_stream_parts(raw_parts), usage, stopped
+
+    def on_final():
+        # Rest der Antwort (letzter Satz ohne abschließenden Leerraum)
+        emit([splitter.flush()])
+        if first_sentence_at is not None:
+            print(f" [Latency] Slow Brain stream: first sentence after {(first_sentence_at - t_start) * 1000:.0f} ms, "
+                  f"complete after {(time.monotonic() - t_start) * 1000:.0f} ms", flush=True)
+
+    return _run_agent_loop(leds, text_prompt, audio_data, silent_mode, query, transport, on_final, stream=True)
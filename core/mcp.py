@@ -2,6 +2,7 @@ import asyncio
 import threading
 from mcp import ClientSession
 from mcp.client.sse import sse_client
+from jarvis.core import trace
 
 class MCPManager:
     def __init__(self):
@@ -118,10 +119,11 @@ class MCPManager:
                 return f"Fehler: MCP Server '{server_name}' ist offline (Reconnect läuft...)"
 
             try:
-                result = await asyncio.wait_for(
-                    session.call_tool(original_name, arguments=args),
-                    timeout=60.0 
-                )
+                with trace.span("mcp", server=server_name, tool=original_name, attempt=attempt + 1):
+                    result = await asyncio.wait_for(
+                        session.call_tool(original_name, arguments=args),
+                        timeout=60.0 
+                    )
                 
                 if hasattr(result, 'isError') and result.isError:
                     error_msg = "\n".join([b.text for b in result.content if getattr(b, 'type', '') == 'text'])
@@ -0,0 +1,117 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jarvis import config
+from jarvis.services import ha, memory, routine
+
+class _Entry:
+    def __init__(self):
+        self.value = None
+        self.loaded_at = 0.0   # time.monotonic() des letzten fertigen Ladens
+        self.load_s = 0.0      # Dauer des letzten Ladens (= gesparte Zeit bei einem Treffer)
+        self.future = None     # laufender Prefetch
+        self.generation = 0    # +1 bei invalidate(): Ergebnisse älterer Ladevorgänge werden verworfen
+
+class ContextPrefetcher:
+    """
+    Spekulatives Vorladen des Slow-Brain Kontexts. Der Router ruft prefetch() auf,
+    sobald die Eingabe-Transkription einer Äußerung beginnt; bis delegate_to_backend
+    kommt (bzw. ask_gemini den Prompt baut), liegen die Werte meist schon bereit.
+
+    get(name) liefert den Wert aus dem Cache, solange er jünger als PREFETCH_TTL ist,
+    wartet auf einen laufenden Prefetch, oder lädt sonst selbst (Miss).
+    Zählt Treffer/Misses und die gesparte Wartezeit.
+    """
+    def __init__(self, loaders, ttl=None):
+        self.loaders = loaders
+        self.ttl = config.PREFETCH_TTL if ttl is None else ttl
+        self._entries = {name: _Entry() for name in loaders}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="prefetch")
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.saved_s = 0.0
+
+    def _fresh(self, entry, now):
+        return entry.loaded_at and now - entry.loaded_at < self.ttl
+
+    def _load(self, name):
+        entry = self._entries[name]
+        generation = entry.generation
+        start = time.monotonic()
+        value = self.loaders[name]()
+        end = time.monotonic()
+        with self._lock:
+            if entry.generation == generation:
+                entry.value, entry.loaded_at, entry.load_s = value, end, end - start
+        return value
+
+    def invalidate(self, name):
+        """Verwirft den gecachten Wert (und einen laufenden Prefetch), z.B. nach einem Schreibzugriff."""
+        with self._lock:
+            entry = self._entries[name]
+            entry.generation += 1
+            entry.loaded_at = 0.0
+            entry.future = None
+
+    def prefetch(self, names=None):
+        """Startet das Laden aller (bzw. der genannten) Werte, die nicht frisch sind oder schon laufen."""
+        now = time.monotonic()
+        with self._lock:
+            for name in names or self.loaders:
+                entry = self._entries[name]
+                if self._fresh(entry, now) or (entry.future and not entry.future.done()):
+                    continue
+                entry.future = self._executor.submit(self._load, name)
+                self.prefetches += 1
+
+    def get(self, name):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries[name]
+            if self._fresh(entry, now):
+                self.hits += 1
+                self.saved_s += entry.load_s
+                return entry.value
+            future = entry.future if entry.future and not entry.future.done() else None
+        if future is not None:
+            try:
+                value = future.result()
+                with self._lock:
+                    self.waits += 1
+                    # Nur der Teil des Ladens, der schon vor der Anfrage lief, ist gespart
+                    self.saved_s += max(0.0, entry.load_s - (time.monotonic() - now))
+                return value
+            except Exception as e:
+                print(f" [Prefetch] {name} failed: {e}", flush=True)
+        with self._lock:
+            self.misses += 1
+        return self._load(name)
+
+    def requests(self):
+        return self.hits + self.waits + self.misses
+
+    def format_stats(self, reset=True):
+        total = self.requests()
+        rate = (self.hits + self.waits) / total * 100 if total else 0.0
+        text = (f" [Prefetch] {self.hits} hits, {self.waits} waited, {self.misses} misses ({rate:.0f}% prefetched) | "
+                f"{self.prefetches} prefetches | saved {self.saved_s * 1000:.0f} ms")
+        if reset:
+            self._reset_stats()
+        return text
+
+# Slow-Brain Kontext: get_hybrid_context lädt nur die Core Memory (unabhängig von der Anfrage)
+prefetcher = ContextPrefetcher({
+    "hybrid_context": lambda: memory.get_hybrid_context(None),
+    "person_locations": ha.get_all_person_locations,
+    "habits": lambda: routine.tracker.get_habits_summary(),
+})
+
+# save_memory & Co. ändern die Core Memory -> nicht bis zu PREFETCH_TTL den alten Stand liefern
+memory.on_core_change(lambda: prefetcher.invalidate("hybrid_context"))
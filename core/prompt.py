@@ -0,0 +1,239 @@
+import hashlib
+import itertools
+import threading
+import time
+
+from google.genai import types
+
+from jarvis import config, state
+from jarvis.services import memory
+
+# Recent conversation is injected into the system instruction within this window
+HISTORY_WINDOW_SECONDS = 900
+HISTORY_TURNS = 6
+
+_HEADER = '''Du bist Jarvis, das superschnelle Fast Brain des Smart Homes.
+Antworte immer in der Sprache des Nutzers (meistens Deutsch). Antworte als Peer, kurz und prägnant.
+'''
+
+_RULES = '''
+=== CRITICAL RULES (FAST BRAIN VS SLOW BRAIN) ===
+Du bist für EINFACHE, SOFORTIGE Aktionen zuständig.
+1. FAST BRAIN AUFGABEN:
+   - Geräte schalten (control_device, control_media) MUSS mit entity_id aufgerufen werden!
+   - Wettervorhersage abrufen (get_weather_forecast)
+   - Termine lesen (get_calendar_events)
+   - Timer/Wecker setzen (manage_timer_alarm)
+   - Erinnerungen speichern (save_memory)
+   - Erinnerungen suchen (retrieve_memory) - WICHTIG: Nutze dies, wenn der User nach Dingen fragt, die in der Vergangenheit liegen!
+2. SLOW BRAIN (DELEGATE):
+   - Wenn eine Aufgabe MEHRERE SCHRITTE erfordert (z.B. "Recherchiere X und fasse zusammen", oder "Starte meine Gute Nacht Routine").
+   - Wenn Python-Code ausgeführt werden muss (Berechnungen, Deep Web-Scraping).
+   - In diesen Fällen rufst du ZWINGEND "delegate_to_backend" auf. Versuche NIEMALS komplexe Routinen selbst auszuführen!
+3. KOMMUNIKATION:
+   - Nach erfolgreichem Toolaufruf antworte ultrakurz (z.B. "Ok", "Erledigt", "Licht ist an").
+   - Wenn "delegate_to_backend" antwortet, lies die exakte Antwort flüssig vor, füge KEINE Floskeln hinzu.
+   - Nutze das Tool "end_conversation", wenn die Konversation beendet werden soll, z.B. wenn der User "Danke.", "Stop!", "Das wars." sagt.
+'''
+
+# --- SECTION RENDERERS ---
+def render_core_memory(core_content):
+    return f'''
+=== CORE MEMORY (DEIN WISSEN ÜBER DEN USER) ===
+{core_content}
+'''
+
+def render_devices(ha_context, available_lights):
+    if ha_context:
+        device_lines = []
+        for dev in ha_context:
+            device_lines.append(f"- {dev['name']} [ID: {dev['entity_id']}] ({dev['state']})")
+        device_list_str = "\n".join(device_lines)
+    elif available_lights:
+        device_list_str = "\n".join(f"- {name} [ID: {eid}]" for name, eid in available_lights.items())
+    else:
+        device_list_str = "Keine Geräte gefunden."
+    return f'''
+=== VERFÜGBARE GERÄTE (STATE) ===
+{device_list_str}
+'''
+
+def render_history(history):
+    history_lines = []
+    # Take the last turns (approx 3 user/assistant pairs) to avoid huge prompts
+    recent_history = list(itertools.islice(history, max(0, len(history) - HISTORY_TURNS), len(history)))
+    for turn in recent_history:
+        role = "Jarvis" if turn.get("role") == "model" else "Paul"
+        # Attempt to extract text content, fallback to str representation
+        parts = turn.get("parts", [])
+        if isinstance(parts, list) and len(parts) > 0:
+            try:
+                content = parts[0].get("text", str(parts[0]))
+            except AttributeError:
+                content = str(parts[0])
+        else:
+            content = str(parts)
+        history_lines.append(f"{role}: {content}")
+    if not history_lines:
+        return ""
+    return ("\n=== RECENT CONVERSATION (LETZTE 15 MIN) ===\n"
+            "(Beziehe dich darauf, falls der User etwas aus dem direkten Kontext fragt)\n"
+            + "\n".join(history_lines) + "\n")
+
+def _same_key(a, b):
+    # Das Objekt selbst (nicht id()) im Key halten: eine freigegebene Liste kann ihre id weitergeben
+    return a is not None and b is not None and a[0] is b[0] and a[1:] == b[1:]
+
+class _Section:
+    def __init__(self, name):
+        self.name = name
+        self.key = None    # billiger Fingerprint der Eingaben: (Objekt, Längen...), Objekt per Identität
+        self.text = ""
+        self.digest = ""   # Hash des gerenderten Texts, ändert sich nur wenn der Inhalt sich ändert
+        self.builds = 0
+        self.build_ms = 0.0
+
+    def set(self, text, build_ms):
+        self.text = text
+        self.digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        self.builds += 1
+        self.build_ms = build_ms
+
+class PromptAssembler:
+    """
+    Fast Brain System Instruction aus vorgerenderten Abschnitten.
+
+    - core: Mem0 Core Memory. Wird nie beim Wake geladen, sondern von einem
+      Hintergrund-Thread (alle CORE_MEMORY_REFRESH s und sofort nach Schreibzugriffen
+      über memory.on_core_change).
+    - devices: state.HA_CONTEXT. Neu gerendert nur wenn main die Liste ersetzt hat
+      (Identität/Länge als Fingerprint).
+    - history: letzte Turns aus state.CONVERSATION_HISTORY, Fingerprint = Länge + letzter Turn.
+
+    build() prüft nur die Fingerprints und fügt die fertigen Texte zusammen. Der
+    mitgelieferte Fingerprint (Abschnitt -> Digest) erlaubt dem Router festzustellen,
+    welche Abschnitte einer vorab verbundenen Session inzwischen veraltet sind
+    (changed_sections()). on_core_change(callback) meldet, wenn der Hintergrund-Refresh
+    eine geänderte Core Memory geladen hat (der Router baut dann die warme Verbindung neu).
+    """
+    def __init__(self):
+        self._core = _Section("core")
+        self._devices = _Section("devices")
+        self._history = _Section("history")
+        self._lock = threading.Lock()
+        self._core_dirty = threading.Event()
+        self._thread = None
+        self.core_refreshes = 0
+        self.last_build_ms = 0.0
+        self._core_listeners = []
+
+    # --- CORE MEMORY (Hintergrund) ---
+    def start(self):
+        if self._thread is None:
+            memory.on_core_change(self.invalidate_core)
+            self._thread = threading.Thread(target=self._core_loop, daemon=True)
+            self._thread.start()
+
+    def on_core_change(self, callback):
+        self._core_listeners.append(callback)
+
+    def invalidate_core(self):
+        self._core_dirty.set()
+
+    def refresh_core(self):
+        t0 = time.perf_counter()
+        try:
+            core_content = memory.get_hybrid_context(None)
+        except Exception as e:
+            print(f" [Prompt] Could not load Core Memory from Mem0: {e}")
+            if self._core.builds:
+                return False  # alten Stand behalten
+            core_content = ""
+        text = render_core_memory(core_content)
+        with self._lock:
+            changed = text != self._core.text
+            if changed or not self._core.builds:
+                self._core.set(text, (time.perf_counter() - t0) * 1000)
+        self.core_refreshes += 1
+        return changed
+
+    def _core_loop(self):
+        while True:
+            try:
+                if self.refresh_core():
+                    print(f" [Prompt] Core Memory aktualisiert ({self._core.build_ms:.0f} ms)", flush=True)
+                    for callback in self._core_listeners:
+                        callback()
+            except Exception as e:
+                print(f" [Prompt] Core refresh error: {e}")
+            self._core_dirty.wait(timeout=config.CORE_MEMORY_REFRESH)
+            self._core_dirty.clear()
+
+    # --- CHEAP SECTIONS ---
+    def _update_devices(self):
+        ha_context = getattr(state, 'HA_CONTEXT', None)
+        key = (ha_context, len(ha_context or ()), len(state.AVAILABLE_LIGHTS))
+        if _same_key(key, self._devices.key):
+            return
+        t0 = time.perf_counter()
+        text = render_devices(ha_context, state.AVAILABLE_LIGHTS)
+        self._devices.key = key
+        self._devices.set(text, (time.perf_counter() - t0) * 1000)
+
+    def _update_history(self, include):
+        history = getattr(state, 'CONVERSATION_HISTORY', None) if include else None
+        key = (history[-1], len(history)) if history else None
+        if self._history.builds and (key is self._history.key or _same_key(key, self._history.key)):
+            return
+        t0 = time.perf_counter()
+        text = render_history(history) if history else ""
+        self._history.key = key
+        self._history.set(text, (time.perf_counter() - t0) * 1000)
+
+    # --- ASSEMBLY ---
+    def build(self, include_history):
+        """Liefert (types.Content, fingerprint). `include_history`: Aufrufer prüft HISTORY_WINDOW_SECONDS."""
+        t0 = time.perf_counter()
+        if not self._core.builds:
+            # Erster Aufruf vor dem Hintergrund-Refresh: einmalig synchron laden
+            self.refresh_core()
+        with self._lock:
+            self._update_devices()
+            self._update_history(include_history)
+            text = _HEADER + self._core.text + self._devices.text + self._history.text + _RULES
+            fingerprint = self._fingerprint()
+        self.last_build_ms = (time.perf_counter() - t0) * 1000
+        return types.Content(role="system", parts=[types.Part.from_text(text=text)]), fingerprint
+
+    def _fingerprint(self):
+        return {s.name: s.digest for s in (self._core, self._devices, self._history)}
+
+    def changed_sections(self, fingerprint, include_history):
+        """
+        Vergleicht einen früheren Fingerprint mit dem aktuellen Stand und gibt
+        {abschnitt: aktueller Text} für alle geänderten Abschnitte zurück.
+        """
+        with self._lock:
+            self._update_devices()
+            self._update_history(include_history)
+            current = self._fingerprint()
+            sections = {s.name: s for s in (self._core, self._devices, self._history)}
+            return {name: sections[name].text for name, digest in current.items() if fingerprint.get(name) != digest}
+
+    def stats(self):
+        return {
+            "build_ms": self.last_build_ms,
+            "core_ms": self._core.build_ms,
+            "devices_ms": self._devices.build_ms,
+            "history_ms": self._history.build_ms,
+            "core_refreshes": self.core_refreshes,
+            "builds": {s.name: s.builds for s in (self._core, self._devices, self._history)},
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        b = s["builds"]
+        return (f" [Prompt] Build {s['build_ms']:.2f} ms | core {s['core_ms']:.0f} ms ({b['core']}x) | "
+                f"devices {s['devices_ms']:.1f} ms ({b['devices']}x) | history {s['history_ms']:.1f} ms ({b['history']}x)")
+
+assembler = PromptAssembler()
@@ -1,4 +1,6 @@
 # jarvis/core/tools.py
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import jarvis.services.ha as ha
 import jarvis.services.system as system
 import jarvis.services.timer as timer
@@ -6,8 +8,10 @@ import jarvis.services.google as google
 import jarvis.services.sfx as sfx
 import jarvis.services.memory as memory
 import jarvis.services.navigation as navigation
+from jarvis.services.entity_index import entity_index
 from jarvis import config
 from jarvis.core.mcp import mcp_client
+from jarvis.core import trace
 
 # 1. Definitions
 FUNCTION_DECLARATIONS = [
@@ -100,6 +104,17 @@ FUNCTION_DECLARATIONS = [
             "required": ["device_name"]
         }
     },
+    {
+        "name": "find_devices",
+        "description": "Sucht Smart-Home Geräte (Name, Raum, Typ) und liefert ihre IDs mit Status. Nutze dies, wenn das gesuchte Gerät nicht in deiner Geräteliste steht.",
+        "parameters": {
+            "type": "OBJECT",
+            "properties": {
+                "query": { "type": "STRING", "description": "Suchbegriffe, z.B. 'Küche Licht' oder 'Heizung Bad'." }
+            },
+            "required": ["query"]
+        }
+    },
     {
         "name": "manage_shopping_list",
         "description": "Verwaltet die Einkaufsliste. Kann Dinge hinzufügen, löschen oder vorlesen.",
@@ -329,6 +344,7 @@ TOOL_IMPLEMENTATIONS = {
     'control_device': ha.execute_device_control,
     'control_media': ha.execute_media_control,
     'get_device_state': ha.get_ha_device_state,
+    'find_devices': entity_index.find_devices,
     'get_calendar_events': ha.get_ha_calendar_events,
     'add_calendar_event': ha.add_ha_calendar_event,
     'play_specific_music': ha.execute_play_music,
@@ -351,8 +367,118 @@ TOOL_IMPLEMENTATIONS = {
     'end_conversation': lambda **kwargs: "Konversation wird beendet.",
 }
 
+# 3. Parallel Execution (Slow Brain Agentic Steps)
+# Nur diese Tools laufen parallel: sie lesen bloß (HA Status, Suche, Wetter, Routen, Memory).
+# Alles andere (control_device, Kalender, Benachrichtigungen, Timer, Wakeups, MCP Tools,
+# execute_python_code, ...) hat Seiteneffekte und läuft einzeln in Aufrufreihenfolge. Ein solcher
+# Call ist eine Barriere: Lese-Calls davor sind fertig, bevor er startet, Lese-Calls danach
+# starten erst, wenn er fertig ist (get_device_state nach control_device sieht den neuen Zustand).
+PARALLEL_TOOLS = {
+    'get_device_state',
+    'find_devices',
+    'get_calendar_events',
+    'get_weather_forecast',
+    'get_ha_history',
+    'perform_google_search',
+    'search_google_maps',
+    'plan_outdoor_route',
+    'retrieve_memory',
+    'end_conversation',
+}
+
+# Timeout pro Tool in Sekunden (Default: config.SLOW_TOOL_TIMEOUT)
+TOOL_TIMEOUTS = {
+    'execute_python_code': 60,
+    'plan_outdoor_route': 60,
+}
+
+def timeout_result(name, timeout):
+    """Ergebnis für einen Call, der nicht rechtzeitig geantwortet hat (der Thread läuft weiter)."""
+    if name in PARALLEL_TOOLS:
+        return f"Fehler: {name} hat nicht rechtzeitig geantwortet (Timeout {timeout:.0f}s)."
+    # Die Aktion kann also noch ausgeführt werden
+    return (f"{name} läuft noch (keine Antwort nach {timeout:.0f}s). Ob die Aktion ausgeführt wurde, "
+            f"ist unbekannt. Nicht wiederholen, ggf. später den Status prüfen.")
+
+def skipped_result(name):
+    return f"Fehler: übersprungen, weil {name} nicht rechtzeitig fertig wurde."
+
+_tool_executor = ThreadPoolExecutor(max_workers=config.SLOW_TOOL_WORKERS, thread_name_prefix="slow-tool")
+
+def _timed_tool(name, args, silent_mode):
+    start = time.monotonic()
+    try:
+        return execute_tool(name, args, silent_mode=silent_mode), time.monotonic() - start
+    except Exception as e:
+        return f"Error: {e}", time.monotonic() - start
+
+def execute_tools(calls, silent_mode=False):
+    """
+    Führt die Function Calls eines Agentic Steps aus: `calls` = [(name, args), ...].
+    Aufeinanderfolgende PARALLEL_TOOLS laufen gleichzeitig im Tool-Pool, jeder andere Call
+    einzeln dazwischen (Reihenfolge wie vom Modell angegeben). Jeder Call hat sein Timeout
+    (TOOL_TIMEOUTS / SLOW_TOOL_TIMEOUT), ein hängender Call liefert eine Meldung statt den
+    Step zu blockieren. Hängt ein Call mit Seiteneffekt, wird der Rest übersprungen.
+    Rückgabe: Ergebnisse in Aufrufreihenfolge.
+    """
+    start = time.monotonic()
+    results = [None] * len(calls)
+    durations = []
+
+    def wait(i, future, deadline):
+        name = calls[i][0]
+        try:
+            results[i], duration = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            durations.append(duration)
+            return True
+        except FutureTimeout:
+            timeout = TOOL_TIMEOUTS.get(name, config.SLOW_TOOL_TIMEOUT)
+            print(f"  [Tools] {name} timed out after {timeout:.0f}s", flush=True)
+            results[i] = timeout_result(name, timeout)
+            return False
+
+    def submit(i):
+        name, args = calls[i]
+        # trace.bind: der "tool" Span hängt am aktuellen llm_step, auch im Pool-Thread
+        future = _tool_executor.submit(trace.bind(_timed_tool), name, args, silent_mode)
+        return future, time.monotonic() + TOOL_TIMEOUTS.get(name, config.SLOW_TOOL_TIMEOUT)
+
+    def run_batch(batch):
+        pending = [(i,) + submit(i) for i in batch]
+        for i, future, deadline in pending:
+            wait(i, future, deadline)
+
+    batch = []
+    ordered = 0
+    for i, (name, _) in enumerate(calls):
+        if name in PARALLEL_TOOLS:
+            batch.append(i)
+            continue
+        # Barriere: erst die Lese-Calls davor, dann dieser Call allein
+        run_batch(batch)
+        batch = []
+        ordered += 1
+        if not wait(i, *submit(i)):
+            # Reihenfolge nicht mehr garantiert (der Call läuft evtl. noch) -> Rest nicht ausführen
+            for j in range(i + 1, len(calls)):
+                results[j] = skipped_result(name)
+            break
+    else:
+        run_batch(batch)
+
+    if len(calls) > 1:
+        print(f"  [Tools] {len(calls)} calls in {(time.monotonic() - start) * 1000:.0f} ms "
+              f"(sequential ~{sum(durations) * 1000:.0f} ms, {ordered} in order)", flush=True)
+    return results
+
 def execute_tool(name, args, silent_mode=False):
-    """Dispatches the function call to the correct service."""
+    """Dispatches the function call to the correct service (traced as a "tool" span)."""
+    # Gesteuerte Geräte ranken bei den nächsten Anfragen höher (Geräte-Index im Slow Brain Prompt)
+    entity_index.touch(args.get("device_name"))
+    with trace.span("tool", tool=name):
+        return _execute_tool(name, args, silent_mode)
+
+def _execute_tool(name, args, silent_mode=False):
     print(f"  [DEBUG] Tool Call: {name} | Args: {args}")
     
     # 1. NEW: Check if this is a remote MCP tool
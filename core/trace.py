@@ -0,0 +1,267 @@
+"""
+Leichtgewichtiges Tracing pro Interaktion (Wake -> Live -> Tools -> Slow Brain).
+
+Ein Span hat Start/Ende, eine Parent-ID und Attribute. Der aktuelle Span liegt in
+einer ContextVar: asyncio Tasks erben ihn automatisch, für Threads (run_in_executor,
+ThreadPoolExecutor) bindet bind() den Kontext an die Funktion.
+
+Nur start_span() beginnt einen neuen Trace (Wurzel, z.B. "interaction" in main).
+span()/record() ohne laufenden Trace sind No-Ops - Hintergrund-Polling (Mailbox,
+HA-Kontext) erzeugt also keine Traces.
+
+Fertige Spans gehen über eine Queue an einen Writer-Thread, der sie als JSONL in
+TRACE_FILE schreibt (rotierend nach TRACE_MAX_BYTES, TRACE_BACKUPS alte Dateien).
+
+Auswertung: python -m jarvis.core.trace [--last N] [--file PATH]
+"""
+import argparse
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+
+from jarvis import config
+
+_current = contextvars.ContextVar("jarvis_trace_span", default=None)
+
+def _new_id():
+    return os.urandom(8).hex()
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "wall", "attrs", "_ended")
+
+    def __init__(self, name, parent=None, start=None, attrs=None):
+        now = time.monotonic()
+        self.trace_id = parent.trace_id if parent else _new_id()
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start = now if start is None else start   # time.monotonic()
+        self.wall = time.time() - (now - self.start)  # für den Export
+        self.attrs = dict(attrs or {})
+        self._ended = False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, end=None, **attrs):
+        """Beendet den Span (einmalig) und gibt ihn an den Writer. `end`: time.monotonic(), Default jetzt."""
+        if self._ended:
+            return
+        self._ended = True
+        self.attrs.update(attrs)
+        end = time.monotonic() if end is None else end
+        _writer.put({
+            "trace": self.trace_id,
+            "span": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "ts": round(self.wall, 6),
+            "ms": round((end - self.start) * 1000, 3),
+            **self.attrs,
+        })
+
+    def __bool__(self):
+        return True
+
+class _NullSpan:
+    """Platzhalter außerhalb eines Traces (oder bei TRACE_ENABLED=0)."""
+    trace_id = span_id = parent_id = None
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, end=None, **attrs):
+        pass
+
+    def __bool__(self):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+# --- API ---
+def current():
+    return _current.get() or NULL_SPAN
+
+def start_span(name, parent=None, start=None, **attrs):
+    """
+    Neuer Span unter `parent` (Default: aktueller Span), ohne laufenden Trace eine neue Wurzel.
+    `start`: time.monotonic() falls früher begonnen (z.B. Capture des Wake Words). Mit end() beenden.
+    """
+    if not config.TRACE_ENABLED:
+        return NULL_SPAN
+    parent = parent or _current.get()
+    return Span(name, parent or None, start=start, attrs=attrs)
+
+@contextlib.contextmanager
+def use(span):
+    """Macht `span` für den Block zum aktuellen Span (ohne ihn zu beenden)."""
+    token = _current.set(span or None)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Kind-Span des aktuellen Spans für die Dauer des Blocks. Exceptions landen als "error" im Span."""
+    parent = _current.get()
+    if not parent or not config.TRACE_ENABLED:
+        yield NULL_SPAN
+        return
+    s = Span(name, parent, attrs=attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=e.__class__.__name__)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+def record(name, start, end=None, parent=None, **attrs):
+    """Zeichnet einen schon abgelaufenen Abschnitt auf (`start`/`end` als time.monotonic(), z.B. Capture-Zeitstempel)."""
+    parent = parent or _current.get()
+    if not parent or start is None or not config.TRACE_ENABLED:
+        return NULL_SPAN
+    s = Span(name, parent, start=start, attrs=attrs)
+    s.end(end)
+    return s
+
+def bind(fn):
+    """Bindet den aktuellen Kontext an `fn` (für Executor-Threads, die ihn sonst nicht erben)."""
+    ctx = contextvars.copy_context()
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return run
+
+# --- EXPORT ---
+class _Writer:
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=2000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, record):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for rec in batch:
+                        f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            except Exception as e:
+                print(f" [Trace] Write error: {e}", flush=True)
+
+_writer = _Writer(config.TRACE_FILE, config.TRACE_MAX_BYTES, config.TRACE_BACKUPS)
+
+# --- CLI ---
+def load_traces(path):
+    """Liest TRACE_FILE samt Backups und gruppiert die Spans nach Trace (älteste Datei zuerst)."""
+    files = [f"{path}.{i}" for i in range(config.TRACE_BACKUPS, 0, -1)] + [path]
+    traces = {}
+    for fname in files:
+        if not os.path.exists(fname):
+            continue
+        with open(fname, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                traces.setdefault(rec["trace"], []).append(rec)
+    return traces
+
+def _root(spans):
+    roots = [s for s in spans if not s.get("parent")]
+    return roots[0] if roots else min(spans, key=lambda s: s["ts"])
+
+def _print_tree(spans):
+    root = _root(spans)
+    children = {}
+    for s in spans:
+        if s is not root:
+            children.setdefault(s.get("parent"), []).append(s)
+    skip = {"trace", "span", "parent", "name", "ts", "ms"}
+
+    def show(s, depth):
+        offset = (s["ts"] - root["ts"]) * 1000
+        attrs = " ".join(f"{k}={v}" for k, v in s.items() if k not in skip)
+        print(f"  {'  ' * depth}{s['name']:<{28 - 2 * depth}} +{offset:8.0f} ms {s['ms']:9.1f} ms  {attrs}")
+        for c in sorted(children.get(s["span"], []), key=lambda c: c["ts"]):
+            show(c, depth + 1)
+
+    print(f"\n{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(root['ts']))}  trace {root['trace']}")
+    show(root, 0)
+    # Spans, deren Parent (noch) nicht geschrieben wurde, z.B. laufende Interaktion
+    known = {s["span"] for s in spans}
+    for s in spans:
+        if s is not root and s.get("parent") not in known:
+            show(s, 1)
+
+def main(argv=None):
+    import numpy as np
+
+    parser = argparse.ArgumentParser(prog="python -m jarvis.core.trace", description="Latenz-Auswertung der Jarvis Traces")
+    parser.add_argument("--file", default=config.TRACE_FILE)
+    parser.add_argument("--last", type=int, default=20, help="Anzahl der letzten Interaktionen")
+    parser.add_argument("--quiet", action="store_true", help="Nur Perzentile, keine Einzel-Traces")
+    args = parser.parse_args(argv)
+
+    traces = sorted(load_traces(args.file).values(), key=lambda spans: _root(spans)["ts"])[-args.last:]
+    if not traces:
+        print(f"Keine Traces in {args.file}")
+        return
+
+    if not args.quiet:
+        for spans in traces:
+            _print_tree(spans)
+
+    durations = {}
+    for spans in traces:
+        for s in spans:
+            durations.setdefault(s["name"], []).append(s["ms"])
+    print(f"\nPerzentile über {len(traces)} Interaktionen (ms):")
+    print(f"  {'span':<24} {'n':>5} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for name, values in sorted(durations.items(), key=lambda kv: -np.median(kv[1])):
+        d = np.asarray(values, dtype=np.float64)
+        p50, p90, p99 = np.percentile(d, [50, 90, 99])
+        print(f"  {name:<24} {d.size:>5} {p50:>9.1f} {p90:>9.1f} {p99:>9.1f} {d.max():>9.1f}")
+
+if __name__ == "__main__":
+    main()
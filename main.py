@@ -1,16 +1,11 @@
-import asyncio
 import datetime
 import math
 import random
-import struct
 import time
 import wave
-import sys
 import signal
 import threading
-import multiprocessing
 import queue
-import pyaudio
 import pvporcupine
 import pvcobra
 import os
@@ -20,55 +15,25 @@ from aiy.leds import Color, Pattern
 
 from jarvis import config, state
 from jarvis.services import system, timer, ha, google, sfx, memory, routine
-from jarvis.core import llm
+from jarvis.services.audio_ring import AudioRing
+from jarvis.services.latency import LatencyStats
+from jarvis.services.audio_supervisor import AudioSupervisor
+from jarvis.services.capture import audio_worker
+from jarvis.core import llm, trace
 from jarvis.core.live import JarvisHybridRouter
 
-def audio_worker(output_queue, frame_length, rate, channels):
-    import pyaudio
-    try:
-        from ctypes import CFUNCTYPE, c_char_p, c_int, cdll
-        def py_error_handler(filename, line, function, err, fmt): pass
-        c_error_handler = CFUNCTYPE(None, c_char_p, c_int, c_char_p, c_int, c_char_p)(py_error_handler)
-        asound = cdll.LoadLibrary('libasound.so.2')
-        asound.snd_lib_error_set_handler(c_error_handler)
-    except: pass
-
-    def get_mic_index(pa):
-        for i in range(pa.get_device_count()):
-            try:
-                info = pa.get_device_info_by_index(i)
-                if "jarvis_mic" in info.get('name', ''): return i
-            except: pass
-        return None
-
-    pa = pyaudio.PyAudio()
-    mic_index = get_mic_index(pa)
-    stream = pa.open(rate=rate, channels=channels, format=pyaudio.paInt16, input=True, input_device_index=mic_index, frames_per_buffer=frame_length)
-    try:
-        while True:
-            pcm = stream.read(frame_length, exception_on_overflow=False)
-            output_queue.put(pcm)
-    except: pass 
-    finally:
-        stream.close(); pa.terminate()
-
 # --- MAIN HELPERS ---
-def get_rms(pcm_data):
-    count = len(pcm_data) // 2
-    shorts = struct.unpack(f"{count}h", pcm_data)
-    sum_squares = sum(s**2 for s in shorts)
-    return math.sqrt(sum_squares / count) if count > 0 else 0
-
 def lower_volume():
     if state.PREVIOUS_VOLUME is None:
-        try:
-            headers = {"Authorization": "Bearer " + config.HA_TOKEN}
-            r = ha.session.get(f"{config.HA_URL}/api/states/sensor.hifiberry_plexamp_volume", headers=headers, timeout=2)
-            if r.status_code == 200: 
-                vol = float(r.json()['state'])
-                state.PREVIOUS_VOLUME = vol
-                ha.execute_media_control("volume_set", volume_level=vol/2)
-        except: pass
+        with trace.span("lower_volume"):
+            try:
+                headers = {"Authorization": "Bearer " + config.HA_TOKEN}
+                r = ha.session.get(f"{config.HA_URL}/api/states/sensor.hifiberry_plexamp_volume", headers=headers, timeout=2)
+                if r.status_code == 200: 
+                    vol = float(r.json()['state'])
+                    state.PREVIOUS_VOLUME = vol
+                    ha.execute_media_control("volume_set", volume_level=vol/2)
+            except: pass
 
 def restore_volume():
     if state.PREVIOUS_VOLUME is not None:
@@ -89,13 +54,15 @@ def fade_color(leds, start_color, end_color, duration=0.5):
         leds.update(leds.rgb_on((r, g, b)))
         time.sleep(delay)
 
-def flush_queue(q):
-    """Leert die Audio-Queue, damit wir kein Echo der eigenen TTS-Antwort verarbeiten."""
-    try:
-        while not q.empty():
-            q.get_nowait()
-    except queue.Empty:
-        pass
+def flush_queue(ring, events=None):
+    """Leert Audio-Ring und Event-Queue, damit wir kein Echo der eigenen TTS-Antwort verarbeiten."""
+    ring.flush()
+    if events is not None:
+        try:
+            while True:
+                events.get_nowait()
+        except queue.Empty:
+            pass
 
 def main():
     def handle_sigterm(signum, frame):
@@ -111,11 +78,12 @@ def main():
     threading.Thread(target=timer.background_timer_check, daemon=True).start()
     last_dream_date = None
 
-    # Porcupine Init
+    # Porcupine Init (nur Key-Check & Frame-Länge - erkannt wird im audio_worker)
     try:
         porcupine = pvporcupine.create(access_key=config.PICOVOICE_KEY, keywords=[config.WAKE_WORD], sensitivities=[0.4])
         # cobra = pvcobra.create(access_key=config.PICOVOICE_KEY)  # Deprecated in favor of Gemini Live API
         frame_length = porcupine.frame_length
+        porcupine.delete()
     except Exception as e:
         print(f"Init Error: {e}"); return
 
@@ -183,19 +151,26 @@ def main():
         state.AVAILABLE_LIGHTS = lookup
 
         # --- MULTIPROCESSING SETUP ---
-        audio_queue = multiprocessing.Queue(maxsize=50) 
-        audio_proc = None
-
-        def start_audio_process():
-            p = multiprocessing.Process(target=audio_worker, args=(audio_queue, frame_length, config.RATE, config.CHANNELS))
-            p.daemon = True
-            p.start()
-            return p
-
-        audio_proc = start_audio_process()
+        # Shared-Memory Ring statt multiprocessing.Queue: kein Pickling/Pipe pro Frame
+        # Der Ring ist gleichzeitig der Pre-Roll Puffer: er muss PREROLL_SECONDS plus Verbindungsaufbau halten
+        preroll_frames = math.ceil(config.PREROLL_SECONDS * config.RATE / frame_length)
+        audio_ring = AudioRing(frame_length * 2, capacity=max(config.AUDIO_RING_FRAMES, preroll_frames + 16))
+        wake_seq = None # Seq des Frames, in dem das letzte Wake Word erkannt wurde
+        wake_time = None # Capture-Zeitstempel dazu (für Wake -> Listening Latenz)
+        interaction = trace.NULL_SPAN # Wurzel-Span der laufenden Interaktion (Wake bis Session-Ende)
+        # Capture-Prozess mit Heartbeat-Überwachung und Hot Standby
+        audio_supervisor = AudioSupervisor(audio_worker, audio_ring, (frame_length, config.RATE, config.CHANNELS))
+        # Im Idle-Modus kommen nur Events (Wake Word, Pegel) statt Frames
+        audio_events = audio_supervisor.events
+        last_ring_stats = audio_ring.stats()
+        # Alter der Events (seit Capture) beim Hauptprozess: Wake Word / Pegel im Main Loop, Wake Word beim Barge-In
+        event_latency = LatencyStats("main loop events")
+        interrupt_latency = LatencyStats("interrupt check")
+
+        audio_supervisor.start()
         
         # Init Hybrid Fast Brain Router
-        router = JarvisHybridRouter(leds, audio_queue)
+        router = JarvisHybridRouter(leds, audio_ring)
 
         def check_for_interruption():
             if state.CANCEL_REQUESTED:
@@ -203,16 +178,15 @@ def main():
                 return True
 
             try:
-                # Wir schauen, ob Audio in der Queue ist
-                while not audio_queue.empty():
-                    # get_nowait ist wichtig, damit wir hier NICHT blockieren
-                    pcm_chunk = audio_queue.get_nowait()
-                    
-                    # Prüfen auf Wake Word
-                    keyword_index = porcupine.process(struct.unpack_from("h" * porcupine.frame_length, pcm_chunk))
-                    if keyword_index >= 0:
+                # Der audio_worker erkennt das Wake Word selbst, wir schauen nur auf Events (blockiert NICHT)
+                while True:
+                    event = audio_events.get_nowait()
+                    interrupt_latency.record(None, event[-1])
+                    if event[0] == "wake":
                         print("\n--> INTERRUPT DETECTED!")
                         return True # Signalisiert: Sofort aufhören zu sprechen!
+            except queue.Empty:
+                pass
             except:
                 pass
             return False
@@ -228,25 +202,33 @@ def main():
             print(f" [MCP] {len(dynamic_tools)} externe Tools geladen (z.B. {dynamic_tools[0]['name'] if dynamic_tools else 'Keine'})")
         except Exception as e:
             print(f" [MCP Error] Konnte nicht verbinden: {e}")
+
+        # Slow Brain: System Prompt + Tools (inkl. MCP) als cachedContent anlegen
+        llm.warm_context_cache()
+
+        # Erste Live-Verbindung vorab aufbauen (danach jeweils nach Session-Ende)
+        router.live_pool.start()
         
         leds.update(Color.BLUE)
         print(f"\nJarvis Online | Devices: {len(state.AVAILABLE_LIGHTS)}")
         google.speak_text(leds, "Ich bin jetzt online.")
         leds.update(leds.rgb_off())
-        flush_queue(audio_queue) # Start clean
+        flush_queue(audio_ring, audio_events) # Start clean
         
         last_log_time = time.time()
         last_mailbox_check = time.time()
         last_routine_check = time.time()
 
-        mic_fail_count = 0
-
         def update_ha_context_bg():
             try:
                 # print(" [Debug] Refreshing HA Context...")
                 new_ctx, new_lookup = ha.fetch_ha_context()
                 if new_ctx: state.HA_CONTEXT = new_ctx
                 if new_lookup: state.AVAILABLE_LIGHTS.update(new_lookup)
+                # Warme Live-Verbindung mit der neuen Geräteliste neu aufbauen. Nicht während einer
+                # Voice Session: die hält die Verbindung, danach baut der Pool ohnehin neu.
+                if new_ctx and not state.session_active():
+                    router.live_pool.invalidate()
             except: pass
         
         try:
@@ -294,36 +276,23 @@ def main():
                     last_routine_check = time.time()
                     threading.Thread(target=routine.check_background_routine, daemon=True).start()
 
-                # 1. AUDIO LESEN (WATCHDOG)
-                # Nur lesen, wenn wir nicht schon einen internen Trigger haben
-                if not incoming_text:
+                # 1. AUDIO EVENTS LESEN
+                # Nur lesen, wenn wir nicht schon einen internen Trigger haben.
+                # Der Worker schickt mindestens alle AUDIO_LEVEL_INTERVAL s ein Pegel-Event.
+                # Mic-Ausfälle erkennt der AudioSupervisor am Heartbeat im Ring (< 1 s) und schaltet selbst um.
+                # Nach dem Wake Word (Session offen) nicht warten, sondern direkt in die Session.
+                if not incoming_text and not state.session_active():
                     try:
-                        # Prüfe ob Daten da sind
-                        pcm = audio_queue.get(timeout=3)
-                        mic_fail_count = 0
+                        audio_event = audio_events.get(timeout=1)
+                        event_latency.record(None, audio_event[-1])
                     except queue.Empty:
-                        mic_fail_count += 1
-                        print(f" [Watchdog] Mic tot! ({mic_fail_count}/5) Starte Treiber neu...")
-                        
-                        # Wenn zu viele Versuche scheitern, den gesamten Dienst neustarten
-                        if mic_fail_count >= 5:
-                            print(" [System] Kritischer Audio-Fehler. Starte Service neu...")
-                            system.restart_service()
-                            break # Loop verlassen, damit der Prozess endet
-                        
-                        if audio_proc.is_alive():
-                            audio_proc.terminate()
-                            audio_proc.join(timeout=0.1)
-                        
-                        audio_proc = start_audio_process()
-                        time.sleep(3.0) 
-                        continue
+                        audio_event = None
                 else:
-                    # Fake PCM für den Fall dass wir durchfallen (sollte nicht passieren da wir verarbeiten)
-                    pcm = None
+                    # Kein Event für den Fall dass wir durchfallen (sollte nicht passieren da wir verarbeiten)
+                    audio_event = None
 
-                # MAILBOX CHECK
-                if time.time() - last_mailbox_check > 1.5:
+                # MAILBOX CHECK (nicht zwischen Wake Word und Session)
+                if time.time() - last_mailbox_check > 1.5 and not state.session_active():
                     last_mailbox_check = time.time()
                     try:
                         # Check Input Text (Home Assistant)
@@ -333,7 +302,7 @@ def main():
                             ha.clear_input_text("input_text.jarvis_chat")
                             print(f"\n--> 📩 Remote: {incoming_text}")
                             # leds.update(leds.rgb_on(Color.CYAN)) - SILENT
-                            flush_queue(audio_queue) 
+                            flush_queue(audio_ring, audio_events) 
                         
                         # Check "Internal Wakeup" (wird oben gesetzt)
                         elif incoming_text and "INTERNAL_WAKEUP_TRIGGER" in incoming_text:
@@ -353,13 +322,15 @@ def main():
                                     print(f" [Auto-Wakeup Error] {e}")
 
                             # leds.update(leds.rgb_on(Color.MAGENTA)) - SILENT
-                            flush_queue(audio_queue)
+                            flush_queue(audio_ring, audio_events)
 
                     except: pass
 
                 # 2. VAD & Wake Word Logic (OR Text)
                 if state.session_active() or incoming_text:
                     state.IS_PROCESSING = True
+                    if not interaction:
+                        interaction = trace.start_span("interaction", source="text" if incoming_text else "session")
 
                     threading.Thread(target=update_ha_context_bg, daemon=True).start()
 
@@ -376,11 +347,15 @@ def main():
                             state.SESSION_OPEN_UNTIL = 0
                             state.IS_PROCESSING = False
                             leds.update(leds.rgb_off())
-                            flush_queue(audio_queue)
+                            flush_queue(audio_ring, audio_events)
+                            interaction.end(cancelled=True)
+                            interaction = trace.NULL_SPAN
                             continue
 
                         restore_volume()
                         response = "Fehler."
+                        # Streaming: fertige Sätze werden schon gesprochen, während der Rest noch generiert wird
+                        speaker = google.SentenceSpeaker(leds, interrupt_check=check_for_interruption) if config.SLOW_BRAIN_STREAMING else None
                         try:
                             hybrid_context = memory.get_hybrid_context(incoming_text)
                             final_prompt = f"{hybrid_context}\n\nUSER TEXT INPUT:\n{incoming_text}\n\n(Antworte dem User.)"
@@ -388,7 +363,14 @@ def main():
                             if state.CANCEL_REQUESTED: 
                                 response = "<SILENT>"
                             else:
-                                response = llm.ask_gemini(leds, text_prompt=final_prompt, audio_data=None, silent_mode=True)
+                                with trace.use(interaction):
+                                    if speaker:
+                                        response = llm.ask_gemini_stream(leds, text_prompt=final_prompt, audio_data=None, silent_mode=True,
+                                                                         on_sentence=speaker.say, should_stop=speaker.is_interrupted,
+                                                                         query=incoming_text)
+                                    else:
+                                        response = llm.ask_gemini(leds, text_prompt=final_prompt, audio_data=None, silent_mode=True,
+                                                                  query=incoming_text)
                             
                             clean_resp = response.replace("<SESSION:KEEP>", "").replace("<SESSION:CLOSE>", "").strip()
                             memory.save_interaction(incoming_text, clean_resp)
@@ -398,14 +380,22 @@ def main():
                             clean_resp = "Fehler bei der Textverarbeitung."
 
                         if "<SILENT>" in clean_resp:
+                            if speaker: speaker.cancel()
                             clean_resp = clean_resp.replace("<SILENT>", "").strip()
                             print(" [Output] <SILENT>")
+                        elif state.CANCEL_REQUESTED:
+                            if speaker: speaker.cancel()
+                        elif speaker and speaker.sentences:
+                            speaker.finish()
+                            if speaker.first_audio:
+                                trace.record("first_spoken_word", speaker.started, end=speaker.first_audio, parent=interaction)
                         else:
-                            if not state.CANCEL_REQUESTED:
-                                google.speak_text(leds, clean_resp, interrupt_check=check_for_interruption)
+                            # Nicht gestreamt oder nichts gesprochen (z.B. Fehlermeldung)
+                            if speaker: speaker.cancel()
+                            google.speak_text(leds, clean_resp, interrupt_check=check_for_interruption)
 
                         ha.set_state("sensor.jarvis_last_response", clean_resp[:250], attributes={"full_text": clean_resp})
-                        flush_queue(audio_queue)
+                        flush_queue(audio_ring, audio_events)
                         state.SESSION_OPEN_UNTIL = 0
                         leds.update(leds.rgb_off())
                         state.IS_PROCESSING = False
@@ -415,17 +405,30 @@ def main():
                         lower_volume()
                         
                         try:
-                            # Start Live API WebSockets Router natively
-                            asyncio.run(router.start_session())
+                            # Ab jetzt alle Frames aus dem Ring konsumieren - ab direkt nach dem Wake Word (Pre-Roll),
+                            # damit "Jarvis, Licht an" in einem Atemzug komplett bei der Live Session ankommt.
+                            if wake_seq is not None:
+                                audio_ring.seek(wake_seq + 1)
+                                wake_seq = None
+                            else:
+                                audio_ring.flush()
+                            audio_ring.set_streaming(True)
+                            # Live Session läuft auf der Loop des Connection Pools (dort liegt die warme Verbindung)
+                            with trace.use(interaction):
+                                router.live_pool.run_sync(router.start_session(wake_time))
+                            wake_time = None
                         except Exception as e:
                             print(f" [Fast Brain Error] {e}")
                         
                         finally:
+                            audio_ring.set_streaming(False)
                             restore_volume()
-                            flush_queue(audio_queue)
+                            flush_queue(audio_ring, audio_events)
                             state.SESSION_OPEN_UNTIL = 0
                             leds.update(leds.rgb_off())
                             state.IS_PROCESSING = False
+                    interaction.end()
+                    interaction = trace.NULL_SPAN
                     continue
 
                 # --- WAKE WORD ---
@@ -435,17 +438,40 @@ def main():
                 # Heartbeat (alle 10s)
                 if time.time() - last_log_time > 10:
                     last_log_time = time.time()
-
-                if porcupine.process(struct.unpack_from("h" * porcupine.frame_length, pcm)) >= 0:
+                    ring_stats = audio_ring.stats()
+                    if (ring_stats["overruns"], ring_stats["dropped"]) != (last_ring_stats["overruns"], last_ring_stats["dropped"]):
+                        print(f" [Audio] Frames verloren! Overruns: {ring_stats['overruns']} | Dropped: {ring_stats['dropped']}")
+                    health = ("read_errors", "xruns", "stalls")
+                    if any(ring_stats[k] != last_ring_stats[k] for k in health):
+                        print(f" [Audio] Mic Health: Read Errors: {ring_stats['read_errors']} | Overflows: {ring_stats['xruns']} | Stalls: {ring_stats['stalls']} | Failovers: {audio_supervisor.failovers}")
+                    last_ring_stats = ring_stats
+                    event_latency.maybe_report(config.LATENCY_REPORT_INTERVAL)
+                    interrupt_latency.maybe_report(config.LATENCY_REPORT_INTERVAL)
+
+                if audio_event and audio_event[0] == "level" and not state.session_active():
+                    router.observe_idle_level(audio_event[1])
+
+                if audio_event and audio_event[0] == "wake":
                     print("\n--> Wake Word Detected")
+                    wake_seq = audio_event[1]
+                    wake_time = audio_event[2]
+                    interaction.end(superseded=True)
+                    interaction = trace.start_span("interaction", start=wake_time, source="wake")
+                    # Capture des Wake-Word-Frames -> Event im Main Loop
+                    trace.record("wake_detect", wake_time, parent=interaction)
                     sfx.play(config.SOUND_WAKE, volume=1.0)
-                    lower_volume()
+                    with trace.use(interaction):
+                        lower_volume()
                     if state.ALARM_PROCESS:
                         timer.stop_alarm_sound()
                         google.speak_text(leds, "Wecker gestoppt.")
                         leds.update(leds.rgb_off())
-                        flush_queue(audio_queue) # Auch hier wichtig
+                        flush_queue(audio_ring, audio_events) # Auch hier wichtig
+                        wake_seq = None
+                        wake_time = None
                         restore_volume()
+                        interaction.end(alarm_stopped=True)
+                        interaction = trace.NULL_SPAN
                         continue
                     state.open_session(8)
 
@@ -458,8 +484,9 @@ def main():
 
         except KeyboardInterrupt: pass
         finally:
-            if audio_proc: audio_proc.terminate()
-            if 'porcupine' in locals(): porcupine.delete()
+            audio_supervisor.stop()
+            audio_ring.close()
+            audio_ring.unlink()
             if 'cobra' in locals() and cobra: cobra.delete()
 
 if __name__ == "__main__":
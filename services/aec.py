@@ -0,0 +1,272 @@
+# jarvis/services/aec.py
+import threading
+import time
+import numpy as np
+from jarvis import config
+
+# --- REFERENCE (Far-End) ---
+
+class _Resampler24to16:
+    """
+    Stateful 24 kHz -> 16 kHz Resampler für die Referenz (Live API TTS kommt mit 24 kHz).
+    Kurzer Tiefpass (Windowed Sinc, 7 kHz) gegen Aliasing, danach lineare Interpolation.
+    Für die AEC-Referenz reicht das, das Mikrofon sieht oberhalb 8 kHz ohnehin nichts.
+    """
+    def __init__(self, taps=15):
+        n = np.arange(taps) - (taps - 1) / 2
+        h = np.sinc(2 * 7000 / 24000 * n) * np.hamming(taps)
+        self._h = (h / h.sum()).astype(np.float32)
+        self.reset()
+
+    def reset(self):
+        self._tail = np.zeros(len(self._h) - 1, dtype=np.float32)
+        self._pos = 0.0
+
+    def process(self, pcm):
+        x = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        if x.size == 0:
+            return x
+        buf = np.concatenate((self._tail, x))
+        self._tail = buf[-(len(self._h) - 1):]
+        y = np.convolve(buf, self._h, mode="valid")
+        # Eingangs-Positionen der Ausgangs-Samples (Schrittweite 1.5 = 24k/16k)
+        t = np.arange(self._pos, len(y) - 1 + 1e-9, 1.5)
+        self._pos = t[-1] + 1.5 - len(y) if t.size else self._pos - len(y)
+        return np.interp(t, np.arange(len(y)), y).astype(np.float32)
+
+class EchoReference:
+    """
+    Zeitachse des Lautsprecher-Signals (16 kHz, float32) für den Echo Canceller.
+
+    push() kommt vom OutputMixer direkt vor dem Geräte-Write. Ein Chunk beginnt beim
+    Ende des vorigen (der Ausgabepuffer spielt lückenlos) oder - wenn die Wiedergabe
+    leergelaufen ist - jetzt. Über `delay` (Ausgabe-Latenz + AEC_DELAY_MS) wird ein
+    Mikrofon-Zeitstempel auf die passenden Referenz-Samples abgebildet.
+    """
+    def __init__(self, rate=16000, delay=0.0, seconds=4):
+        self.rate = rate
+        self.delay = delay
+        self._size = 1 << int(np.ceil(np.log2(rate * seconds)))
+        self._buf = np.zeros(self._size, dtype=np.float32)
+        self._epoch = time.monotonic()
+        self._end = 0  # Timeline-Index hinter dem letzten Referenz-Sample
+        self._resampler = _Resampler24to16()
+        self._lock = threading.Lock()
+
+    def _index(self, t):
+        return int(round((t - self._epoch) * self.rate))
+
+    def push(self, pcm24k, now=None):
+        x = self._resampler.process(pcm24k)
+        now_idx = self._index(time.monotonic() if now is None else now)
+        with self._lock:
+            start = self._end
+            if now_idx > start:
+                # Wiedergabe war leergelaufen: Lücke mit Stille füllen
+                gap = min(now_idx - start, self._size)
+                self._buf.put(np.arange(now_idx - gap, now_idx), 0.0, mode="wrap")
+                start = now_idx
+            self._buf.put(np.arange(start, start + x.size), x, mode="wrap")
+            self._end = start + x.size
+
+    def get(self, t, n):
+        """Referenz-Samples, die zum Mikrofon-Zeitpunkt `t` (Beginn des Frames) im Raum zu hören waren."""
+        idx = self._index(t - self.delay)
+        out = np.zeros(n, dtype=np.float32)
+        with self._lock:
+            lo = max(idx, self._end - self._size)
+            hi = min(idx + n, self._end)
+            if hi > lo:
+                out[lo - idx:hi - idx] = self._buf.take(np.arange(lo, hi), mode="wrap")
+        return out
+
+    def active(self, t, span):
+        """True, wenn innerhalb von `span` Sekunden vor `t` Referenz-Audio lief (sonst ist kein Echo möglich)."""
+        return self._end > self._index(t - self.delay - span)
+
+    def clear(self):
+        """Verwirft geplante Referenz (z.B. bei Unterbrechung, der Ausgabepuffer wird ja auch geleert)."""
+        with self._lock:
+            self._end = min(self._end, self._index(time.monotonic()))
+            self._resampler.reset()
+
+# --- CANCELLER ---
+
+class EchoCanceller:
+    """
+    Akustischer Echo Canceller: Partitioned Block Frequency Domain NLMS (Overlap-Save).
+
+    - block: Blocklänge N (FFT 2N), partitions: P -> Filterlänge N*P Samples
+      (256 x 8 = 128 ms bei 16 kHz, deckt Lautsprecher/Mikro-Abstand plus Puffer-Jitter)
+    - Variable Schrittweite statt hartem Double-Talk Detektor: die Schrittweite wird
+      mit Echo-Schätzung / Restsignal skaliert. Spricht der Nutzer (Double Talk),
+      ist der Rest viel größer als das geschätzte Echo und der Filter friert quasi ein.
+    - Läuft seit `P` Blöcken keine Referenz, wird das Mikrofon unverändert durchgereicht
+      (kein Echo möglich, kostet dann keine CPU).
+    """
+    def __init__(self, reference, block=256, partitions=8, mu=0.5, min_step=0.05, warmup_blocks=50):
+        self.ref = reference
+        self.block = block
+        self.partitions = partitions
+        self.mu = mu
+        self.min_step = min_step
+        self.warmup_blocks = warmup_blocks
+        bins = block + 1
+        self._W = np.zeros((partitions, bins), dtype=np.complex64)
+        self._X = np.zeros((partitions, bins), dtype=np.complex64)
+        self._x_prev = np.zeros(block, dtype=np.float32)
+        self._zeros = np.zeros(block, dtype=np.float32)
+        self._pow = np.full(bins, 1.0, dtype=np.float32)
+        self._pe = 0.0
+        self._py = 0.0
+        self._delta = np.float32(block * 2 * 100.0 ** 2)  # Regularisierung (~ Rauschen mit RMS 100)
+        self.blocks_processed = 0
+        self.blocks_adapted = 0
+        self.blocks_bypassed = 0
+        self._energy_in = 0.0
+        self._energy_out = 0.0
+
+    def _reset_history(self):
+        self._X[:] = 0
+        self._x_prev[:] = 0
+
+    def _process_block(self, d, x):
+        N = self.block
+        self._X[1:] = self._X[:-1]
+        self._X[0] = np.fft.rfft(np.concatenate((self._x_prev, x)))
+        self._x_prev = x
+
+        y = np.fft.irfft((self._W * self._X).sum(axis=0))[N:]
+        e = d - y
+
+        pd = float(np.dot(d, d))
+        pe = float(np.dot(e, e))
+        py = float(np.dot(y, y))
+        self._pe = 0.7 * self._pe + 0.3 * pe
+        self._py = 0.7 * self._py + 0.3 * py
+        self._energy_in += pd
+        self._energy_out += pe
+
+        px = np.abs(self._X[0]) ** 2
+        self._pow = 0.9 * self._pow + 0.1 * px
+        if float(np.dot(x, x)) > N * 30.0 ** 2:
+            if self.blocks_adapted < self.warmup_blocks:
+                step = self.mu
+            else:
+                step = self.mu * min(1.0, max(self.min_step, self._py / (self._pe + 1e-9)))
+            E = np.fft.rfft(np.concatenate((self._zeros, e)))
+            G = (step / (self.partitions * self._pow + self._delta)).astype(np.float32) * E
+            self._W += np.conj(self._X) * G
+            # Constraint (nur lineare, keine zyklische Faltung lernen) reihum für eine Partition
+            # pro Block statt für alle: 2 statt 2P FFTs, konvergiert praktisch gleich (wie Speex MDF)
+            k = self.blocks_adapted % self.partitions
+            w = np.fft.irfft(self._W[k])
+            w[N:] = 0
+            self._W[k] = np.fft.rfft(w)
+            self.blocks_adapted += 1
+        return e
+
+    def process(self, pcm, timestamp):
+        """
+        Entfernt das Lautsprecher-Echo aus einem Mikrofon-Frame (16 bit PCM).
+        `timestamp` ist der Capture-Zeitstempel (time.monotonic() nach dem Read, also Frame-Ende).
+        """
+        d = np.frombuffer(pcm, dtype=np.int16)
+        n = d.size
+        start = timestamp - n / self.ref.rate
+        N = self.block
+        if n % N or not self.ref.active(start, N * self.partitions / self.ref.rate):
+            if n % N == 0:
+                self.blocks_bypassed += n // N
+            self._reset_history()
+            return pcm
+
+        x = self.ref.get(start, n)
+        d = d.astype(np.float32)
+        out = np.empty(n, dtype=np.float32)
+        for i in range(0, n, N):
+            out[i:i + N] = self._process_block(d[i:i + N], x[i:i + N])
+            self.blocks_processed += 1
+        return np.clip(out, -32768, 32767).astype(np.int16).tobytes()
+
+    def erle_db(self):
+        """Echo Return Loss Enhancement über alle verarbeiteten Blöcke (inkl. Nahsprache, also eine Untergrenze)."""
+        if self._energy_out <= 0:
+            return 0.0
+        return 10 * np.log10(max(self._energy_in, 1e-9) / self._energy_out)
+
+    def stats(self):
+        return {
+            "processed": self.blocks_processed,
+            "adapted": self.blocks_adapted,
+            "bypassed": self.blocks_bypassed,
+            "erle_db": self.erle_db(),
+        }
+
+def create_canceller(reference):
+    """Baut den konfigurierten Echo Canceller. Gibt None zurück, wenn AEC aus ist (dann wird geduckt)."""
+    if not config.AEC_ENABLED or reference is None:
+        return None
+    return EchoCanceller(reference, block=config.AEC_BLOCK, partitions=config.AEC_PARTITIONS, mu=config.AEC_STEP)
+
+# --- BENCHMARK ---
+# python3 -m jarvis.services.aec [sekunden]
+# Synthetischer Raum: Referenz (24 kHz, wie von der Live API) -> Echo-Pfad -> Mikrofon,
+# in der zweiten Hälfte spricht zusätzlich der Nutzer (Double Talk).
+
+def _benchmark(seconds=8.0, frame_length=512):
+    rng = np.random.default_rng(0)
+    rate = 16000
+    n24 = int(seconds * 24000)
+    # Sprachähnliches Far-End: gefärbtes Rauschen mit Silben-Hüllkurve
+    far24 = np.convolve(rng.normal(0, 1, n24), [1, 0.7, 0.3], mode="same")
+    far24 *= 6000 * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * np.arange(n24) / 24000)) / far24.std()
+    far24 = np.clip(far24, -32768, 32767).astype(np.int16)
+
+    # "Echte" Wiedergabe auf 16 kHz (gleicher Resampler wie die Referenz)
+    far16 = _Resampler24to16().process(far24.tobytes())
+    chunk24 = frame_length * 3 // 2
+
+    # Echo-Pfad: 2 ms Verzögerung + abklingende Raumantwort, Pegel wie Lautsprecher direkt neben dem Mikro
+    h = np.zeros(1200)
+    h[32:] = rng.normal(0, 1, 1168) * np.exp(-np.arange(1168) / 200)
+    h *= 0.8 / np.abs(h).sum() * 4
+    echo = np.convolve(far16, h)[:far16.size]
+    near = np.zeros_like(echo)
+    half = far16.size // 2
+    near[half:] = rng.normal(0, 1500, far16.size - half) * (np.sin(2 * np.pi * 3 * np.arange(far16.size - half) / rate) > 0)
+    mic = np.clip(echo + near + rng.normal(0, 50, far16.size), -32768, 32767).astype(np.int16)
+
+    ref = EchoReference(rate=rate, delay=0.0)
+    aec = EchoCanceller(ref)
+    t0 = time.monotonic()
+    frames = far16.size // frame_length
+    out = np.zeros(frames * frame_length, dtype=np.float32)
+    start = time.perf_counter()
+    for i in range(frames):
+        a = i * frame_length
+        # Referenz kommt wie im Router chunkweise, kurz bevor sie gespielt wird
+        ref.push(far24[i * chunk24:(i + 1) * chunk24].tobytes(), now=t0 + a / rate)
+        ts = t0 + (a + frame_length) / rate
+        cleaned = aec.process(mic[a:a + frame_length].tobytes(), ts)
+        out[a:a + frame_length] = np.frombuffer(cleaned, dtype=np.int16)
+    elapsed = time.perf_counter() - start
+
+    def power(x):
+        return float(np.mean(np.asarray(x, dtype=np.float64) ** 2)) + 1e-9
+    conv = slice(int(1.0 * rate), half)  # nach 1 s Konvergenz, nur Echo
+    erle = 10 * np.log10(power(mic[conv]) / power(out[conv]))
+    dt = slice(half, frames * frame_length)
+    residual = out[dt] - near[dt]
+    near_kept = 10 * np.log10(power(near[dt]) / power(residual))
+
+    frame_ms = frame_length / rate * 1000
+    per_frame = elapsed / frames
+    print(f"Frames: {frames} x {frame_length} Samples ({frame_ms:.0f} ms), Filter {aec.block}x{aec.partitions} = {aec.block * aec.partitions / rate * 1000:.0f} ms")
+    print(f"  CPU: {per_frame * 1e6:8.1f} us/Frame  ({per_frame * 1000 / frame_ms * 100:.1f}% CPU bei Echtzeit)")
+    print(f"  ERLE (nur Echo, nach Konvergenz): {erle:5.1f} dB")
+    print(f"  Double Talk: Nahsprache zu Rest-Echo {near_kept:5.1f} dB")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 8.0)
@@ -0,0 +1,115 @@
+# jarvis/services/audio_features.py
+import time
+from collections import namedtuple
+import numpy as np
+
+# Features eines 16 bit PCM Frames (mono)
+#   rms          Effektivwert (0..32768)
+#   peak         Betrag des größten Samples
+#   clipped      Anzahl Samples an der Aussteuerungsgrenze
+#   zcr          Zero-Crossing-Rate (0..1), hoch bei Rauschen/Zischlauten
+#   noise_floor  Rauschteppich VOR diesem Frame (laufende Schätzung)
+FrameFeatures = namedtuple("FrameFeatures", ["rms", "peak", "clipped", "zcr", "noise_floor"])
+
+class AudioFeatures:
+    """
+    Vektorisierte Frame-Features auf Basis von np.frombuffer (View auf die PCM
+    Bytes). Für das Skalarprodukt wird der Frame in einen wiederverwendeten
+    float32 Puffer kopiert, pro Frame wird dafür nichts neu angelegt. Gemeinsame Grundlage für VAD, Mic-Ducking
+    und die LED-Pegelanzeige, ersetzt main.get_rms.
+
+    Der Rauschteppich fällt schnell und steigt langsam. Frames, die mehr als
+    `rise_gate` mal lauter als der Teppich sind, gelten als Signal und heben
+    ihn nicht an. Ohne `initial_floor` startet der Teppich beim ersten Frame.
+
+    Der Puffer gehört der Instanz: eine AudioFeatures pro Thread.
+    """
+    def __init__(self, clip_level=32000, rise=0.02, fall=0.5, rise_gate=3.0, initial_floor=None):
+        self.clip_level = clip_level
+        self.rise = rise
+        self.fall = fall
+        self.rise_gate = rise_gate
+        self.noise_floor = initial_floor
+        self.last = None
+        self._buf = np.empty(0, dtype=np.float32)  # float32 Arbeitspuffer, neu angelegt nur bei anderer Framegröße
+
+    def process(self, pcm):
+        x = np.frombuffer(pcm, dtype=np.int16)
+        n = x.size
+        if n == 0:
+            return FrameFeatures(0.0, 0, 0, 0.0, self.noise_floor or 0.0)
+
+        # float32 für das Skalarprodukt (int16 würde überlaufen), BLAS erledigt den Rest
+        if self._buf.size != n:
+            self._buf = np.empty(n, dtype=np.float32)
+        f = self._buf
+        np.copyto(f, x, casting="unsafe")
+        rms = float(np.sqrt(np.dot(f, f) / n))
+        # abs(int16) läuft bei -32768 über, daher über min/max
+        peak = max(int(x.max()), -int(x.min()))
+        clipped = int(np.count_nonzero(x >= self.clip_level) + np.count_nonzero(x <= -self.clip_level))
+        signs = np.signbit(x)
+        zcr = float(np.count_nonzero(signs[1:] != signs[:-1])) / (n - 1) if n > 1 else 0.0
+
+        floor = self.update_floor(rms)
+        self.last = FrameFeatures(rms, peak, clipped, zcr, floor)
+        return self.last
+
+    def update_floor(self, rms):
+        """Schreibt den Rauschteppich mit einem Pegel fort (auch von außen, z.B. Ruhepegel). Gibt den Wert davor zurück."""
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        floor = self.noise_floor
+        if rms < floor:
+            self.noise_floor += (rms - floor) * self.fall
+        elif rms <= floor * self.rise_gate:
+            self.noise_floor += (rms - floor) * self.rise
+        return floor
+
+def scale_pcm(pcm, gain):
+    """Skaliert 16 bit PCM (Ersatz für audioop.mul, das es ab Python 3.13 nicht mehr gibt)."""
+    x = np.frombuffer(pcm, dtype=np.int16)
+    return np.clip(x * np.float32(gain), -32768, 32767).astype(np.int16).tobytes()
+
+def level_to_brightness(rms, floor=0.0, full_scale=6000.0):
+    """Bildet einen RMS-Pegel auf 0..1 ab (für die LED-Pegelanzeige)."""
+    if rms <= floor:
+        return 0.0
+    return min(1.0, (rms - floor) / full_scale) ** 0.5
+
+# --- MICRO BENCHMARK ---
+# python3 -m jarvis.services.audio_features [frames]
+
+def _legacy_rms(pcm_data):
+    # Die alte main.get_rms, nur für den Vergleich
+    import math
+    import struct
+    count = len(pcm_data) // 2
+    shorts = struct.unpack(f"{count}h", pcm_data)
+    sum_squares = sum(s**2 for s in shorts)
+    return math.sqrt(sum_squares / count) if count > 0 else 0
+
+def _benchmark(frames=2000, frame_length=512):
+    rng = np.random.default_rng(0)
+    data = [rng.normal(0, 2000, frame_length).astype(np.int16).tobytes() for _ in range(64)]
+
+    t0 = time.perf_counter()
+    for i in range(frames):
+        _legacy_rms(data[i % 64])
+    legacy = (time.perf_counter() - t0) / frames
+
+    feats = AudioFeatures()
+    t0 = time.perf_counter()
+    for i in range(frames):
+        feats.process(data[i % 64])
+    vectorized = (time.perf_counter() - t0) / frames
+
+    frame_ms = frame_length / 16000 * 1000
+    print(f"Frames: {frames} x {frame_length} Samples ({frame_ms:.0f} ms)")
+    print(f"  get_rms (struct, nur RMS): {legacy * 1e6:8.1f} us/Frame  ({legacy * 1000 / frame_ms * 100:.2f}% CPU bei Echtzeit)")
+    print(f"  AudioFeatures (alle):      {vectorized * 1e6:8.1f} us/Frame  ({vectorized * 1000 / frame_ms * 100:.2f}% CPU bei Echtzeit)")
+    print(f"  Speedup: {legacy / vectorized:.1f}x")
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
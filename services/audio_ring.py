@@ -0,0 +1,332 @@
+# jarvis/services/audio_ring.py
+import asyncio
+import os
+import struct
+import time
+from collections import namedtuple
+from multiprocessing import reduction, shared_memory
+
+# Ein Frame aus dem Ring. `pcm` ist eine memoryview direkt in das Shared Memory
+# (zero-copy). Sie bleibt gültig, bis der Producer den Ring einmal umrundet hat
+# (capacity Frames, bei 64 x 32 ms also ~2 s) - Konsumenten verarbeiten sofort.
+AudioFrame = namedtuple("AudioFrame", ["seq", "timestamp", "pcm"])
+
+# --- LAYOUT ---
+# Header (128 Bytes, little endian):
+#   0  write_seq    Q  Anzahl geschriebener Frames (= Seq des nächsten Frames)
+#   8  read_seq     Q  Cursor des Konsumenten (für Overrun-Erkennung im Producer)
+#   16 overruns     Q  Producer hat ungelesene Frames überschrieben
+#   24 dropped      Q  Konsument musste Frames überspringen
+#   32 mode         Q  MODE_IDLE / MODE_STREAM (vom Hauptprozess gesetzt)
+#   40 heartbeat    d  time.monotonic() des letzten erfolgreichen Reads im Producer
+#   48 read_errors  Q  Fehlgeschlagene Reads (außer Overflow)
+#   56 xruns        Q  Input Overflows des Audio-Geräts (Eingangspuffer beim Read voll)
+#   64 stalls       Q  Reads, die deutlich länger als ein Frame blockiert haben
+#   72 producer_pid Q  PID des schreibenden audio_worker
+#   80 reserved
+# Slot: seq Q | timestamp d (Capture-Zeitstempel) | PCM
+_HEADER_SIZE = 128
+_OFF_WRITE_SEQ = 0
+_OFF_READ_SEQ = 8
+_OFF_OVERRUNS = 16
+_OFF_DROPPED = 24
+_OFF_MODE = 32
+_OFF_HEARTBEAT = 40
+_OFF_READ_ERRORS = 48
+_OFF_XRUNS = 56
+_OFF_STALLS = 64
+_OFF_PRODUCER_PID = 72
+_SLOT_HEADER = struct.Struct("<Qd")
+_U64 = struct.Struct("<Q")
+_F64 = struct.Struct("<d")
+_EMPTY = 0xFFFFFFFFFFFFFFFF  # Slot wird gerade beschrieben / noch nie beschrieben
+
+# Idle: audio_worker macht die Wake-Word Erkennung selbst und schickt nur Events,
+# der Hauptprozess liest keine Frames. Stream: Hauptprozess konsumiert alle Frames.
+MODE_IDLE = 0
+MODE_STREAM = 1
+
+def _attach(name):
+    try:
+        # Python 3.13+: Der Resource Tracker soll das Segment des Parents nicht aufräumen
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+class AudioRing:
+    """
+    Lock-freier Single-Producer/Single-Consumer Ringpuffer in Shared Memory.
+
+    Ersetzt die multiprocessing.Queue zwischen audio_worker und Hauptprozess:
+    kein Pickling, keine Pipe, kein Feeder-Thread. Der Producer schreibt nie
+    blockierend - läuft der Konsument hinterher, wird überschrieben und gezählt.
+
+    Jeder Slot trägt seine Sequenznummer (Seqlock): der Producer markiert den
+    Slot vor dem Schreiben als leer und setzt die Seq erst danach, so erkennt
+    der Leser halb geschriebene oder bereits überholte Frames. Auf dem
+    Single-Core Pi Zero ist die Schreibreihenfolge damit ausreichend.
+
+    Im Stream-Modus schreibt der Producer pro Frame ein Byte in eine Notify-Pipe
+    (vom Ersteller angelegt, an spawn/forkserver-Kinder als FD übergeben). Der Konsument kann so per
+    select/loop.add_reader auf neue Frames warten, statt zu pollen (AsyncFrameSource).
+    """
+
+    def __init__(self, frame_bytes, capacity=64, name=None, create=True, notify_w=None):
+        self.frame_bytes = frame_bytes
+        self.capacity = capacity
+        self._slot_size = (_SLOT_HEADER.size + frame_bytes + 7) & ~7
+        size = _HEADER_SIZE + self._slot_size * capacity
+
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._owner = True
+            buf = self._shm.buf
+            buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            for i in range(capacity):
+                _U64.pack_into(buf, self._slot_offset(i), _EMPTY)
+            self._notify_r, self._notify_w = os.pipe()
+            # Producer darf nie blockieren (volle Pipe = Konsument hängt, Frames zählt der Ring)
+            os.set_blocking(self._notify_r, False)
+            os.set_blocking(self._notify_w, False)
+        else:
+            self._shm = _attach(name)
+            self._owner = False
+            # Per Name angehängt: nur das Schreibende der Pipe (Producer), ohne Pipe pollen Konsumenten
+            self._notify_r, self._notify_w = None, notify_w
+
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        # Konsumenten-Cursor (nur im Leser-Prozess relevant)
+        self._cursor = self._load(_OFF_WRITE_SEQ)
+
+    def __reduce__(self):
+        # Für spawn/forkserver: im Kindprozess per Name anhängen statt kopieren, die Notify-Pipe als FD mitgeben
+        notify = reduction.DupFd(self._notify_w) if self._notify_w is not None else None
+        return (_rebuild_ring, (self.frame_bytes, self.capacity, self.name, notify))
+
+    # --- INTERNALS ---
+    def _slot_offset(self, index):
+        return _HEADER_SIZE + index * self._slot_size
+
+    def _load(self, offset):
+        return _U64.unpack_from(self._buf, offset)[0]
+
+    def _store(self, offset, value):
+        _U64.pack_into(self._buf, offset, value)
+
+    # --- PRODUCER ---
+    def write(self, pcm, timestamp=None):
+        """Schreibt einen Frame (nie blockierend). Gibt die Sequenznummer zurück."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        seq = self._load(_OFF_WRITE_SEQ)
+        # Im Idle-Modus liest niemand mit, Überschreiben ist dort gewollt
+        if self.is_streaming() and seq - self._load(_OFF_READ_SEQ) >= self.capacity:
+            self._store(_OFF_OVERRUNS, self._load(_OFF_OVERRUNS) + 1)
+
+        off = self._slot_offset(seq % self.capacity)
+        self._store(off, _EMPTY)
+        start = off + _SLOT_HEADER.size
+        self._buf[start:start + len(pcm)] = pcm
+        _SLOT_HEADER.pack_into(self._buf, off, seq, timestamp)
+        self._store(_OFF_WRITE_SEQ, seq + 1)
+        if self._load(_OFF_MODE) == MODE_STREAM:
+            self._notify()
+        return seq
+
+    def _notify(self):
+        if self._notify_w is None:
+            return
+        try:
+            os.write(self._notify_w, b"\x01")
+        except (BlockingIOError, OSError):
+            pass
+
+    # --- HEALTH (Producer schreibt, Supervisor im Hauptprozess liest) ---
+    def beat(self, timestamp=None):
+        """Lebenszeichen des Producers, nach jedem erfolgreichen Read."""
+        _F64.pack_into(self._buf, _OFF_HEARTBEAT, time.monotonic() if timestamp is None else timestamp)
+
+    def heartbeat(self):
+        return _F64.unpack_from(self._buf, _OFF_HEARTBEAT)[0]
+
+    def claim_producer(self, pid):
+        """Ein (Standby-)Worker übernimmt den Ring. Der Heartbeat zählt erst ab seinem ersten Read."""
+        self._store(_OFF_PRODUCER_PID, pid)
+
+    def producer_pid(self):
+        return self._load(_OFF_PRODUCER_PID)
+
+    def add_health(self, read_errors=0, xruns=0, stalls=0):
+        for off, n in ((_OFF_READ_ERRORS, read_errors), (_OFF_XRUNS, xruns), (_OFF_STALLS, stalls)):
+            if n:
+                self._store(off, self._load(off) + n)
+
+    # --- MODE ---
+    def set_streaming(self, enabled):
+        self._store(_OFF_MODE, MODE_STREAM if enabled else MODE_IDLE)
+        if enabled:
+            # Wartende Konsumenten wecken: Pre-Roll liegt schon im Ring
+            self._notify()
+
+    def is_streaming(self):
+        return self._load(_OFF_MODE) == MODE_STREAM
+
+    # --- CONSUMER ---
+    def _drop(self, count):
+        self._store(_OFF_DROPPED, self._load(_OFF_DROPPED) + count)
+
+    def read_nowait(self):
+        """Nächster Frame als AudioFrame oder None, wenn nichts Neues da ist."""
+        while True:
+            head = self._load(_OFF_WRITE_SEQ)
+            if self._cursor >= head:
+                return None
+
+            # Der Slot von `head` wird evtl. gerade beschrieben -> ältester sicherer Frame ist head - capacity + 1
+            oldest = head - self.capacity + 1
+            if self._cursor < oldest:
+                self._drop(oldest - self._cursor)
+                self._cursor = oldest
+
+            off = self._slot_offset(self._cursor % self.capacity)
+            seq, ts = _SLOT_HEADER.unpack_from(self._buf, off)
+            if seq != self._cursor:
+                # Vom Producer überholt, während wir gelesen haben
+                self._drop(1)
+                self._cursor += 1
+                continue
+
+            start = off + _SLOT_HEADER.size
+            frame = AudioFrame(seq, ts, self._buf[start:start + self.frame_bytes])
+            self._cursor += 1
+            self._store(_OFF_READ_SEQ, self._cursor)
+            return frame
+
+    def read(self, timeout=None, poll_interval=0.008):
+        """Blockierendes Lesen. Gibt None zurück, wenn `timeout` abläuft."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.read_nowait()
+            if frame is not None:
+                return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def read_available(self):
+        """Alle aktuell verfügbaren Frames (nicht blockierend)."""
+        frames = []
+        while True:
+            frame = self.read_nowait()
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def seek(self, seq):
+        """
+        Setzt den Lese-Cursor auf `seq` (Pre-Roll), begrenzt auf das, was der Ring
+        noch hält. Gibt die tatsächliche Start-Seq zurück.
+        """
+        head = self._load(_OFF_WRITE_SEQ)
+        oldest = max(0, head - self.capacity + 1)
+        self._cursor = min(max(seq, oldest), head)
+        self._store(_OFF_READ_SEQ, self._cursor)
+        return self._cursor
+
+    def flush(self):
+        """Verwirft alles Ungelesene (ohne es als Drop zu zählen)."""
+        self._cursor = self._load(_OFF_WRITE_SEQ)
+        self._store(_OFF_READ_SEQ, self._cursor)
+
+    def pending(self):
+        return self._load(_OFF_WRITE_SEQ) - self._cursor
+
+    def notify_fd(self):
+        """Lesbar, sobald im Stream-Modus neue Frames da sind (None ohne Pipe)."""
+        return self._notify_r
+
+    def drain_notify(self):
+        if self._notify_r is None:
+            return
+        try:
+            while os.read(self._notify_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def stats(self):
+        return {
+            "written": self._load(_OFF_WRITE_SEQ),
+            "read": self._load(_OFF_READ_SEQ),
+            "overruns": self._load(_OFF_OVERRUNS),
+            "dropped": self._load(_OFF_DROPPED),
+            "read_errors": self._load(_OFF_READ_ERRORS),
+            "xruns": self._load(_OFF_XRUNS),
+            "stalls": self._load(_OFF_STALLS),
+        }
+
+    # --- LIFECYCLE ---
+    def close(self):
+        self._buf = None
+        if self._owner and self._notify_r is not None:
+            os.close(self._notify_r)
+            os.close(self._notify_w)
+            self._notify_r = self._notify_w = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Es gibt noch exportierte memoryviews (z.B. ein gehaltener Frame)
+            pass
+
+    def unlink(self):
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+def _rebuild_ring(frame_bytes, capacity, name, notify):
+    return AudioRing(frame_bytes, capacity, name, create=False, notify_w=notify.detach() if notify else None)
+
+class AsyncFrameSource:
+    """
+    asyncio-Konsument des Rings: die Event Loop überwacht die Notify-Pipe
+    (loop.add_reader), read() schläft bis der audio_worker einen Frame geschrieben hat.
+    Ohne Pipe (Ring per Name angehängt) wird im Frame-Takt gepollt.
+    """
+    def __init__(self, ring, poll_interval=0.01):
+        self.ring = ring
+        self.poll_interval = poll_interval
+        self.wakeups = 0
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._ready.set()  # Pre-Roll liegt evtl. schon bereit
+        self._fd = ring.notify_fd()
+        if self._fd is not None:
+            self._loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        self.ring.drain_notify()
+        self._ready.set()
+
+    async def read(self, timeout=None):
+        """Alle neuen Frames, sobald welche da sind ([] nach `timeout` Sekunden ohne Frame)."""
+        if self._fd is None:
+            frames = self.ring.read_available()
+            if not frames:
+                await asyncio.sleep(self.poll_interval)
+            return frames
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        # Vor dem Lesen zurücksetzen: ein Frame, der währenddessen kommt, weckt erneut
+        self._ready.clear()
+        self.wakeups += 1
+        return self.ring.read_available()
+
+    def close(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
@@ -0,0 +1,222 @@
+# jarvis/services/audio_supervisor.py
+import contextlib
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from multiprocessing import spawn
+from jarvis import config
+from jarvis.services import system
+
+_POLL_INTERVAL = 0.1
+
+@contextlib.contextmanager
+def _without_main_module():
+    """
+    spawn/forkserver importieren im Kind sonst das Hauptmodul neu (jarvis.main: Mem0/Chroma,
+    Live API, ...). Der Worker braucht nur sein eigenes Modul -> Preparation Data ohne init_main_*.
+    """
+    original = spawn.get_preparation_data
+
+    def prepare(name):
+        data = original(name)
+        data.pop("init_main_from_name", None)
+        data.pop("init_main_from_path", None)
+        return data
+
+    spawn.get_preparation_data = prepare
+    try:
+        yield
+    finally:
+        spawn.get_preparation_data = original
+
+class _Worker:
+    def __init__(self, process, events, activate):
+        self.process = process
+        self.events = events
+        self.activate = activate
+        self.activated = None  # monotonic, ab dann muss der Heartbeat kommen
+        self.start_timeout = config.MIC_START_TIMEOUT  # bis zum ersten Frame nach der Aktivierung
+        self.missed = 0        # Prüfungen in Folge ohne Heartbeat
+
+class EventQueue:
+    """
+    Queue-Fassade für den Hauptprozess: liest immer aus der Event-Queue des gerade
+    aktiven Workers. Jeder Worker hat seine eigene Queue - ein hart gekillter Worker
+    kann die Queue-Locks halten, die darf der Nachfolger nicht erben.
+    """
+    def __init__(self, supervisor):
+        self._sup = supervisor
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = _POLL_INTERVAL if deadline is None else max(0.0, min(_POLL_INTERVAL, deadline - time.monotonic()))
+            try:
+                return self._sup.active_events().get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def get_nowait(self):
+        return self._sup.active_events().get_nowait()
+
+class AudioSupervisor:
+    """
+    Überwacht den audio_worker über den Heartbeat im AudioRing (statt über ausbleibende
+    Queue-Events mit 3 s Timeout) und hält einen Hot Standby bereit.
+
+    Der Standby-Worker ist fertig initialisiert (Porcupine geladen, Stream geöffnet aber
+    nicht gestartet - dsnoop erlaubt das parallel) und wartet nur auf sein activate-Event.
+    Fällt der aktive Worker aus (Prozess tot, oder MIC_STALL_CHECKS Prüfungen in Folge
+    länger als MIC_STALL_TIMEOUT kein Read), wird er per SIGKILL beendet und der Standby
+    übernimmt den Ring sofort. Zu viele Ausfälle in MIC_FAILOVER_WINDOW -> system.restart_service().
+
+    Worker starten über einen eigenen multiprocessing-Kontext (MIC_START_METHOD, Default
+    forkserver): fork() aus dem Supervisor-Thread eines Prozesses mit vielen Threads könnte
+    ein gerade gehaltenes Lock ins Kind kopieren, das dort nie wieder frei wird.
+
+    `target(ring, events, *args, activate)` ist die Worker-Funktion (main.audio_worker).
+    """
+    def __init__(self, target, ring, args):
+        self.target = target
+        self.ring = ring
+        self.args = tuple(args)
+        self.events = EventQueue(self)
+        self.failovers = 0
+        self.last_recovery_ms = None
+        self._active = None
+        self._standby = None
+        self._lock = threading.Lock()
+        self._recent_failovers = deque()
+        self._recovering_since = None
+        self._standby_retry_at = 0.0
+        self._stopped = False
+        self._ctx = multiprocessing.get_context(config.MIC_START_METHOD)
+        if config.MIC_START_METHOD == "forkserver":
+            # Der Forkserver lädt das Worker-Modul einmal, jeder Worker ist dann ein schneller fork() davon
+            self._ctx.set_forkserver_preload([target.__module__])
+
+    # --- WORKERS ---
+    def _spawn(self, standby):
+        events = self._ctx.Queue(maxsize=32)
+        activate = self._ctx.Event()
+        if not standby:
+            activate.set()
+        p = self._ctx.Process(target=self.target, args=(self.ring, events) + self.args + (activate,))
+        p.daemon = True
+        if config.MIC_START_METHOD == "fork":
+            p.start()
+        else:
+            with _without_main_module():
+                p.start()
+        worker = _Worker(p, events, activate)
+        if not standby:
+            worker.activated = time.monotonic()
+        return worker
+
+    def _kill(self, worker):
+        if worker is None:
+            return
+        try:
+            if worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGKILL)
+            worker.process.join(timeout=0.2)
+        except Exception:
+            pass
+
+    def active_events(self):
+        with self._lock:
+            return self._active.events
+
+    # --- LIFECYCLE ---
+    def start(self):
+        self._active = self._spawn(standby=False)
+        if config.MIC_HOT_STANDBY:
+            self._standby = self._spawn(standby=True)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stopped = True
+        self._kill(self._standby)
+        self._kill(self._active)
+
+    # --- SUPERVISION ---
+    def _check(self, worker, now):
+        """Gibt einen Ausfallgrund zurück oder None, wenn der Worker gesund ist."""
+        if not worker.process.is_alive():
+            return f"Prozess beendet (exit {worker.process.exitcode})"
+        heartbeat = self.ring.heartbeat()
+        if heartbeat < worker.activated:
+            # Noch kein Read seit der Aktivierung (Kaltstart: Porcupine Init + Gerät öffnen)
+            if now - worker.activated > worker.start_timeout:
+                return f"kein Frame {now - worker.activated:.1f}s nach Start"
+            return None
+        if now - heartbeat > config.MIC_STALL_TIMEOUT:
+            # Einzelne Aussetzer (GC, SD-Karte, CPU-Last) sind noch kein Ausfall
+            worker.missed += 1
+            if worker.missed >= config.MIC_STALL_CHECKS:
+                return f"kein Frame seit {(now - heartbeat) * 1000:.0f} ms"
+            return None
+        worker.missed = 0
+        return None
+
+    def _failover(self, reason, now):
+        failed = self._active
+        self._kill(failed)
+        # Audio-Lücke zählt ab dem letzten Frame des ausgefallenen Workers
+        gap_start = max(self.ring.heartbeat(), failed.activated)
+
+        self._recent_failovers.append(now)
+        while self._recent_failovers and now - self._recent_failovers[0] > config.MIC_FAILOVER_WINDOW:
+            self._recent_failovers.popleft()
+        if len(self._recent_failovers) > config.MIC_MAX_FAILOVERS:
+            print(f" [Audio] Kritischer Audio-Fehler ({len(self._recent_failovers)} Ausfälle in {config.MIC_FAILOVER_WINDOW}s). Starte Service neu...")
+            self._stopped = True
+            system.restart_service()
+            return
+
+        standby, self._standby = self._standby, None
+        if standby is not None and standby.process.is_alive():
+            standby.activated = time.monotonic()
+            # Schon initialisiert, es fehlt nur start_stream() und der erste Read
+            standby.start_timeout = config.MIC_STANDBY_START_TIMEOUT
+            standby.activate.set()
+            mode = "Hot Standby übernimmt"
+        else:
+            self._kill(standby)
+            standby = self._spawn(standby=False)
+            mode = "Kaltstart"
+        with self._lock:
+            self._active = standby
+        self.failovers += 1
+        self._recovering_since = gap_start
+        print(f" [Audio] Mic-Worker ausgefallen ({reason}) -> {mode}", flush=True)
+
+    def _run(self):
+        while not self._stopped:
+            time.sleep(_POLL_INTERVAL)
+            now = time.monotonic()
+            try:
+                reason = self._check(self._active, now)
+                if reason:
+                    self._failover(reason, now)
+                    continue
+
+                if self._recovering_since and self.ring.heartbeat() >= self._active.activated:
+                    # Erster Frame des Nachfolgers: jetzt erst neuen Standby forken (CPU gehört erst der Aufnahme)
+                    self.last_recovery_ms = (self.ring.heartbeat() - self._recovering_since) * 1000
+                    self._recovering_since = None
+                    print(f" [Audio] Mic wieder da, Audio-Lücke {self.last_recovery_ms:.0f} ms", flush=True)
+
+                if config.MIC_HOT_STANDBY and not self._recovering_since and now >= self._standby_retry_at:
+                    if self._standby is None or not self._standby.process.is_alive():
+                        if self._standby is not None:
+                            print(f" [Audio] Standby-Worker beendet (exit {self._standby.process.exitcode}), starte neu...")
+                            self._standby_retry_at = now + 5.0
+                        self._standby = self._spawn(standby=True)
+            except Exception as e:
+                print(f" [Audio] Supervisor Fehler: {e}")
@@ -0,0 +1,189 @@
+# jarvis/services/capture.py
+import os
+import queue
+import signal
+import sys
+import time
+import pyaudio
+import pvporcupine
+
+from jarvis import config
+from jarvis.services.audio_features import AudioFeatures
+from jarvis.services.resample import PolyphaseDecimator
+from jarvis.services.recorder import FrameRecorder, FrameReplay
+from jarvis.services.latency import LatencyStats
+
+# Eigenes Modul (statt main.py): der AudioSupervisor startet Worker per forkserver, der
+# Kindprozess importiert nur das hier - nicht Mem0, Live API & Co. aus main.
+
+def audio_worker(output_ring, events, frame_length, rate, channels, activate=None):
+    """
+    Capture-Prozess. Schreibt jeden Frame in den Shared-Memory Ring.
+    Im Idle-Modus (Ring nicht im Stream-Modus) läuft Porcupine HIER und an den
+    Hauptprozess gehen nur kleine Events:
+      ("wake", seq, timestamp)         Wake Word erkannt (seq = auslösender Frame)
+      ("level", avg_rms, peak_rms, ts) Pegel-Statistik alle AUDIO_LEVEL_INTERVAL s
+    Zeitstempel sind Capture-Zeiten (time.monotonic() des letzten Samples eines Frames,
+    korrigiert um das, was beim Lesen noch im ALSA-Puffer lag).
+    Mit CAPTURE_NATIVE wird das Gerät mit nativer Rate/Kanalzahl geöffnet und hier
+    gemischt + dezimiert (statt ALSA plug/route), heraus kommen dieselben 512er Frames.
+    AUDIO_RECORD_PATH schreibt alle Frames mit (mmap), AUDIO_REPLAY_PATH ersetzt das
+    Mikrofon durch eine Aufnahme (kein Audio-Gerät nötig, für Benchmarks).
+
+    Als Hot Standby (`activate` nicht gesetzt) wird alles vorbereitet (Porcupine, Stream
+    geöffnet aber nicht gestartet) und dann auf `activate` gewartet. Nach jedem Read
+    schreibt der Worker Heartbeat und Stream-Health in den Ring (AudioSupervisor).
+    """
+    try:
+        from ctypes import CFUNCTYPE, c_char_p, c_int, cdll
+        def py_error_handler(filename, line, function, err, fmt): pass
+        c_error_handler = CFUNCTYPE(None, c_char_p, c_int, c_char_p, c_int, c_char_p)(py_error_handler)
+        asound = cdll.LoadLibrary('libasound.so.2')
+        asound.snd_lib_error_set_handler(c_error_handler)
+    except: pass
+
+    def get_mic_index(pa, name):
+        for i in range(pa.get_device_count()):
+            try:
+                info = pa.get_device_info_by_index(i)
+                if name in info.get('name', ''): return i
+            except: pass
+        return None
+
+    def emit(event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            pass # Hauptprozess hängt, Events sind nicht kritisch
+
+    def overflow_check(stream, frames_per_buffer, device_rate):
+        # Input Overflow erkennen, ohne den Read zu verlieren: mit exception_on_overflow=True würde
+        # PyAudio den schon gelesenen Frame verwerfen. Stattdessen: Eingangspuffer (~Input Latency) voll?
+        try:
+            capacity = int(stream.get_input_latency() * device_rate)
+        except Exception:
+            capacity = 0
+        limit = max(capacity, frames_per_buffer * 2)
+
+        def check():
+            if stream.get_read_available() >= limit:
+                output_ring.add_health(xruns=1)
+        return check
+
+    try:
+        porcupine = pvporcupine.create(access_key=config.PICOVOICE_KEY, keywords=[config.WAKE_WORD], sensitivities=[0.4])
+    except Exception as e:
+        print(f" [Audio Worker] Porcupine Init Error: {e}")
+        return
+
+    pa = stream = None
+    if config.AUDIO_REPLAY_PATH:
+        source = FrameReplay(config.AUDIO_REPLAY_PATH, frame_length, speed=config.AUDIO_REPLAY_SPEED, loop=config.AUDIO_REPLAY_LOOP, rate=rate)
+        print(f" [Audio Worker] Replay: {source.pcm_path} ({source.total} Frames, speed {config.AUDIO_REPLAY_SPEED})")
+        read_frames = source.read_frames
+
+        def backlog():
+            return 0.0
+    elif config.CAPTURE_NATIVE:
+        pa = pyaudio.PyAudio()
+        factor = config.CAPTURE_DEVICE_RATE // rate
+        decimator = PolyphaseDecimator(factor, config.CAPTURE_DEVICE_CHANNELS, frame_length)
+        mic_index = get_mic_index(pa, config.CAPTURE_DEVICE)
+        stream = pa.open(rate=config.CAPTURE_DEVICE_RATE, channels=config.CAPTURE_DEVICE_CHANNELS, format=pyaudio.paInt16, input=True, input_device_index=mic_index, frames_per_buffer=frame_length * factor, start=False)
+        print(f" [Audio Worker] Native Capture: {config.CAPTURE_DEVICE} @ {config.CAPTURE_DEVICE_RATE} Hz x {config.CAPTURE_DEVICE_CHANNELS} -> {rate} Hz mono")
+
+        check_overflow = overflow_check(stream, frame_length * factor, config.CAPTURE_DEVICE_RATE)
+
+        def read_frames():
+            check_overflow()
+            return decimator.frames(stream.read(frame_length * factor, exception_on_overflow=False))
+
+        def backlog():
+            return stream.get_read_available() / config.CAPTURE_DEVICE_RATE
+    else:
+        pa = pyaudio.PyAudio()
+        mic_index = get_mic_index(pa, "jarvis_mic")
+        stream = pa.open(rate=rate, channels=channels, format=pyaudio.paInt16, input=True, input_device_index=mic_index, frames_per_buffer=frame_length, start=False)
+
+        check_overflow = overflow_check(stream, frame_length, rate)
+
+        def read_frames():
+            check_overflow()
+            return [stream.read(frame_length, exception_on_overflow=False)]
+
+        def backlog():
+            return stream.get_read_available() / rate
+
+    if activate is not None and not activate.is_set():
+        activate.wait()
+    output_ring.claim_producer(os.getpid())
+    if stream: stream.start_stream()
+
+    recorder = None
+    if config.AUDIO_RECORD_PATH:
+        recorder = FrameRecorder(config.AUDIO_RECORD_PATH, frame_length * 2, max_seconds=config.AUDIO_RECORD_MAX_SECONDS, rate=rate)
+        print(f" [Audio Worker] Aufnahme nach {recorder.pcm_path}")
+        # terminate() vom Watchdog -> SystemExit, damit finally die Aufnahme sauber abschließt
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    features = AudioFeatures()
+    frame_s = frame_length / rate
+    wake_latency = LatencyStats("porcupine")
+    stall_limit = frame_s * config.MIC_STALL_FRAMES
+    errors_in_row = 0
+    level_sum = 0.0
+    level_peak = 0.0
+    level_count = 0
+    last_level_emit = time.monotonic()
+    try:
+        while True:
+            read_start = time.monotonic()
+            try:
+                frames = read_frames()
+            except IOError as e:
+                output_ring.add_health(read_errors=1)
+                errors_in_row += 1
+                print(f" [Audio Worker] Read Error ({errors_in_row}): {e}")
+                if errors_in_row >= 5:
+                    break # Worker endet, der Supervisor schaltet auf den Standby um
+                time.sleep(frame_s)
+                continue
+            errors_in_row = 0
+            now = time.monotonic()
+            output_ring.beat(now)
+            if now - read_start > stall_limit:
+                output_ring.add_health(stalls=1)
+            try:
+                end_ts = now - backlog()
+            except Exception:
+                end_ts = now
+            for i, pcm in enumerate(frames):
+                ts = end_ts - (len(frames) - 1 - i) * frame_s
+                seq = output_ring.write(pcm, ts)
+                if recorder:
+                    recorder.write(pcm, ts)
+
+                if output_ring.is_streaming():
+                    # Hauptprozess (Live Session) konsumiert die Frames selbst
+                    wake_latency.reset_sequence()
+                    continue
+
+                if porcupine.process(memoryview(pcm).cast("h")) >= 0:
+                    emit(("wake", seq, ts))
+                wake_latency.record(seq, ts)
+                wake_latency.maybe_report(config.LATENCY_REPORT_INTERVAL)
+
+                rms = features.process(pcm).rms
+                level_sum += rms
+                level_peak = max(level_peak, rms)
+                level_count += 1
+                if ts - last_level_emit >= config.AUDIO_LEVEL_INTERVAL:
+                    emit(("level", level_sum / level_count, level_peak, ts))
+                    level_sum, level_peak, level_count = 0.0, 0.0, 0
+                    last_level_emit = ts
+    except: pass 
+    finally:
+        if stream: stream.close()
+        if pa: pa.terminate()
+        if recorder: recorder.close()
+        porcupine.delete()
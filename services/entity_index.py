@@ -0,0 +1,294 @@
+# jarvis/services/entity_index.py
+import hashlib
+import os
+import re
+import threading
+import time
+import numpy as np
+
+from jarvis import config, state as global_state
+from jarvis.utils import session
+from jarvis.services import ha
+
+# BM25 Parameter
+K1 = 1.2
+B = 0.75
+PARTIAL_MATCH = 0.7        # Gewicht, wenn ein Query-Wort nur Teil eines Index-Worts ist (oder umgekehrt, Komposita)
+USAGE_BOOST = 0.5          # Kürzlich gesteuerte Geräte: Score bis zu +50% (halbiert sich alle USAGE_HALF_LIFE)
+USAGE_HALF_LIFE = 3600     # Sekunden
+EMBED_WEIGHT = 0.5         # Anteil der Kosinus-Ähnlichkeit (nur mit ENTITY_EMBEDDINGS)
+EMBED_MIN_SIM = 0.55       # Ohne lexikalischen Treffer: darunter gilt die Anfrage als allgemein
+EMBED_MODEL = "gemini-embedding-001"
+EMBED_DIM = 256
+
+# Deutsche Wörter, unter denen die Domains gefunden werden ("Licht" -> light.*)
+DOMAIN_WORDS = {
+    "light": "licht lichter lampe lampen beleuchtung hell dunkel dimmen helligkeit farbe",
+    "switch": "steckdose schalter strom",
+    "media_player": "musik lautsprecher lauter leiser lautstarke pause weiter song lied radio player abspielen fernseher tv receiver",
+    "climate": "heizung thermostat temperatur warm kalt grad",
+    "cover": "rollladen rolladen jalousie rollo beschattung",
+    "sensor": "sensor temperatur luftfeuchtigkeit feuchtigkeit verbrauch wert",
+    "lock": "schloss tur abschliessen",
+    "vacuum": "staubsauger saugen",
+    "fan": "ventilator lufter",
+    "person": "standort wo",
+    "weather": "wetter",
+    "calendar": "termin termine kalender",
+    "todo": "einkaufsliste liste",
+    "scene": "szene stimmung",
+    "script": "skript routine",
+    "button": "knopf taste drucken",
+    "input_boolean": "schalter modus",
+}
+
+# Nach diesen Wörtern geht es um "alles" -> volle Liste
+GENERIC_WORDS = {"alle", "alles", "uberall", "haus", "wohnung", "gerate", "status", "ubersicht", "zuhause"}
+
+STOPWORDS = {
+    "der", "die", "das", "den", "dem", "des", "ein", "eine", "einen", "einem", "und", "oder", "mach", "mache",
+    "bitte", "an", "aus", "ist", "im", "in", "am", "auf", "zu", "zum", "zur", "mir", "mal", "wie", "was", "noch",
+    "jarvis", "kannst", "du", "ich", "es", "sind", "schalte", "schalt", "stell", "stelle", "mit", "von", "fur",
+    "bei", "hey", "ok", "okay", "jetzt", "gerade", "ganz", "etwas", "bisschen", "mehr", "weniger",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_UMLAUTS = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+
+def tokenize(text):
+    # Umlaute wie HA-Slugs (Küche -> kuche), damit Name und Entity ID gleich tokenisieren
+    return _WORD.findall(str(text).lower().translate(_UMLAUTS))
+
+def _doc_text(dev, area):
+    eid = dev["entity_id"]
+    domain = eid.split(".")[0]
+    return " ".join([dev.get("name", ""), area or "", eid.replace("_", " ").replace(".", " "), DOMAIN_WORDS.get(domain, "")])
+
+class _Embeddings:
+    """Optionale Vektoren (gemini-embedding-001) der Entity-Dokumente, gecacht nach Text-Hash in ENTITY_EMBED_FILE."""
+    def __init__(self, path):
+        self.path = path
+        self._vectors = self._load()   # sha1(text) -> np.ndarray (normiert)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            data = np.load(self.path)
+            return {k: data[k] for k in data.files}
+        except Exception:
+            return {}
+
+    def _save(self):
+        try:
+            tmp = self.path + ".tmp.npz"
+            np.savez(tmp, **self._vectors)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f" [Entities] Embedding cache write failed: {e}", flush=True)
+
+    def _embed(self, texts, task):
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{EMBED_MODEL}:batchEmbedContents?key={config.get_next_key()}"
+        batch = [{"model": f"models/{EMBED_MODEL}", "content": {"parts": [{"text": t}]},
+                  "taskType": task, "outputDimensionality": EMBED_DIM} for t in texts]
+        r = session.post(url, json={"requests": batch}, timeout=15)
+        r.raise_for_status()
+        vectors = np.asarray([e["values"] for e in r.json()["embeddings"]], dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+    def documents(self, texts):
+        """(n, EMBED_DIM) Matrix, fehlende Vektoren werden in Batches von 100 nachgeladen."""
+        keys = [hashlib.sha1(t.encode()).hexdigest() for t in texts]
+        with self._lock:
+            missing = [(k, t) for k, t in dict(zip(keys, texts)).items() if k not in self._vectors]
+            for i in range(0, len(missing), 100):
+                batch = missing[i:i + 100]
+                for (k, _), v in zip(batch, self._embed([t for _, t in batch], "RETRIEVAL_DOCUMENT")):
+                    self._vectors[k] = v
+            if missing:
+                self._save()
+                print(f" [Entities] {len(missing)} Embeddings berechnet ({len(self._vectors)} gecacht)", flush=True)
+            return np.stack([self._vectors[k] for k in keys])
+
+    def query(self, text):
+        return self._embed([text], "RETRIEVAL_QUERY")[0]
+
+class EntityIndex:
+    """
+    Lokaler Suchindex über state.HA_CONTEXT, damit der Slow Brain Prompt nur die zur
+    Anfrage passenden Geräte (mit Status und Attributen) enthält statt aller Entities.
+
+    Dokument pro Entity: Name, Bereich (HA Area Registry, stündlich per Template API),
+    Entity ID und deutsche Wörter zur Domain. Suche: BM25 (numpy, eine vorberechnete
+    Gewichtsmatrix; Komposita wie "Wohnzimmerlicht" treffen über Teilwörter), plus ein
+    Bonus für kürzlich gesteuerte Geräte und optional Kosinus-Ähnlichkeit gecachter
+    Embeddings (ENTITY_EMBEDDINGS).
+
+    select() liefert die ENTITY_TOP_K besten Geräte plus ENTITY_PINNED. Ist die Anfrage
+    allgemein ("alle Lichter aus", keine Treffer, kein Text) oder die Liste ohnehin klein,
+    kommt die volle Liste zurück.
+
+    Der Index wird neu gebaut, sobald main die HA_CONTEXT Liste ersetzt (Identität als Fingerprint).
+    """
+    def __init__(self, top_k=None, pinned=None, embeddings=None):
+        self.top_k = config.ENTITY_TOP_K if top_k is None else top_k
+        self.pinned = set(config.ENTITY_PINNED if pinned is None else pinned)
+        self.embeddings = _Embeddings(config.ENTITY_EMBED_FILE) if (config.ENTITY_EMBEDDINGS if embeddings is None else embeddings) else None
+        self._lock = threading.Lock()
+        self._source = None         # HA_CONTEXT Liste, aus der der Index gebaut wurde
+        self._devices = []
+        self._vocab = {}            # Wort -> Spalte
+        self._weights = None        # (Geräte, Wörter) BM25 Gewichte
+        self._vectors = None        # (Geräte, EMBED_DIM) oder None
+        self._areas = {}
+        self._areas_at = 0.0
+        self._areas_loading = False
+        self._last_used = {}        # entity_id -> time.time()
+
+    # --- INDEX ---
+    def _refresh_areas(self):
+        try:
+            areas = ha.get_entity_areas()
+            if areas:
+                with self._lock:
+                    self._areas = areas
+                    self._source = None  # beim nächsten Zugriff mit Bereichen neu bauen
+        finally:
+            self._areas_at = time.time()
+            self._areas_loading = False
+
+    def _ensure(self, devices):
+        if not self._areas_loading and time.time() - self._areas_at > config.ENTITY_AREA_REFRESH:
+            self._areas_loading = True
+            threading.Thread(target=self._refresh_areas, daemon=True).start()
+        if devices is self._source:
+            return
+        t0 = time.perf_counter()
+        texts = [_doc_text(dev, self._areas.get(dev["entity_id"])) for dev in devices]
+        docs = [tokenize(t) for t in texts]
+        vocab = {}
+        for doc in docs:
+            for word in doc:
+                vocab.setdefault(word, len(vocab))
+        tf = np.zeros((len(docs), max(1, len(vocab))), dtype=np.float32)
+        for i, doc in enumerate(docs):
+            for word in doc:
+                tf[i, vocab[word]] += 1
+        lengths = tf.sum(axis=1, keepdims=True)
+        avg = max(float(lengths.mean()), 1.0) if len(docs) else 1.0
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        weights = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths / avg))
+        self._source, self._devices, self._vocab, self._weights, self._vectors = devices, devices, vocab, weights, None
+        if self.embeddings and devices:
+            threading.Thread(target=self._load_vectors, args=(devices, texts), daemon=True).start()
+        print(f" [Entities] Index: {len(devices)} Geräte, {len(vocab)} Wörter ({(time.perf_counter() - t0) * 1000:.0f} ms)", flush=True)
+
+    def _load_vectors(self, devices, texts):
+        try:
+            vectors = self.embeddings.documents(texts)
+        except Exception as e:
+            print(f" [Entities] Embeddings failed: {e}", flush=True)
+            return
+        with self._lock:
+            if self._source is devices:
+                self._vectors = vectors
+
+    def _snapshot(self, devices):
+        """(Geräte, Vokabular, BM25 Gewichte, Vektoren) eines konsistenten Index-Stands."""
+        with self._lock:
+            self._ensure(devices)
+            return self._devices, self._vocab, self._weights, self._vectors
+
+    # --- SEARCH ---
+    @staticmethod
+    def _query_columns(vocab, words):
+        cols = {}
+        for q in words:
+            for word, col in vocab.items():
+                if word == q:
+                    cols[col] = max(cols.get(col, 0.0), 1.0)
+                elif min(len(word), len(q)) >= 4 and (word in q or q in word):
+                    cols[col] = max(cols.get(col, 0.0), PARTIAL_MATCH)
+        return cols
+
+    def scores(self, query, devices=None):
+        """
+        Relevanz pro Gerät (Reihenfolge wie HA_CONTEXT) oder None, wenn die Anfrage allgemein ist.
+        Nur der Index-Stand wird unter dem Lock gelesen; Query-Embedding (HTTP) und Rechnung laufen ohne.
+        """
+        devices, vocab, weights, vectors = self._snapshot(global_state.HA_CONTEXT or [] if devices is None else devices)
+        words = [w for w in tokenize(query or "") if w not in STOPWORDS]
+        if not words or GENERIC_WORDS.intersection(words) or not devices:
+            return None
+        cols = self._query_columns(vocab, words)
+        lexical = np.zeros(len(devices), dtype=np.float32)
+        if cols:
+            idx = np.fromiter(cols.keys(), dtype=np.int64)
+            lexical = weights[:, idx] @ np.fromiter(cols.values(), dtype=np.float32)
+        best = float(lexical.max())
+        scores = lexical / best if best > 0 else lexical
+        if vectors is not None:
+            try:
+                sim = vectors @ self.embeddings.query(query)
+            except Exception as e:
+                print(f" [Entities] Query embedding failed: {e}", flush=True)
+                sim = None
+            if sim is not None:
+                if best <= 0 and float(sim.max()) < EMBED_MIN_SIM:
+                    return None
+                scores = scores + EMBED_WEIGHT * sim
+                best = max(best, float(sim.max()))
+        if best <= 0:
+            return None
+        # Kürzlich genutzte Geräte nur unter den Treffern nach vorne holen
+        now = time.time()
+        for i, dev in enumerate(devices):
+            used = self._last_used.get(dev["entity_id"])
+            if used:
+                scores[i] *= 1 + USAGE_BOOST * 0.5 ** ((now - used) / USAGE_HALF_LIFE)
+        return scores
+
+    def select(self, query, devices=None):
+        """
+        (Geräte für den Prompt, Grund). Reihenfolge wie in HA_CONTEXT.
+        Grund: "top-k", "generic" (volle Liste) oder "small" (volle Liste, ohnehin kurz).
+        """
+        devices = global_state.HA_CONTEXT if devices is None else devices
+        if not devices:
+            return devices or [], "small"
+        if len(devices) <= self.top_k + len(self.pinned):
+            return devices, "small"
+        scores = self.scores(query, devices)
+        if scores is None:
+            return devices, "generic"
+        ranked = np.argsort(-scores, kind="stable")[:self.top_k]
+        keep = {int(i) for i in ranked if scores[i] > 0}
+        keep.update(i for i, dev in enumerate(devices) if dev["entity_id"] in self.pinned)
+        return [dev for i, dev in enumerate(devices) if i in keep], "top-k"
+
+    def touch(self, entity_ids):
+        """Merkt sich gesteuerte Geräte (Bonus bei den nächsten Anfragen)."""
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        now = time.time()
+        for eid in entity_ids or ():
+            if isinstance(eid, str) and "." in eid:
+                self._last_used[eid] = now
+
+    def find_devices(self, query, limit=10):
+        """Tool: Geräte passend zu `query` (für Geräte, die nicht im Prompt stehen)."""
+        devices = global_state.HA_CONTEXT or []
+        scores = self.scores(query, devices)
+        areas = self._areas
+        if scores is None:
+            return "Keine passenden Geräte gefunden. Bitte genauer beschreiben (Raum, Gerätetyp, Name)."
+        lines = []
+        for i in np.argsort(-scores, kind="stable")[:limit]:
+            if scores[i] <= 0:
+                break
+            dev = devices[i]
+            area = areas.get(dev["entity_id"])
+            lines.append(f"- {dev['name']} [ID: {dev['entity_id']}] ({dev['state']})" + (f" {{Bereich: {area}}}" if area else ""))
+        return "\n".join(lines) or "Keine passenden Geräte gefunden."
+
+entity_index = EntityIndex()
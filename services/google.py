@@ -1,13 +1,14 @@
-import subprocess
 import json
+import queue
+import threading
 import base64
 import time
 import wave
-import threading
 from aiy.leds import Leds
 from jarvis.config import GOOGLE_TTS_KEY, DIM_BLUE, get_gemini_url, GEMINI_STT_URL, MY_LAT, MY_LNG
 from jarvis.utils import session
 from jarvis.services import sfx
+from jarvis.services.mixer import mixer, PRIORITY_SPEECH
 
 def transcribe_audio(audio_bytes):
     """
@@ -141,13 +142,13 @@ def speak_text_gemini(leds, text, mood="normal", interrupt_check=None):
         }
     }
     
-    player_command = ["aplay", "-r", "24000", "-f", "S16_LE", "-c", "1", "-t", "raw", "--buffer-time=500000"]
-    player_process = None
+    voice = None
 
     try:
         t_start = time.time() # Zeitmessung Start
 
-        player_process = subprocess.Popen(player_command, stdin=subprocess.PIPE)
+        # Stimme im OutputMixer statt aplay-Prozess (Gerät ist schon offen)
+        voice = mixer.open_voice("tts", priority=PRIORITY_SPEECH)
         
         response = session.post(url, json=payload, stream=True, timeout=60)
         
@@ -179,8 +180,7 @@ def speak_text_gemini(leds, text, mood="normal", interrupt_check=None):
                                             first_chunk_received = True
                                         
                                         audio_chunk = base64.b64decode(b64)
-                                        player_process.stdin.write(audio_chunk)
-                                        player_process.stdin.flush()
+                                        voice.write(audio_chunk)
                                 
                                 if cand.get('finishReason'):
                                     break
@@ -192,16 +192,14 @@ def speak_text_gemini(leds, text, mood="normal", interrupt_check=None):
         print(f" [TTS Exception] {e}")
         
     finally:
-        if player_process:
-            try:
-                player_process.stdin.close()
-                # Wenn unterbrochen wurde, töten wir den Prozess sofort, damit der Ton stoppt
-                if was_interrupted:
-                    player_process.terminate()
-                else:
-                    player_process.wait(timeout=2)
-            except:
-                player_process.terminate()
+        if voice:
+            # Wenn unterbrochen wurde, stoppen wir die Stimme sofort, sonst spielt sie zu Ende
+            if was_interrupted:
+                voice.stop()
+            else:
+                voice.end()
+                limit = voice.buffered_seconds() + voice.get_output_latency() + 2.0
+                was_interrupted = voice.wait(interrupt_check, timeout=limit)
 
     return was_interrupted
 
@@ -238,70 +236,138 @@ def speak_text_old(leds, text, interrupt_check=None):
 
     return False
 
-def speak_text(leds, text, interrupt_check=None):
-    if not text or not text.strip(): return False
-    
-    print("   Jarvis: " + text)
-    leds.update(Leds.rgb_on(DIM_BLUE))
-    
+def synthesize(text):
+    """Google TTS (Journey Voice) -> rohes 24 kHz PCM, None bei Fehlern."""
     url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={GOOGLE_TTS_KEY}"
     payload = {
         "input": {"text": text},
         "voice": {"languageCode": "de-DE", "name": "de-DE-Journey-D"}, # faster voice: "voice": {"languageCode": "de-DE", "name": "de-DE-Neural2-D", "ssmlGender": "MALE"},
         "audioConfig": {"audioEncoding": "LINEAR16", "sampleRateHertz": 24000}
     }
+    r = session.post(url, json=payload, timeout=10)
+    if r.status_code != 200:
+        print(f" [TTS API Error] Status: {r.status_code}")
+        return None
+    content = r.json().get('audioContent')
+    if not content:
+        return None
+    audio_binary = base64.b64decode(content)
+    # LINEAR16 kommt als WAV (44 Byte Header) - der Mixer will rohes PCM
+    if audio_binary[:4] == b"RIFF":
+        audio_binary = audio_binary[44:]
+    return audio_binary
+
+def speak_text(leds, text, interrupt_check=None):
+    if not text or not text.strip(): return False
+    
+    print("   Jarvis: " + text)
+    leds.update(Leds.rgb_on(DIM_BLUE))
     
     was_interrupted = False
-    player_process = None
+    voice = None
 
     try:
-        r = session.post(url, json=payload, timeout=10)
+        audio_binary = synthesize(text)
         
-        if r.status_code == 200:
-            data = r.json()
-            content = data.get('audioContent')
-            
-            if content:
-                audio_binary = base64.b64decode(content)
-                
-                cmd = ["aplay", "-t", "raw", "-f", "S16_LE", "-r", "24000", "-c", "1", "-q", "--buffer-time=500000"]
-                player_process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
-                
-                def writer():
-                    try:
-                        player_process.stdin.write(audio_binary)
-                    except Exception:
-                        pass 
-                    finally:
-                        try:
-                            player_process.stdin.close()
-                        except: pass
+        if audio_binary:
+            # Über den OutputMixer (kein aplay-Prozess, kein Geräte-Open pro Antwort)
+            voice = mixer.play(audio_binary, name="tts", priority=PRIORITY_SPEECH)
 
-                t = threading.Thread(target=writer)
-                t.daemon = True # Thread stirbt, wenn Hauptprogramm endet
-                t.start()
-
-                # Jetzt können wir SOFORT prüfen, auch wenn write() noch beschäftigt ist
-                while player_process.poll() is None:
-                    if interrupt_check and interrupt_check():
-                        player_process.terminate()
-                        was_interrupted = True
-                        print("   [TTS] Unterbrochen.")
-                        break
-                    time.sleep(0.05)
-
-        else:
-            print(f" [TTS API Error] Status: {r.status_code}")
+            # Wartet bis hörbar zu Ende, prüft dabei alle 50 ms auf Unterbrechung
+            if voice.wait(interrupt_check):
+                was_interrupted = True
+                print("   [TTS] Unterbrochen.")
             
     except Exception as e:
         print(f" [TTS Exception] {e}")
 
     finally:
-        if player_process and player_process.poll() is None:
-            player_process.terminate()
+        if voice and not voice.done.is_set():
+            voice.stop()
             
     return was_interrupted
 
+class SentenceSpeaker:
+    """
+    TTS-Pipeline für gestreamte Antworten (llm.ask_gemini_stream): say() nimmt fertige
+    Sätze an, ein Worker synthetisiert sie der Reihe nach und hängt das PCM an eine
+    Mixer-Stimme. Während ein Satz gespielt wird, wird der nächste schon synthetisiert.
+    finish() wartet bis alles gesprochen ist, cancel() bricht sofort ab.
+    """
+    def __init__(self, leds, interrupt_check=None):
+        self.leds = leds
+        self.interrupt_check = interrupt_check
+        self.voice = None
+        self.interrupted = False
+        self.sentences = 0
+        self.started = time.monotonic()
+        self.first_audio = None   # time.monotonic() als das erste PCM an den Mixer ging
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="tts-pipeline", daemon=True)
+        self._thread.start()
+
+    def say(self, sentence):
+        if sentence and not self.interrupted:
+            self.sentences += 1
+            self._queue.put(sentence)
+
+    def is_interrupted(self):
+        return self.interrupted
+
+    def _check_interrupt(self):
+        if self.interrupt_check and self.interrupt_check():
+            self.cancel()
+        return self.interrupted
+
+    def _run(self):
+        while True:
+            try:
+                sentence = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                # Die Antwort wird noch generiert, aber es wird schon gesprochen: Barge-In prüfen
+                if self.voice is not None and self._check_interrupt():
+                    return
+                continue
+            if sentence is None or self._check_interrupt():
+                return
+            print("   Jarvis: " + sentence)
+            try:
+                pcm = synthesize(sentence)
+            except Exception as e:
+                print(f" [TTS Exception] {e}")
+                continue
+            if not pcm or self.interrupted:
+                continue
+            if self.voice is None:
+                self.leds.update(Leds.rgb_on(DIM_BLUE))
+                self.voice = mixer.open_voice("tts", priority=PRIORITY_SPEECH)
+                self.first_audio = time.monotonic()
+                print(f" [Latency] Slow Brain -> first spoken word: {(self.first_audio - self.started) * 1000:.0f} ms", flush=True)
+            self.voice.write(pcm)
+
+    def finish(self):
+        """Wartet bis alle Sätze gesprochen (und hörbar zu Ende) sind. True wenn unterbrochen."""
+        self._queue.put(None)
+        while self._thread.is_alive():
+            if self._check_interrupt():
+                break
+            self._thread.join(0.05)
+        if self.voice and not self.interrupted:
+            # end() auf eine bereits leere Stimme ist sofort fertig, sonst höchstens Restaudio + Reserve
+            self.voice.end()
+            limit = self.voice.buffered_seconds() + self.voice.get_output_latency() + 2.0
+            if self.voice.wait(self.interrupt_check, timeout=limit):
+                self.interrupted = True
+        if self.interrupted:
+            print("   [TTS] Unterbrochen.")
+        return self.interrupted
+
+    def cancel(self):
+        self.interrupted = True
+        self._queue.put(None)
+        if self.voice:
+            self.voice.stop()
+
 def perform_google_search_internal(query):
     """Performs search via a separate Gemini call."""
     print(f"  [Internal] Searching: {query}")
@@ -102,6 +102,30 @@ def fetch_ha_context():
     
     return [], {}
 
+def get_entity_areas():
+    """
+    Entity ID -> Bereich (Raum) aus der HA Area Registry, über die Template API.
+    Entities ohne eigenen Bereich erben den ihres Geräts (area_name macht das).
+    """
+    if not HA_URL or not HA_TOKEN: return {}
+    headers = {"Authorization": "Bearer " + HA_TOKEN, "content-type": "application/json"}
+    template = (
+        "{% for s in states %}{% set a = area_name(s.entity_id) %}"
+        "{% if a %}{{ s.entity_id }}|{{ a }}\n{% endif %}{% endfor %}"
+    )
+    try:
+        r = session.post(f"{HA_URL}/api/template", headers=headers, json={"template": template}, timeout=10)
+        if r.status_code == 200:
+            areas = {}
+            for line in r.text.splitlines():
+                eid, _, area = line.partition("|")
+                if area:
+                    areas[eid.strip()] = area.strip()
+            return areas
+    except Exception as e:
+        print(f"[HA Error] Areas: {e}")
+    return {}
+
 def get_ha_history(entity_ids, start_time, end_time=None, minimal_response=False, max_events=100):
     """
     Fetches history for specific entities.
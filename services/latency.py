@@ -0,0 +1,76 @@
+# jarvis/services/latency.py
+import time
+from collections import deque
+import numpy as np
+
+class LatencyStats:
+    """
+    Queueing-Delay einer Pipeline-Stufe: wie alt ist ein Frame/Event (seit Capture),
+    wenn diese Stufe ihn verarbeitet. Dazu Lücken in den Sequenznummern (Drops).
+
+    record() ist billig (ein append), Perzentile werden erst in summary() berechnet.
+    Alle Zeiten sind time.monotonic() (gleiche Uhr in allen Prozessen).
+    """
+    def __init__(self, name, window=4096):
+        self.name = name
+        self._delays = deque(maxlen=window)
+        self._last_seq = None
+        self._last_report = time.monotonic()
+        self.count = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.reordered = 0
+
+    def record(self, seq, timestamp, now=None):
+        """`seq` oder `timestamp` dürfen None sein (Events ohne Seq / Frames ohne Messung)."""
+        if timestamp is not None:
+            self._delays.append((time.monotonic() if now is None else now) - timestamp)
+            self.count += 1
+        if seq is not None:
+            if self._last_seq is not None:
+                if seq > self._last_seq + 1:
+                    self.gaps += 1
+                    self.dropped += seq - self._last_seq - 1
+                elif seq <= self._last_seq:
+                    self.reordered += 1
+            self._last_seq = seq
+
+    def reset_sequence(self):
+        """Neuer Strom (z.B. neue Session mit Seek): die nächste Seq ist keine Lücke."""
+        self._last_seq = None
+
+    def summary(self, reset=True):
+        d = np.fromiter(self._delays, dtype=np.float64) * 1000 if self._delays else np.zeros(0)
+        s = {
+            "count": self.count,
+            "p50": float(np.percentile(d, 50)) if d.size else 0.0,
+            "p95": float(np.percentile(d, 95)) if d.size else 0.0,
+            "p99": float(np.percentile(d, 99)) if d.size else 0.0,
+            "max": float(d.max()) if d.size else 0.0,
+            "gaps": self.gaps,
+            "dropped": self.dropped,
+            "reordered": self.reordered,
+        }
+        if reset:
+            self._delays.clear()
+            self.count = self.gaps = self.dropped = self.reordered = 0
+        return s
+
+    def format(self, reset=True):
+        s = self.summary(reset)
+        text = (f" [Latency] {self.name}: n={s['count']} p50 {s['p50']:.1f} ms | p95 {s['p95']:.1f} | "
+                f"p99 {s['p99']:.1f} | max {s['max']:.1f}")
+        if s["gaps"] or s["reordered"]:
+            text += f" | gaps {s['gaps']} ({s['dropped']} frames), reordered {s['reordered']}"
+        return text
+
+    def maybe_report(self, interval):
+        """Druckt die Zusammenfassung, wenn `interval` Sekunden vergangen sind (und es Daten gibt)."""
+        now = time.monotonic()
+        if now - self._last_report < interval:
+            return False
+        self._last_report = now
+        if not self.count and not self.gaps:
+            return False
+        print(self.format(), flush=True)
+        return True
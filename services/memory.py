@@ -40,6 +40,19 @@ except Exception as e:
     print(f" [Memory] Failed to initialize Mem0: {e}")
     memory_client = None
 
+# Callbacks nach Schreibzugriffen auf paul_core (z.B. PromptAssembler lädt Core Memory neu)
+_core_change_listeners = []
+
+def on_core_change(callback):
+    _core_change_listeners.append(callback)
+
+def _notify_core_change():
+    for callback in _core_change_listeners:
+        try:
+            callback()
+        except Exception as e:
+            print(f" [Memory] Core change listener error: {e}")
+
 # --- HYBRID RETRIEVAL ---
 def get_hybrid_context(query_text=None):
     """
@@ -130,6 +143,7 @@ def dream():
             # Mem0 nutzt LLMs im Hintergrund, um zu entscheiden, 
             # ob alte Gewohnheiten überschrieben oder neue hinzugefügt werden.
             memory_client.add(f"Aktuelle Routinen und Gewohnheiten: {habits_summary}", user_id="paul_core")
+            _notify_core_change()
             print(" [Memory] ✅ Core Memory erfolgreich aktualisiert.")
             
     except Exception as e:
@@ -148,6 +162,7 @@ def save_memory_tool(text):
     try:
         # Synchrone Speicherung in die Core Memories
         memory_client.add(text, user_id="paul_core")
+        _notify_core_change()
         return f"Wichtiger Fakt notiert: '{text}'."
     except Exception as e:
         # Mem0 Bug workaround: If model hallucinates an ID, catch it gracefully
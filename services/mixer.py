@@ -0,0 +1,288 @@
+# jarvis/services/mixer.py
+import threading
+import time
+import numpy as np
+import pyaudio
+
+from jarvis import config
+
+# Prioritäten: eine aktive Stimme duckt alle Stimmen mit niedrigerer Priorität
+PRIORITY_SFX = 0      # Thinking-Loop, Bestätigungstöne
+PRIORITY_SPEECH = 1   # Live Audio, TTS
+PRIORITY_ALARM = 2    # Wecker
+
+class Voice:
+    """
+    Eine Stimme im OutputMixer (24 kHz, 16 bit mono PCM).
+
+    write() hängt PCM an (mit `max_buffer_ms` blockierend wie ein PyAudio-Stream, sonst nie),
+    end() markiert das Ende (die Stimme verschwindet, sobald alles gespielt ist), stop()
+    verwirft sofort bzw. nach `fade_ms`. Eine `loop` Stimme wiederholt ihr PCM bis stop().
+    """
+    def __init__(self, mixer, name, priority, volume, loop=None, max_buffer_ms=None, persistent=False):
+        self.mixer = mixer
+        self.name = name
+        self.priority = priority
+        self.volume = volume
+        self.persistent = persistent  # bleibt registriert, auch wenn leer (Live)
+        self.max_bytes = int(mixer.rate * max_buffer_ms / 1000) * 2 if max_buffer_ms else None
+        self._buf = bytearray()
+        self._loop = np.frombuffer(loop, dtype=np.int16) if loop else None
+        self._loop_pos = 0
+        self._ended = False
+        self._stopping = False
+        self._fade = 1.0
+        self._fade_target = 1.0
+        self._fade_step = 1.0   # pro Sample
+        self._duck = 1.0
+        self.done = threading.Event()
+        self.audible_until = 0.0  # time.monotonic(), bis zu der das zuletzt gemischte Sample hörbar ist
+
+    # --- PRODUCER ---
+    def write(self, pcm):
+        with self.mixer._cond:
+            if self.done.is_set():
+                return
+            self._buf += pcm
+            self.mixer._cond.notify_all()
+            if self.max_bytes is not None:
+                while len(self._buf) > self.max_bytes and not self.done.is_set() and self.mixer._running:
+                    self.mixer._cond.wait(timeout=0.5)
+
+    def end(self):
+        with self.mixer._cond:
+            self._ended = True
+            if not self.is_active():
+                # Schon leer gespielt: sofort fertig, nicht erst auf den nächsten Block warten
+                self.mixer._remove(self)
+            self.mixer._cond.notify_all()
+
+    def discard(self):
+        """Verwirft Gepuffertes, die Stimme bleibt bestehen (Barge-In bei Live)."""
+        with self.mixer._cond:
+            self._buf.clear()
+            self.mixer._cond.notify_all()
+
+    def stop(self, fade_ms=0):
+        with self.mixer._cond:
+            if fade_ms and self.is_active():
+                self._stopping = True
+                self.fade_to(0.0, fade_ms)
+            else:
+                self.mixer._remove(self)
+            self.mixer._cond.notify_all()
+
+    def fade_to(self, level, fade_ms):
+        self._fade_target = level
+        self._fade_step = abs(level - self._fade) / max(1, self.mixer.rate * fade_ms / 1000)
+
+    # --- STATE ---
+    def is_active(self):
+        return bool(self._buf) or self._loop is not None
+
+    def buffered_seconds(self):
+        return len(self._buf) / 2 / self.mixer.rate
+
+    def get_output_latency(self):
+        """Wie PyAudio: Zeit vom Ende eines write() bis das Sample hörbar ist."""
+        return self.mixer.output_latency() + (self.max_bytes or 0) / 2 / self.mixer.rate
+
+    def wait(self, interrupt_check=None, poll=0.05, timeout=None):
+        """
+        Wartet bis die Stimme ausgespielt (und hörbar zu Ende) ist. True wenn interrupt_check() abgebrochen hat.
+        Nach `timeout` Sekunden wird die Stimme gestoppt und nicht weiter gewartet.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done.wait(poll):
+            if interrupt_check and interrupt_check():
+                self.stop()
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                print(f" [Mixer] Voice '{self.name}' did not finish within {timeout:.1f}s, stopping", flush=True)
+                self.stop()
+                return False
+        while time.monotonic() < self.audible_until:
+            if interrupt_check and interrupt_check():
+                return True
+            time.sleep(min(poll, max(0.0, self.audible_until - time.monotonic())))
+        return False
+
+    # --- MIXER THREAD (unter mixer._cond) ---
+    def _pull(self, n):
+        """n Samples als float32 (mit Stille aufgefüllt)."""
+        if self._loop is not None:
+            idx = (self._loop_pos + np.arange(n)) % len(self._loop)
+            self._loop_pos = (self._loop_pos + n) % len(self._loop)
+            return self._loop[idx].astype(np.float32)
+        take = min(len(self._buf), n * 2) & ~1
+        out = np.zeros(n, dtype=np.float32)
+        if take:
+            out[:take // 2] = np.frombuffer(bytes(self._buf[:take]), dtype=np.int16)
+            del self._buf[:take]
+        return out
+
+    def _gain_ramp(self, n, duck_target, duck_step):
+        start = self.volume * self._fade * self._duck
+        if self._fade < self._fade_target:
+            self._fade = min(self._fade_target, self._fade + self._fade_step * n)
+        elif self._fade > self._fade_target:
+            self._fade = max(self._fade_target, self._fade - self._fade_step * n)
+        if self._duck < duck_target:
+            self._duck = min(duck_target, self._duck + duck_step * n)
+        elif self._duck > duck_target:
+            self._duck = max(duck_target, self._duck - duck_step * n)
+        end = self.volume * self._fade * self._duck
+        return start if start == end else np.linspace(start, end, n, dtype=np.float32)
+
+class OutputMixer:
+    """
+    Ein langlebiger Ausgabe-Stream für alles, was Jarvis abspielt (SFX, TTS, Live Audio).
+
+    Das Gerät wird einmal in start() geöffnet. Ein Thread mischt alle aktiven Stimmen
+    in Blöcken von MIXER_BLOCK_MS und schreibt sie blockierend ins Gerät (das gibt den
+    Takt vor). Ohne aktive Stimme wartet der Thread, es wird nichts geschrieben.
+
+    Ducking: spielt eine Stimme höherer Priorität, werden die anderen auf
+    MIXER_DUCK_GAIN abgesenkt (Rampe von MIXER_DUCK_MS, kein Knacken).
+    Die optionale EchoReference bekommt den fertig gemischten Block direkt vor dem
+    Schreiben, der Echo Canceller sieht also auch SFX und TTS.
+    """
+    def __init__(self, rate=24000, block_ms=None, duck_gain=None, duck_ms=None):
+        self.rate = rate
+        self.block = int(rate * (block_ms or config.MIXER_BLOCK_MS) / 1000)
+        self.duck_gain = config.MIXER_DUCK_GAIN if duck_gain is None else duck_gain
+        self.duck_step = 1.0 / max(1, rate * (config.MIXER_DUCK_MS if duck_ms is None else duck_ms) / 1000)
+        self.reference = None
+        self._voices = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._pa = None
+        self._stream = None
+        self._latency = 0.0
+        self._start_lock = threading.Lock()
+        self.blocks = 0
+        self.clipped = 0
+
+    # --- LIFECYCLE ---
+    def start(self):
+        """Öffnet das Ausgabegerät (einmalig) und startet den Misch-Thread."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._pa = pyaudio.PyAudio()
+            self._stream = self._pa.open(format=pyaudio.paInt16, channels=1, rate=self.rate, output=True,
+                                         frames_per_buffer=self.block)
+            try:
+                self._latency = self._stream.get_output_latency()
+            except Exception:
+                self._latency = 0.0
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="mixer", daemon=True)
+            self._thread.start()
+            print(f" [Mixer] Output open ({self.rate} Hz, {self.block * 1000 // self.rate} ms blocks, "
+                  f"{self._latency * 1000:.0f} ms device latency)", flush=True)
+
+    def output_latency(self):
+        """Gerät + ein Block im Mischer."""
+        return self._latency + self.block / self.rate
+
+    # --- VOICES ---
+    def open_voice(self, name, priority=PRIORITY_SPEECH, volume=1.0, max_buffer_ms=None, persistent=False):
+        """Neue (leere) Stimme für gestreamtes PCM."""
+        self.start()
+        voice = Voice(self, name, priority, volume, max_buffer_ms=max_buffer_ms, persistent=persistent)
+        with self._cond:
+            self._voices.append(voice)
+        return voice
+
+    def play(self, pcm, name="sfx", priority=PRIORITY_SFX, volume=1.0, loop=False, fade_ms=0):
+        """Spielt fertiges PCM (Feuer & Vergessen). Gibt die Voice zurück (wait()/stop())."""
+        self.start()
+        voice = Voice(self, name, priority, volume, loop=pcm if loop else None)
+        if fade_ms:
+            voice._fade = 0.0
+            voice.fade_to(1.0, fade_ms)
+        with self._cond:
+            if not loop:
+                if not pcm:
+                    voice.done.set()
+                    return voice
+                voice._buf += pcm
+                voice._ended = True
+            self._voices.append(voice)
+            self._cond.notify_all()
+        return voice
+
+    def stop_all(self, below_priority=None):
+        """Sofortiger Stopp aller Stimmen (bzw. aller unter `below_priority`), persistente werden nur geleert."""
+        with self._cond:
+            for voice in list(self._voices):
+                if below_priority is not None and voice.priority >= below_priority:
+                    continue
+                if voice.persistent:
+                    voice._buf.clear()
+                else:
+                    self._remove(voice)
+            self._cond.notify_all()
+
+    def _remove(self, voice):
+        if voice in self._voices:
+            self._voices.remove(voice)
+        voice._buf.clear()
+        voice._loop = None
+        voice.done.set()
+
+    def _reap(self):
+        """Entfernt beendete, leere Stimmen und fertig ausgeblendete (setzt done)."""
+        for v in list(self._voices):
+            if v._stopping and (v._fade <= 0.0 or not v.is_active()):
+                self._remove(v)
+            elif v._ended and not v.is_active():
+                self._remove(v)
+
+    # --- MIXER THREAD ---
+    def _mix(self):
+        """Mischt einen Block (unter self._cond). (block, stimmen) oder (None, []), wenn keine Stimme aktiv ist."""
+        # Auch ohne aktive Stimme aufräumen: end() auf eine leere Stimme muss done setzen
+        self._reap()
+        active = [v for v in self._voices if v.is_active()]
+        if not active:
+            return None, []
+        # Vorläufig (done kann gleich gesetzt werden): nach dem Schreiben wird genau nachgetragen
+        audible = time.monotonic() + self.output_latency() + self.block / self.rate
+        top = max(v.priority for v in active)
+        out = np.zeros(self.block, dtype=np.float32)
+        for v in active:
+            duck = self.duck_gain if v.priority < top else 1.0
+            out += v._pull(self.block) * v._gain_ramp(self.block, duck, self.duck_step)
+            v.audible_until = audible
+        self._reap()
+        if np.abs(out).max() > 32767:
+            self.clipped += 1
+        return np.clip(out, -32768, 32767).astype(np.int16).tobytes(), active
+
+    def _run(self):
+        while True:
+            with self._cond:
+                block, voices = self._mix()
+                while block is None and self._running:
+                    self._cond.wait(timeout=0.5)
+                    block, voices = self._mix()
+                if not self._running:
+                    return
+                # Schreiber mit max_buffer_ms warten auf Platz
+                self._cond.notify_all()
+            if self.reference is not None:
+                self.reference.push(block)
+            try:
+                self._stream.write(block)
+            except Exception as e:
+                print(f" [Mixer] Write error: {e}", flush=True)
+                time.sleep(self.block / self.rate)
+            audible = time.monotonic() + self._latency
+            for v in voices:
+                v.audible_until = audible
+            self.blocks += 1
+
+mixer = OutputMixer()
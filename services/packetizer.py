@@ -0,0 +1,39 @@
+# jarvis/services/packetizer.py
+
+class Packetizer:
+    """
+    Schneidet den Uplink-Strom (beliebig große PCM-Stücke) in Pakete fester Dauer
+    für send_realtime_input. Der Rest wartet auf das nächste Stück; flush() gibt ihn
+    an Turn-Grenzen (activity_end, audio_stream_end, Session-Ende) als kürzeres Paket aus.
+    """
+    def __init__(self, packet_ms, rate=16000, sample_bytes=2):
+        self.packet_bytes = max(sample_bytes, int(rate * packet_ms / 1000) * sample_bytes)
+        self._buf = bytearray()
+        self.packets = 0
+        self.partial = 0
+
+    def push(self, chunks):
+        """Nimmt eine Liste von PCM-Stücken, gibt alle jetzt vollen Pakete (bytes) zurück."""
+        for chunk in chunks:
+            self._buf += chunk
+        n = len(self._buf) // self.packet_bytes
+        if not n:
+            return []
+        size = self.packet_bytes
+        packets = [bytes(self._buf[i * size:(i + 1) * size]) for i in range(n)]
+        del self._buf[:n * size]
+        self.packets += n
+        return packets
+
+    def flush(self):
+        """Gibt den Rest als (kürzeres) Paket zurück, oder None wenn nichts gepuffert ist."""
+        if not self._buf:
+            return None
+        packet = bytes(self._buf)
+        self._buf.clear()
+        self.packets += 1
+        self.partial += 1
+        return packet
+
+    def pending_bytes(self):
+        return len(self._buf)
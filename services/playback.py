@@ -0,0 +1,180 @@
+# jarvis/services/playback.py
+import threading
+import time
+
+class PlaybackEngine:
+    """
+    Eigener Wiedergabe-Thread für das Live-Audio (24 kHz, 16 bit mono).
+
+    write() legt PCM nur in einen begrenzten Jitter-Puffer (nie blockierend), der
+    Thread schreibt ihn in festen Stücken (`chunk_ms`) blockierend in den Stream
+    (PyAudio Stream oder eine Voice des OutputMixers). Damit hängt die Wiedergabe
+    nicht mehr am Default-Threadpool, den auch Tools und das Slow Brain benutzen.
+
+    - Prefill: eine Antwort startet erst mit `prefill_ms` Vorrat (oder wenn ihr Ende
+      schon da ist), danach wird lückenlos gespielt.
+    - end_turn() markiert das Ende einer Antwort. Läuft der Puffer vorher leer, ist
+      das ein Underrun (gezählt, danach wieder Prefill).
+    - flush() verwirft sofort alles Ungespielte (Barge-In), auch den Puffer des Streams,
+      falls er discard() hat.
+    - is_playing()/last_end_time() kommen aus der echten Wiedergabeposition:
+      geschriebene Samples + Ausgabe-Latenz des Geräts.
+
+    Optional wird jedes Stück direkt vor dem Schreiben an die EchoReference gegeben.
+    """
+    def __init__(self, stream, rate=24000, chunk_ms=40, prefill_ms=120, max_seconds=60,
+                 latency=0.0, reference=None, on_drained=None):
+        self.stream = stream
+        self.rate = rate
+        self.chunk_bytes = int(rate * chunk_ms / 1000) * 2
+        self.prefill_bytes = int(rate * prefill_ms / 1000) * 2
+        self.max_bytes = int(rate * max_seconds) * 2
+        self.latency = latency
+        self.reference = reference
+        self.on_drained = on_drained
+
+        self._buf = bytearray()
+        self._cond = threading.Condition()
+        self._queued = 0        # Bytes jemals in den Puffer gelegt
+        self._consumed = 0      # Bytes jemals aus dem Puffer genommen (gespielt oder verworfen)
+        self._end_mark = 0      # _queued beim letzten end_turn()
+        self._started = False   # Prefill erreicht, es wird gespielt
+        self._writing = False   # Thread steckt gerade in stream.write()
+        self._play_end = 0.0    # time.monotonic(), zu der das zuletzt geschriebene Sample hörbar zu Ende ist
+        self._running = False
+        self._thread = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.underruns = 0
+        self.overflows = 0
+        self.flushes = 0
+        self.played_bytes = 0
+        self.flushed_bytes = 0
+        self.max_buffered = 0
+
+    # --- LIFECYCLE ---
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    # --- PRODUCER (Receive Loop) ---
+    def write(self, pcm):
+        """Legt PCM in den Puffer. False (und verworfen), wenn der Puffer voll ist."""
+        with self._cond:
+            if len(self._buf) + len(pcm) > self.max_bytes:
+                self.overflows += 1
+                return False
+            self._buf += pcm
+            self._queued += len(pcm)
+            self.max_buffered = max(self.max_buffered, len(self._buf))
+            self._cond.notify()
+        return True
+
+    def end_turn(self):
+        """Alles bisher Geschriebene gehört zu einer abgeschlossenen Antwort (ausspielen ohne Prefill)."""
+        with self._cond:
+            self._end_mark = self._queued
+            self._cond.notify()
+
+    def flush(self):
+        """Verwirft alles Ungespielte sofort. Gibt die verworfene Dauer in ms zurück."""
+        with self._cond:
+            dropped = len(self._buf)
+            self._buf.clear()
+            self._consumed = self._end_mark = self._queued
+            self._started = False
+            self._play_end = min(self._play_end, time.monotonic())
+            if dropped:
+                self.flushes += 1
+                self.flushed_bytes += dropped
+        discard = getattr(self.stream, "discard", None)
+        if discard is not None:
+            discard()
+        if self.reference is not None:
+            self.reference.clear()
+        return dropped / 2 / self.rate * 1000
+
+    # --- STATE ---
+    def is_playing(self):
+        return bool(self._buf) or self._writing or time.monotonic() < self._play_end
+
+    def last_end_time(self):
+        """Ende der Wiedergabe als time.time() (liegt in der Zukunft, solange noch gespielt wird)."""
+        if not self._play_end:
+            return 0.0
+        return time.time() - (time.monotonic() - self._play_end)
+
+    def buffered_ms(self):
+        return len(self._buf) / 2 / self.rate * 1000
+
+    def stats(self, reset=False):
+        s = {
+            "played_s": self.played_bytes / 2 / self.rate,
+            "underruns": self.underruns,
+            "overflows": self.overflows,
+            "flushes": self.flushes,
+            "flushed_ms": self.flushed_bytes / 2 / self.rate * 1000,
+            "max_buffered_ms": self.max_buffered / 2 / self.rate * 1000,
+        }
+        if reset:
+            self._reset_stats()
+        return s
+
+    # --- PLAYBACK THREAD ---
+    def _next_chunk(self):
+        """Wartet (unter self._cond) bis etwas zu spielen ist. None beim Beenden."""
+        while self._running:
+            buffered = len(self._buf)
+            if buffered:
+                turn_end_pending = self._end_mark > self._consumed
+                if self._started or buffered >= self.prefill_bytes or turn_end_pending:
+                    self._started = True
+                    chunk = bytes(self._buf[:self.chunk_bytes])
+                    del self._buf[:len(chunk)]
+                    self._consumed += len(chunk)
+                    self._writing = True
+                    return chunk
+            self._cond.wait(timeout=0.5)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                chunk = self._next_chunk()
+            if chunk is None:
+                return
+            if self.reference is not None:
+                self.reference.push(chunk)
+            try:
+                self.stream.write(chunk)
+            except Exception as e:
+                print(f" [Playback] Write error: {e}", flush=True)
+                time.sleep(len(chunk) / 2 / self.rate)
+
+            drained = False
+            with self._cond:
+                # write() kehrt zurück, sobald das Stück im Gerätepuffer liegt: hörbar bis jetzt + Latenz
+                self._play_end = time.monotonic() + self.latency
+                self._writing = False
+                self.played_bytes += len(chunk)
+                if not self._buf and self._started:
+                    self._started = False
+                    if self._end_mark >= self._queued:
+                        # end_turn() kam nach dem letzten write(): Antwort komplett ausgespielt
+                        drained = True
+                    else:
+                        # Antwort läuft noch, aber es kam nicht genug nach
+                        self.underruns += 1
+            if drained and self.on_drained:
+                try:
+                    self.on_drained()
+                except Exception as e:
+                    print(f" [Playback] on_drained error: {e}", flush=True)
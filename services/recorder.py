@@ -0,0 +1,176 @@
+# jarvis/services/recorder.py
+import mmap
+import os
+import time
+import numpy as np
+
+# Aufnahme-Format (zwei Dateien mit gemeinsamem Präfix):
+#   <pfad>.pcm  rohe 16 bit Mono Frames, lückenlos hintereinander (frame_bytes pro Frame)
+#   <pfad>.ts   float64 Capture-Zeitstempel pro Frame (time.monotonic() des audio_worker)
+# Beides ist per mmap beschrieben/gelesen: kein write() pro Frame im Capture-Loop,
+# und die Replay-Quelle liefert Frames direkt aus dem Page Cache.
+
+def _paths(path):
+    if path.endswith(".pcm"):
+        path = path[:-4]
+    elif path.endswith(".ts"):
+        path = path[:-3]
+    return path + ".pcm", path + ".ts"
+
+class FrameRecorder:
+    """
+    Schreibt jeden Capture-Frame (plus Zeitstempel) in eine memory-mapped Datei.
+    Die Dateien werden für `max_seconds` vorab angelegt (sparse) und beim close()
+    auf die tatsächliche Länge gekürzt. Ist das Maximum erreicht, wird nicht
+    weiter aufgenommen (der Capture-Loop läuft normal weiter).
+    """
+    def __init__(self, path, frame_bytes, max_seconds=600, rate=16000):
+        self.frame_bytes = frame_bytes
+        self.capacity = max(1, int(max_seconds * rate / (frame_bytes // 2)))
+        self.count = 0
+        self.pcm_path, self.ts_path = _paths(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.pcm_path)), exist_ok=True)
+        self._pcm_file = open(self.pcm_path, "w+b")
+        self._ts_file = open(self.ts_path, "w+b")
+        self._pcm_file.truncate(self.capacity * frame_bytes)
+        self._ts_file.truncate(self.capacity * 8)
+        self._pcm = mmap.mmap(self._pcm_file.fileno(), 0)
+        self._ts_map = mmap.mmap(self._ts_file.fileno(), 0)
+        self._ts = np.frombuffer(self._ts_map, dtype=np.float64)
+        self._full_reported = False
+
+    def write(self, pcm, timestamp):
+        if self.count >= self.capacity:
+            if not self._full_reported:
+                self._full_reported = True
+                print(f" [Recorder] Maximale Länge erreicht ({self.count} Frames), Aufnahme gestoppt.")
+            return False
+        off = self.count * self.frame_bytes
+        self._pcm[off:off + self.frame_bytes] = pcm
+        self._ts[self.count] = timestamp
+        self.count += 1
+        return True
+
+    def close(self):
+        if self._pcm is None:
+            return
+        self._ts = None  # numpy View freigeben, sonst lässt sich die mmap nicht schließen
+        self._pcm.flush(); self._pcm.close()
+        self._ts_map.flush(); self._ts_map.close()
+        self._pcm = None
+        self._pcm_file.truncate(self.count * self.frame_bytes); self._pcm_file.close()
+        self._ts_file.truncate(self.count * 8); self._ts_file.close()
+        seconds = self.count * (self.frame_bytes // 2) / 16000
+        print(f" [Recorder] {self.count} Frames ({seconds:.1f} s) -> {self.pcm_path}")
+
+class FrameReplay:
+    """
+    Spielt eine Aufnahme als Frame-Quelle ab, mit derselben Schnittstelle wie der
+    Capture-Pfad im audio_worker (read_frames() -> Liste von PCM Frames).
+
+    - speed: 1.0 = Echtzeit (Abstände der Original-Zeitstempel), 4.0 = viermal so
+      schnell, 0 = so schnell wie möglich.
+    - loop: am Ende wieder von vorn. Sonst kommt danach Stille im Frame-Takt,
+      damit Watchdog und Pegel-Events weiterlaufen wie bei einem echten Mikrofon.
+    """
+    def __init__(self, path, frame_length, speed=1.0, loop=False, rate=16000):
+        self.frame_length = frame_length
+        self.frame_bytes = frame_length * 2
+        self.speed = speed
+        self.loop = loop
+        self.frame_s = frame_length / rate
+        self.pcm_path, self.ts_path = _paths(path)
+        with open(self.pcm_path, "rb") as f:
+            self._pcm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._ts = np.fromfile(self.ts_path, dtype=np.float64)
+        except FileNotFoundError:
+            self._ts = None
+        self.total = len(self._pcm) // self.frame_bytes
+        if self._ts is not None:
+            # Wurde der Recorder nicht sauber geschlossen (Prozess gekillt), ist der Rest der
+            # vorab angelegten Datei leer: Zeitstempel 0 markiert das Ende
+            valid = np.flatnonzero(self._ts)
+            self.total = min(self.total, int(valid[-1]) + 1 if valid.size else 0)
+        if self._ts is None or len(self._ts) < self.total:
+            # Ohne Zeitstempel: gleichmäßiger Frame-Takt
+            self._ts = np.arange(self.total) * self.frame_s
+        self.index = 0
+        self.finished = False
+        self._silence = bytes(self.frame_bytes)
+        self._t0 = None
+        self._rec_t0 = 0.0
+
+    def _pace(self, rec_ts):
+        if self._t0 is None:
+            self._t0, self._rec_t0 = time.monotonic(), rec_ts
+            return
+        if self.speed <= 0:
+            return
+        delay = self._t0 + (rec_ts - self._rec_t0) / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def read_frames(self):
+        if self.index >= self.total:
+            if self.loop and self.total:
+                self.index = 0
+                self._t0 = None
+            else:
+                if not self.finished:
+                    self.finished = True
+                    print(f" [Replay] Ende der Aufnahme ({self.total} Frames), weiter mit Stille.")
+                time.sleep(self.frame_s / max(self.speed, 1.0) if self.speed > 0 else self.frame_s)
+                return [self._silence]
+
+        self._pace(float(self._ts[self.index]))
+        off = self.index * self.frame_bytes
+        pcm = self._pcm[off:off + self.frame_bytes]
+        self.index += 1
+        return [pcm]
+
+    def close(self):
+        self._pcm.close()
+
+# --- CLI ---
+# python3 -m jarvis.services.recorder info  <pfad>            Länge, Capture-Jitter, Pegel
+# python3 -m jarvis.services.recorder bench <pfad> [speed]    Replay in einen AudioRing, Durchsatz
+
+def _info(path, frame_length=512):
+    rp = FrameReplay(path, frame_length)
+    gaps = np.diff(rp._ts[:rp.total]) * 1000 if rp.total > 1 else np.zeros(1)
+    pcm = np.frombuffer(rp._pcm, dtype=np.int16)
+    rms = float(np.sqrt(np.mean(pcm.astype(np.float32) ** 2))) if pcm.size else 0.0
+    del pcm
+    print(f"{rp.pcm_path}: {rp.total} Frames, {rp.total * rp.frame_s:.1f} s, RMS {rms:.0f}")
+    print(f"  Frame-Abstand: mean {gaps.mean():.1f} ms | p99 {np.percentile(gaps, 99):.1f} ms | max {gaps.max():.1f} ms (Soll {rp.frame_s * 1000:.0f} ms)")
+    rp.close()
+
+def _bench(path, speed=0.0, frame_length=512):
+    from jarvis.services.audio_ring import AudioRing
+    rp = FrameReplay(path, frame_length, speed=speed)
+    ring = AudioRing(rp.frame_bytes, capacity=64)
+    ring.set_streaming(True)
+    start = time.perf_counter()
+    try:
+        while rp.index < rp.total:
+            for pcm in rp.read_frames():
+                ring.write(pcm)
+                ring.read_available()
+        elapsed = time.perf_counter() - start
+        audio_s = rp.total * rp.frame_s
+        print(f"Replay {rp.total} Frames ({audio_s:.1f} s Audio) in {elapsed:.2f} s -> {audio_s / max(elapsed, 1e-9):.1f}x Echtzeit (speed={speed})")
+        print(f"  Ring: {ring.stats()}")
+    finally:
+        rp.close()
+        ring.close(); ring.unlink()
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 3 or sys.argv[1] not in ("info", "bench"):
+        print("Usage: python3 -m jarvis.services.recorder info|bench <pfad> [speed]")
+        sys.exit(1)
+    if sys.argv[1] == "info":
+        _info(sys.argv[2])
+    else:
+        _bench(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
@@ -0,0 +1,150 @@
+# jarvis/services/resample.py
+import time
+import numpy as np
+
+def design_lowpass(factor, taps_per_phase=24, cutoff=0.9, beta=8.0):
+    """
+    Anti-Aliasing FIR für Dezimation um `factor` (Kaiser-gefensterter Sinc).
+    `cutoff` ist relativ zur neuen Nyquist-Frequenz (0.9 -> 7.2 kHz bei 48k -> 16k).
+    Länge = factor * taps_per_phase, damit jede Polyphase gleich lang ist.
+    """
+    taps = factor * taps_per_phase
+    n = np.arange(taps) - (taps - 1) / 2
+    fc = cutoff / factor  # normiert auf die Eingangs-Nyquist
+    h = fc * np.sinc(fc * n) * np.kaiser(taps, beta)
+    return (h / h.sum()).astype(np.float32)
+
+class PolyphaseDecimator:
+    """
+    Channel-Mixing + M:1 Dezimation für native Capture (z.B. PS3 Eye: 4 Kanäle, 48 kHz).
+
+    Polyphase: es wird nur jeder M-te Ausgangswert berechnet. Das Eingangssignal
+    (mit Filter-Historie) wird per Stride-View als Matrix (Ausgänge x Taps) gesehen,
+    die gesamte Filterung ist dann ein einziges Matrix-Vektor-Produkt (BLAS).
+    Der Zustand (Historie + Rest-Samples, die noch keinen vollen Schritt ergeben)
+    bleibt über Aufrufe erhalten, Blockgrenzen sind also beliebig.
+
+    frames() liefert exakt `frame_length` Samples lange 16 bit Frames (Porcupine).
+    """
+    def __init__(self, factor=3, channels=1, frame_length=512, taps_per_phase=24):
+        self.factor = factor
+        self.channels = channels
+        self.frame_length = frame_length
+        self._h = design_lowpass(factor, taps_per_phase)[::-1].copy()
+        self._hist = np.zeros(len(self._h) - 1, dtype=np.float32)
+        self._out = np.zeros(0, dtype=np.float32)
+
+    def process(self, pcm):
+        """Nimmt interleaved 16 bit PCM (`channels` Kanäle), gibt den dezimierten Mono-Block (float32) zurück."""
+        x = np.frombuffer(pcm, dtype=np.int16)
+        if self.channels > 1:
+            # Mischen wie die ALSA route ttable (alle Kanäle 1/N)
+            x = x[:len(x) - len(x) % self.channels].reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        else:
+            x = x.astype(np.float32)
+
+        buf = np.concatenate((self._hist, x))
+        L = len(self._h)
+        n_out = (len(buf) - L) // self.factor + 1 if len(buf) >= L else 0
+        if n_out <= 0:
+            self._hist = buf
+            return np.zeros(0, dtype=np.float32)
+
+        windows = np.lib.stride_tricks.sliding_window_view(buf, L)[::self.factor][:n_out]
+        y = windows @ self._h
+        # Historie: alles ab dem Start des nächsten Fensters
+        self._hist = buf[n_out * self.factor:]
+        return y
+
+    def frames(self, pcm):
+        """Dezimiert `pcm` und gibt alle jetzt vollständigen Frames (bytes, int16) zurück."""
+        y = self.process(pcm)
+        out = np.concatenate((self._out, y)) if self._out.size else y
+        count = len(out) // self.frame_length
+        result = []
+        if count:
+            pcm16 = np.clip(out[:count * self.frame_length], -32768, 32767).astype(np.int16)
+            result = [pcm16[i * self.frame_length:(i + 1) * self.frame_length].tobytes() for i in range(count)]
+        self._out = out[count * self.frame_length:]
+        return result
+
+# --- BENCHMARK ---
+# python3 -m jarvis.services.resample            Offline: CPU der Dezimation + Filterqualität
+# python3 -m jarvis.services.resample --alsa 10  Live: Prozess-CPU von ALSA plug (jarvis_mic) vs. nativ + Dezimation
+# Der ALSA plug/rate Resampler läuft im Client-Prozess (alsa-lib), daher ist
+# time.process_time() ein fairer Vergleich beider Pfade.
+
+def _tone_gain(dec, freq, rate=48000, seconds=1.0):
+    t = np.arange(int(rate * seconds)) / rate
+    x = (np.sin(2 * np.pi * freq * t) * 10000).astype(np.int16)
+    pcm = np.repeat(x, dec.channels).tobytes()
+    y = dec.process(pcm)[200:]
+    return 20 * np.log10(max(np.sqrt(np.mean(y ** 2)) / (10000 / np.sqrt(2)), 1e-9))
+
+def _benchmark_offline(seconds=10.0, channels=4, frame_length=512):
+    rate = 48000
+    rng = np.random.default_rng(0)
+    chunk = rng.normal(0, 2000, frame_length * 3 * channels).astype(np.int16).tobytes()
+    reads = int(seconds * rate / (frame_length * 3))
+
+    dec = PolyphaseDecimator(3, channels, frame_length)
+    start = time.process_time()
+    produced = 0
+    for _ in range(reads):
+        produced += len(dec.frames(chunk))
+    cpu = time.process_time() - start
+
+    print(f"Offline: {seconds:.0f} s Audio, {channels} Kanäle @ 48 kHz -> {produced} Frames x {frame_length} @ 16 kHz")
+    print(f"  Mixing + Dezimation: {cpu / seconds * 100:.2f}% CPU ({cpu / max(produced, 1) * 1e6:.1f} us/Frame), FIR {len(dec._h)} Taps")
+    for f in (1000, 6000, 7200, 9000, 12000):
+        print(f"  Ton {f:5d} Hz: {_tone_gain(PolyphaseDecimator(3, 1), f):7.1f} dB")
+
+def _benchmark_alsa(seconds=10.0, frame_length=512):
+    import pyaudio
+    from jarvis import config
+    pa = pyaudio.PyAudio()
+
+    def find(name):
+        for i in range(pa.get_device_count()):
+            if name in pa.get_device_info_by_index(i).get('name', ''):
+                return i
+        return None
+
+    def run(label, device, rate, channels, reader):
+        idx = find(device)
+        if idx is None:
+            print(f"  {label}: Gerät '{device}' nicht gefunden")
+            return
+        stream = pa.open(rate=rate, channels=channels, format=pyaudio.paInt16, input=True,
+                         input_device_index=idx, frames_per_buffer=frame_length * rate // config.RATE)
+        frames = 0
+        start_wall, start_cpu = time.monotonic(), time.process_time()
+        while time.monotonic() - start_wall < seconds:
+            frames += reader(stream)
+        cpu = time.process_time() - start_cpu
+        stream.close()
+        print(f"  {label}: {cpu / seconds * 100:.2f}% CPU ({frames} Frames)")
+
+    factor = config.CAPTURE_DEVICE_RATE // config.RATE
+    dec = PolyphaseDecimator(factor, config.CAPTURE_DEVICE_CHANNELS, frame_length)
+
+    def read_plug(stream):
+        stream.read(frame_length, exception_on_overflow=False)
+        return 1
+
+    def read_native(stream):
+        return len(dec.frames(stream.read(frame_length * factor, exception_on_overflow=False)))
+
+    print(f"ALSA: je {seconds:.0f} s Capture")
+    run("ALSA plug (jarvis_mic, 16 kHz mono)", "jarvis_mic", config.RATE, 1, read_plug)
+    run(f"Nativ ({config.CAPTURE_DEVICE}, {config.CAPTURE_DEVICE_RATE} Hz) + Dezimation", config.CAPTURE_DEVICE,
+        config.CAPTURE_DEVICE_RATE, config.CAPTURE_DEVICE_CHANNELS, read_native)
+    pa.terminate()
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv[1:]
+    if args and args[0] == "--alsa":
+        _benchmark_alsa(float(args[1]) if len(args) > 1 else 10.0)
+    else:
+        _benchmark_offline(float(args[0]) if args else 10.0)
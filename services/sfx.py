@@ -1,8 +1,9 @@
 # jarvis/services/sfx.py
 import os
-import time
 import pygame
 
+from jarvis.services.mixer import mixer, PRIORITY_SFX
+
 _initialized = False
 _sounds = {}
 _current_loop_channel = None
@@ -11,35 +12,41 @@ def init():
     global _initialized
     if _initialized: return
     try:
-        # Frequenz 24kHz passt gut zu Google TTS (Journey Voice)
-        # buffer=2048 reduziert CPU Last, erhöht Latenz minimal (unhörbar für TTS)
-        pygame.mixer.init(frequency=24000, size=-16, channels=1, buffer=2048)
+        # Pygame dekodiert nur noch (OGG/WAV -> 24 kHz mono PCM), abgespielt wird über den OutputMixer.
+        # Dummy-Treiber: pygame öffnet kein eigenes Ausgabegerät
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        pygame.mixer.init(frequency=mixer.rate, size=-16, channels=1)
+        print(" [SFX] Pygame decoder initialized.")
+        # Gemeinsamer Ausgabe-Stream: ohne Gerät läuft Jarvis weiter, nur ohne Sound
+        mixer.start()
         _initialized = True
-        print(" [SFX] Pygame Mixer initialized.")
     except Exception as e:
         print(f" [SFX Error] Init failed: {e}")
 
-def get_sound(path_or_key, volume=0.9):
+def _decode(path):
     if not _initialized: init()
-    s = None
-    if path_or_key in _sounds:
-        s = _sounds[path_or_key]
-    elif os.path.exists(path_or_key):
+    if not _initialized:
+        return None
+    if os.path.exists(path):
         try:
-            s = pygame.mixer.Sound(path_or_key)
-            _sounds[path_or_key] = s
+            return pygame.mixer.Sound(path).get_raw()
         except Exception as e:
             print(f" [SFX Error] Load failed: {e}")
-            return None
+    return None
 
-    if s:
-        s.set_volume(volume)
-    return s
+def get_sound(path_or_key):
+    """PCM (bytes) eines Sounds, dekodiert und gecacht."""
+    if path_or_key not in _sounds:
+        pcm = _decode(path_or_key)
+        if pcm is None:
+            return None
+        _sounds[path_or_key] = pcm
+    return _sounds[path_or_key]
 
 def play(path_or_key, volume=0.9):
     """Spielt Sound asynchron (Feuer & Vergessen)."""
-    s = get_sound(path_or_key, volume=volume)
-    if s: s.play()
+    pcm = get_sound(path_or_key)
+    if pcm: mixer.play(pcm, name="sfx", priority=PRIORITY_SFX, volume=volume)
 
 def play_blocking(path_or_key, interrupt_check=None, volume=0.9):
     """
@@ -47,39 +54,27 @@ def play_blocking(path_or_key, interrupt_check=None, volume=0.9):
     interrupt_check: Eine Funktion, die True zurückgibt, wenn abgebrochen werden soll.
     Rückgabe: True wenn unterbrochen wurde, sonst False.
     """
-    if not _initialized: init()
-    
-    was_interrupted = False
-
-    if os.path.exists(path_or_key):
-        try:
-            s = pygame.mixer.Sound(path_or_key)
-            s.set_volume(volume) 
-            channel = s.play()
-            
-            # Warten bis fertig ODER Unterbrechung
-            while channel and channel.get_busy():
-                # Prüfen ob unterbrochen werden soll
-                if interrupt_check and interrupt_check():
-                    channel.stop()
-                    was_interrupted = True
-                    break
-                
-                time.sleep(0.05) # Kleines Sleep gegen 100% CPU
-        except Exception as e:
-            print(f" [SFX Error] Play blocking failed: {e}")
-            
-    return was_interrupted
+    # Nicht gecacht: TTS-Fallbacks überschreiben dieselbe Temp-Datei
+    pcm = _decode(path_or_key)
+    if not pcm:
+        return False
+    try:
+        voice = mixer.play(pcm, name="sfx", priority=PRIORITY_SFX, volume=volume)
+        # Warten bis fertig ODER Unterbrechung
+        return voice.wait(interrupt_check)
+    except Exception as e:
+        print(f" [SFX Error] Play blocking failed: {e}")
+    return False
 
-def play_loop(path_or_key, volume=0.9):
+def play_loop(path_or_key, volume=0.9, priority=PRIORITY_SFX):
     global _current_loop_channel
     stop_loop()
-    s = get_sound(path_or_key, volume=volume)
-    if s:
-        _current_loop_channel = s.play(loops=-1, fade_ms=200)
+    pcm = get_sound(path_or_key)
+    if pcm:
+        _current_loop_channel = mixer.play(pcm, name="loop", priority=priority, volume=volume, loop=True, fade_ms=200)
 
 def stop_loop():
     global _current_loop_channel
     if _current_loop_channel:
-        _current_loop_channel.fadeout(300)
-        _current_loop_channel = None
\ No newline at end of file
+        _current_loop_channel.stop(fade_ms=300)
+        _current_loop_channel = None
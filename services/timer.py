@@ -5,6 +5,7 @@ import os
 import datetime
 from jarvis import state, config
 from jarvis.services import sfx
+from jarvis.services.mixer import PRIORITY_ALARM
 
 def play_alarm_sound():
     if state.ALARM_PROCESS: return
@@ -18,7 +19,7 @@ def play_alarm_sound():
     state.ALARM_TIMEOUT_TIMER = threading.Timer(config.ALARM_TIMEOUT, stop_alarm_sound)
     state.ALARM_TIMEOUT_TIMER.start()
 
-    sfx.play_loop(config.ALARM_SOUND)
+    sfx.play_loop(config.ALARM_SOUND, priority=PRIORITY_ALARM)
 
 def stop_alarm_sound():
     if state.ALARM_TIMEOUT_TIMER:
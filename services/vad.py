@@ -0,0 +1,164 @@
+# jarvis/services/vad.py
+from collections import deque
+from jarvis import config
+from jarvis.services.audio_features import AudioFeatures
+
+# --- DETECTORS ---
+# Ein Detektor bekommt genau einen Frame (16 bit PCM, mono) und sagt, ob darin Sprache ist.
+# Optional können schon berechnete FrameFeatures mitgegeben werden (spart die Rechnung).
+
+class EnergyVad:
+    """
+    Energie-Detektor mit adaptivem Rauschteppich (aus AudioFeatures).
+    Sprache = RMS liegt um `ratio` über dem Rauschteppich (und über `min_rms`).
+    """
+    def __init__(self, ratio=3.0, min_rms=300):
+        self.ratio = ratio
+        self.min_rms = min_rms
+        # Startwert knapp unter der Schwelle: der erste Frame (oft schon Sprache) hebt den Teppich nicht an
+        self.features = AudioFeatures(rise_gate=ratio, initial_floor=min_rms / ratio)
+
+    def is_speech(self, pcm, features=None):
+        f = features or self.features.process(pcm)
+        return f.rms > max(self.min_rms, f.noise_floor * self.ratio)
+
+    def delete(self):
+        pass
+
+class CobraVad:
+    """Picovoice Cobra (optional, braucht PICOVOICE_KEY). Frame-Länge muss 512 sein."""
+    def __init__(self, threshold=0.5):
+        import pvcobra
+        self.threshold = threshold
+        self._cobra = pvcobra.create(access_key=config.PICOVOICE_KEY)
+        self.frame_length = self._cobra.frame_length
+
+    def is_speech(self, pcm, features=None):
+        return self._cobra.process(memoryview(pcm).cast("h")) >= self.threshold
+
+    def delete(self):
+        self._cobra.delete()
+
+# --- GATE ---
+
+class VadGate:
+    """
+    Sitzt vor `send_realtime_input` und lässt nur Sprache (plus Rand) durch.
+
+    - prepad_ms: so viel Audio VOR dem Sprachbeginn wird nachgereicht (Anlaute)
+    - hangover_ms: so lange bleibt das Gate nach der letzten Sprache offen
+      (Pausen im Satz, und der Server braucht etwas Stille fürs Turn-Ende)
+    """
+    def __init__(self, detector, frame_ms, hangover_ms=800, prepad_ms=300):
+        self.detector = detector
+        self.hangover_frames = max(0, int(round(hangover_ms / frame_ms)))
+        self._prepad = deque(maxlen=max(0, int(round(prepad_ms / frame_ms))))
+        self._hangover_left = 0
+        self.is_open = False
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+
+    def process(self, pcm, is_speech=None):
+        """
+        Nimmt einen Frame. Gibt (frames_to_send, closed) zurück:
+        frames_to_send ist eine (ggf. leere) Liste, closed ist True, wenn das Gate
+        mit diesem Frame zugegangen ist (Zeit für `audio_stream_end`).
+        `is_speech` kann übergeben werden, wenn der Detektor schon gelaufen ist.
+        """
+        if is_speech is None:
+            is_speech = self.detector.is_speech(pcm)
+        if is_speech:
+            self._hangover_left = self.hangover_frames
+            if not self.is_open:
+                self.is_open = True
+                out = list(self._prepad)
+                out.append(pcm)
+                # Pre-Pad Frames wurden vorher als unterdrückt gezählt
+                self.frames_suppressed -= len(self._prepad)
+                self._prepad.clear()
+                self.frames_sent += len(out)
+                return out, False
+            self.frames_sent += 1
+            return [pcm], False
+
+        if self.is_open:
+            if self._hangover_left > 0:
+                self._hangover_left -= 1
+                self.frames_sent += 1
+                return [pcm], False
+            self.is_open = False
+            self._prepad.append(pcm)
+            self.frames_suppressed += 1
+            return [], True
+
+        self._prepad.append(pcm)
+        self.frames_suppressed += 1
+        return [], False
+
+    def stats(self):
+        total = self.frames_sent + self.frames_suppressed
+        ratio = (self.frames_suppressed / total * 100) if total else 0.0
+        return {"sent": self.frames_sent, "suppressed": self.frames_suppressed, "suppressed_pct": ratio}
+
+# --- ENDPOINTER ---
+
+class Endpointer:
+    """
+    Lokale Sprachanfang/-ende Erkennung für den Manual-Activity Modus der Live API.
+    Arbeitet auf den Entscheidungen eines Detektors (ein bool pro Frame).
+
+    - "start": `min_speech_ms` am Stück Sprache (Default: der erste Sprach-Frame,
+      damit activity_start vor dem Pre-Pad des VAD-Gates beim Server ist)
+    - "end": danach `silence_ms` am Stück keine Sprache.
+      `speech_end_time` ist dann der Capture-Zeitstempel des letzten Sprach-Frames,
+      also das tatsächliche Sprachende (nicht der Zeitpunkt der Entscheidung).
+    """
+    def __init__(self, frame_ms, silence_ms=700, min_speech_ms=0):
+        self.silence_frames = max(1, int(round(silence_ms / frame_ms)))
+        self.min_speech_frames = max(1, int(round(min_speech_ms / frame_ms)))
+        self.in_speech = False
+        self.speech_end_time = None
+        self._speech_run = 0
+        self._silence_run = 0
+
+    def update(self, is_speech, timestamp):
+        if is_speech:
+            self._silence_run = 0
+            self.speech_end_time = timestamp
+            if not self.in_speech:
+                self._speech_run += 1
+                if self._speech_run >= self.min_speech_frames:
+                    self.in_speech = True
+                    self._speech_run = 0
+                    return "start"
+            return None
+
+        self._speech_run = 0
+        if self.in_speech:
+            self._silence_run += 1
+            if self._silence_run >= self.silence_frames:
+                self.in_speech = False
+                self._silence_run = 0
+                return "end"
+        return None
+
+# --- FACTORIES ---
+
+def create_detector(engine=None):
+    """Baut den konfigurierten Detektor. Gibt None zurück, wenn VAD aus ist."""
+    engine = (engine or config.VAD_ENGINE or "off").lower()
+    if engine == "off":
+        return None
+
+    if engine == "cobra":
+        try:
+            return CobraVad(threshold=config.VAD_COBRA_THRESHOLD)
+        except Exception as e:
+            print(f" [VAD] Cobra nicht verfügbar ({e}), nutze Energie-VAD.")
+    return EnergyVad(ratio=config.VAD_ENERGY_RATIO, min_rms=config.VAD_MIN_RMS)
+
+def create_gate(frame_ms, detector):
+    """Baut das VAD-Gate um einen Detektor. Gibt None zurück, wenn es keinen Detektor gibt."""
+    if detector is None:
+        return None
+    return VadGate(detector, frame_ms, hangover_ms=config.VAD_HANGOVER_MS, prepad_ms=config.VAD_PREPAD_MS)
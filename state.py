@@ -1,11 +1,10 @@
 # jarvis/state.py
-import threading
-from collections import deque
 import time
+from jarvis.core.history import HistoryStore
 
-# Conversation History
-CONVERSATION_HISTORY = deque()
-HISTORY_LOCK = threading.Lock()
+# Conversation History (ein Store für Slow Brain und Fast Brain, siehe core/history.py)
+CONVERSATION_HISTORY = HistoryStore()
+HISTORY_LOCK = CONVERSATION_HISTORY.lock # reentrant
 
 # LED State
 LED_LOCKED = False
@@ -1,8 +1,19 @@
 # jarvis/utils.py
+import urllib.parse
 import requests
+from jarvis.core import trace
+
+class TracedSession(requests.Session):
+    """requests.Session, die jeden Request als "http" Span der laufenden Interaktion aufzeichnet (ohne Query, dort stehen Keys)."""
+    def request(self, method, url, *args, **kwargs):
+        parts = urllib.parse.urlsplit(url)
+        with trace.span("http", method=method, host=parts.netloc, path=parts.path) as s:
+            resp = super().request(method, url, *args, **kwargs)
+            s.set(status=resp.status_code)
+            return resp
 
 # Global Session for Connection Pooling
-session = requests.Session()
+session = TracedSession()
 adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10)
 session.mount('https://', adapter)
 session.mount('http://', adapter)
\ No newline at end of file